@@ -0,0 +1,184 @@
+"""
+API de consulta de agregados del dashboard (solo lectura)
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Expone los mismos números que los gráficos (agregar_datos_por_vista con la
+participación de mercado de calcular_participacion_mercado) para otras
+herramientas internas, con una URL estable por consulta:
+
+    GET /api/v1/agregados/<vista>?principio=X&principio=Y&organismo=Z
+        &concentracion=...&grupo=...&cenabast=con|sin|solo|ambos
+        &truncar_mes=1&formato=json|arrow
+
+- vista: anual, mensual o mensualizado
+- los filtros multi-valor se repiten en la query; el orden no importa
+- cenabast 'ambos' separa cada proveedor en CENABAST / No CENABAST
+- sin filtro de grupo, los proveedores fuera de los principales por ventas se
+  suman en "Otros", igual que en los gráficos (ver agregar_datos_por_vista)
+- formato json (por defecto): orientado a columnas
+      {"generacion": 3, "filas": 120, "columnas": [...], "datos": {"periodo": [...], ...}}
+- formato arrow: stream Arrow IPC (application/vnd.apache.arrow.stream)
+- precio es el precio ponderado por unidades; precio_x_unidades y registros
+  son sumables, así que los consumidores pueden reagrupar filas y recalcular
+  precio = precio_x_unidades / unidades sin perder exactitud
+
+Las respuestas llevan ETag derivado de la generación de los datos y de la
+consulta normalizada, con Cache-Control no-cache: los consumidores pueden
+consultar seguido y reciben 304 sin costo hasta que se recarguen los datos.
+Del lado del servidor los cuerpos quedan en una caché LRU y las consultas
+idénticas concurrentes comparten un solo cálculo; las consultas sin filtros
+salen de las tablas que el procesador precalcula al cargar los datos.
+"""
+
+import json
+import hashlib
+
+import numpy as np
+from flask import Response, jsonify, request
+
+from coalescencia import SingleFlight, CacheLRU
+from serializacion import TIPO_ARROW_STREAM, arrow_disponible, dataframe_a_arrow, etag_coincidente
+from utils import TOP_PROVEEDORES, filtrar_datos, agregar_datos_por_vista
+
+
+VISTAS = ('anual', 'mensual', 'mensualizado')
+OPCIONES_CENABAST = ('con', 'sin', 'solo', 'ambos')
+
+TIPOS_CONTENIDO = {
+    'json': 'application/json',
+    'arrow': TIPO_ARROW_STREAM
+}
+
+# Columnas de la respuesta, en orden (las demás son auxiliares de los gráficos)
+COLUMNAS_AGREGADOS = [
+    'periodo', 'año', 'mes', 'grupo_proveedor', 'es_cenabast',
+    'unidades', 'ventas', 'precio', 'precio_x_unidades', 'registros',
+    'total_unidades_periodo', 'total_ventas_periodo',
+    'participacion_unidades', 'participacion_ventas'
+]
+
+# Parámetro de la query -> argumento de filtrar_datos
+PARAMETROS_FILTRO = {
+    'principio': 'principios',
+    'organismo': 'organismos',
+    'concentracion': 'concentraciones',
+    'grupo': 'grupos'
+}
+
+RESPUESTAS = CacheLRU(128)
+calculos_en_curso = SingleFlight()
+
+
+def consulta_normalizada(vista):
+    """Consulta canónica (valores ordenados y sin duplicados) o un mensaje de error"""
+    if vista not in VISTAS:
+        return None, f"Vista no soportada: {vista} (opciones: {', '.join(VISTAS)})"
+
+    cenabast = request.args.get('cenabast', 'con')
+    if cenabast not in OPCIONES_CENABAST:
+        return None, f"Opción CENABAST no soportada: {cenabast} (opciones: {', '.join(OPCIONES_CENABAST)})"
+
+    formato = request.args.get('formato', 'json').lower()
+    if formato not in TIPOS_CONTENIDO:
+        return None, f"Formato no soportado: {formato} (opciones: json, arrow)"
+    if formato == 'arrow' and not arrow_disponible():
+        return None, "El formato arrow requiere pyarrow instalado en el servidor"
+
+    consulta = {
+        'vista': vista,
+        'cenabast': cenabast,
+        'truncar_mes': request.args.get('truncar_mes', '0').lower() in ('1', 'true', 'si', 'sí'),
+        'formato': formato
+    }
+    for parametro in PARAMETROS_FILTRO:
+        consulta[parametro] = tuple(sorted(set(v for v in request.args.getlist(parametro) if v)))
+    return consulta, None
+
+
+def consulta_sin_filtros(consulta):
+    """True si la consulta no filtra filas (solo elige vista y modo CENABAST)"""
+    return not consulta['truncar_mes'] and not any(consulta[parametro] for parametro in PARAMETROS_FILTRO)
+
+
+def calcular_agregados(df, consulta, base=None):
+    """DataFrame de agregados por período y proveedor con participación de mercado
+    
+    base es la tabla precalculada sin filtros de la vista y el modo (si la hay);
+    se usa tal cual cuando la consulta no filtra.
+    """
+    if base is not None and consulta_sin_filtros(consulta):
+        agregado = base
+    else:
+        filtros = {argumento: list(consulta[parametro]) for parametro, argumento in PARAMETROS_FILTRO.items()}
+        df_filtrado = filtrar_datos(df, cenabast=consulta['cenabast'],
+                                    opciones=['truncar_mes'] if consulta['truncar_mes'] else [], **filtros)
+        agregado = agregar_datos_por_vista(df_filtrado, consulta['vista'], consulta['cenabast'],
+                                           top_proveedores=0 if consulta['grupo'] else TOP_PROVEEDORES)
+    columnas = [c for c in COLUMNAS_AGREGADOS if c in agregado.columns]
+    return agregado[columnas].reset_index(drop=True)
+
+
+def serializar_json(agregado, generacion):
+    """JSON orientado a columnas (NaN -> null)"""
+    datos = {}
+    for columna in agregado.columns:
+        serie = agregado[columna]
+        valores = serie.astype(object).where(serie.notna(), None).tolist()
+        datos[columna] = [v.item() if isinstance(v, np.generic) else v for v in valores]
+    cuerpo = {
+        'generacion': generacion,
+        'filas': len(agregado),
+        'columnas': list(agregado.columns),
+        'datos': datos
+    }
+    return json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def serializar_arrow(agregado, generacion):
+    """Stream Arrow IPC con la generación de los datos en los metadatos del esquema"""
+    return dataframe_a_arrow(agregado, {'dashboard_generacion': generacion})
+
+
+def registrar_api_agregados(server, data_processor, ruta='/api/v1/agregados'):
+    """Registra la API de agregados: GET <ruta>/<vista>"""
+
+    def agregados(vista):
+        if not data_processor.is_ready() or data_processor.df is None:
+            return jsonify({'error': 'Los datos aún se están cargando'}), 503
+
+        consulta, error = consulta_normalizada(vista)
+        if error:
+            return jsonify({'error': error}), 400
+
+        generacion = data_processor.generacion
+        clave = (generacion,) + tuple(sorted(consulta.items()))
+        etag = hashlib.blake2b(repr(clave).encode('utf-8'), digest_size=12).hexdigest()
+
+        validador = etag_coincidente(request.if_none_match, etag)
+        if validador:
+            respuesta = Response(status=304)
+        else:
+            cuerpo = RESPUESTAS.obtener(clave)
+            if cuerpo is None:
+                serializar = serializar_arrow if consulta['formato'] == 'arrow' else serializar_json
+
+                def calcular():
+                    # La tabla sin filtros solo se pide si la consulta la usa (puede
+                    # requerir calcular una vista diferida)
+                    base = None
+                    if consulta_sin_filtros(consulta):
+                        base = data_processor.get_agregados_base(consulta['vista'], consulta['cenabast'])
+                    return serializar(calcular_agregados(data_processor.df, consulta, base), generacion)
+
+                cuerpo, _ = calculos_en_curso.ejecutar(clave, calcular, RESPUESTAS)
+            respuesta = Response(cuerpo, content_type=TIPOS_CONTENIDO[consulta['formato']])
+
+        # En un 304 va el validador tal como lo guardó el cliente (con sufijo de compresión)
+        respuesta.set_etag(validador or etag)
+        # Se puede guardar pero hay que revalidar: el ETag cambia al recargar los datos
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        respuesta.headers['X-Generacion-Datos'] = str(generacion)
+        return respuesta
+
+    server.add_url_rule(f'{ruta}/<vista>', 'api_agregados', agregados)
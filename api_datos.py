@@ -0,0 +1,155 @@
+"""
+API JSON de datos agregados para templates/index.html
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+En lugar de enviar los registros de licitaciones al navegador, el servidor
+responde con datos ya agregados por año y grupo proveedor a partir del resumen
+anual que arma el procesador al cargar los datos:
+
+    GET /data?principioActivo=X&organismo=Y&year=2024
+        [{"year": 2024, "proveedor": "...", "unidades": 10, "ventas": 100}, ...]
+    GET /data/opciones?principioActivo=X
+        {"principiosActivos": [...], "organismos": [...], "proveedores": [...]}
+    GET /data?principioActivo=X&formato=arrow
+        las mismas filas de /data como stream Arrow IPC (columnas year, proveedor,
+        unidades, ventas) para clientes Python/BI
+
+Los parámetros aceptan varios valores (repetidos o separados por coma); "Todos"
+equivale a no filtrar. Las respuestas llevan ETag derivado de la generación de
+los datos y de la consulta: un If-None-Match que coincide recibe 304 sin volver
+a calcular. La compresión la agrega flask-compress (ver serializacion.py).
+"""
+
+import json
+import hashlib
+
+from flask import Response, jsonify, render_template, request
+
+from coalescencia import CacheLRU
+from serializacion import TIPO_ARROW_STREAM, arrow_disponible, dataframe_a_arrow, etag_coincidente
+
+
+# Respuestas serializadas por consulta (incluyen la generación de datos en la clave)
+RESPUESTAS = CacheLRU(256)
+
+PARAMETROS = {
+    'principioActivo': 'principio_activo',
+    'organismo': 'organismo',
+    'year': 'año'
+}
+
+
+def _valores_parametro(nombre):
+    """Valores de un parámetro de la query, ordenados y sin 'Todos'"""
+    valores = []
+    for valor in request.args.getlist(nombre):
+        valores.extend(v.strip() for v in valor.split(',') if v.strip())
+    return tuple(sorted(set(v for v in valores if v != 'Todos')))
+
+
+def _filtros_consulta():
+    return {nombre: _valores_parametro(nombre) for nombre in PARAMETROS}
+
+
+def _filtrar_resumen(resumen, filtros):
+    """Aplica los filtros de la consulta sobre el resumen anual"""
+    mascara = None
+    for nombre, valores in filtros.items():
+        if not valores:
+            continue
+        columna = PARAMETROS[nombre]
+        if columna == 'año':
+            valores = [int(v) for v in valores if v.lstrip('-').isdigit()]
+        condicion = resumen[columna].isin(valores)
+        mascara = condicion if mascara is None else mascara & condicion
+    return resumen if mascara is None else resumen[mascara]
+
+
+def _tabla_agregada(resumen, filtros):
+    """Unidades y ventas por año y proveedor para los filtros (DataFrame)"""
+    filtrado = _filtrar_resumen(resumen, filtros)
+    agregado = (
+        filtrado.groupby(['año', 'grupo_proveedor'], observed=True)[['unidades', 'ventas']]
+        .sum()
+        .reset_index()
+        .rename(columns={'año': 'year', 'grupo_proveedor': 'proveedor'})
+    )
+    agregado['year'] = agregado['year'].astype(int)
+    agregado[['unidades', 'ventas']] = agregado[['unidades', 'ventas']].round(0).astype('int64')
+    return agregado
+
+
+def _datos_agregados(resumen, filtros):
+    """Registros de _tabla_agregada para la respuesta JSON"""
+    return _tabla_agregada(resumen, filtros).to_dict('records')
+
+
+def _opciones(resumen, filtros):
+    """Valores disponibles para los selectores de la página"""
+    principios = filtros.get('principioActivo')
+    organismos = resumen[resumen['principio_activo'].isin(principios)] if principios else resumen
+    return {
+        'principiosActivos': sorted(resumen['principio_activo'].dropna().unique().tolist()),
+        'organismos': sorted(organismos['organismo'].dropna().unique().tolist()),
+        'proveedores': sorted(resumen['grupo_proveedor'].dropna().unique().tolist())
+    }
+
+
+def _responder_con_etag(data_processor, recurso, construir, tipo='application/json'):
+    """Respuesta cacheada por consulta con ETag y validación If-None-Match
+
+    construir(resumen, filtros) devuelve un objeto serializable a JSON o, para
+    otros tipos de contenido, directamente los bytes del cuerpo.
+    """
+    filtros = _filtros_consulta()
+    clave = (recurso, data_processor.generacion, tuple(filtros.items()))
+    etag = hashlib.blake2b(repr(clave).encode('utf-8'), digest_size=12).hexdigest()
+
+    validador = etag_coincidente(request.if_none_match, etag)
+    if validador:
+        respuesta = Response(status=304)
+    else:
+        cuerpo = RESPUESTAS.obtener(clave)
+        if cuerpo is None:
+            resumen = data_processor.derived['resumen_anual']
+            cuerpo = construir(resumen, filtros)
+            if tipo == 'application/json':
+                cuerpo = json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':'))
+            RESPUESTAS.guardar(clave, cuerpo)
+        respuesta = Response(cuerpo, content_type=tipo)
+
+    # En un 304 va el validador tal como lo guardó el cliente (con sufijo de compresión)
+    respuesta.set_etag(validador or etag)
+    # El navegador puede guardar la respuesta pero debe revalidarla (cambia al recargar datos)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+
+def registrar_api_datos(server, data_processor, ruta='/data', ruta_pagina='/tablero'):
+    """Registra la API de datos agregados y la página templates/index.html"""
+
+    def no_disponible():
+        if data_processor.is_ready() and 'resumen_anual' in data_processor.derived:
+            return None
+        return jsonify({'error': 'Los datos aún se están cargando'}), 503
+
+    def datos():
+        if request.args.get('formato') == 'arrow':
+            if not arrow_disponible():
+                return jsonify({'error': 'El formato arrow requiere pyarrow instalado en el servidor'}), 400
+            return no_disponible() or _responder_con_etag(
+                data_processor, 'datos_arrow',
+                lambda resumen, filtros: dataframe_a_arrow(_tabla_agregada(resumen, filtros)),
+                TIPO_ARROW_STREAM)
+        return no_disponible() or _responder_con_etag(data_processor, 'datos', _datos_agregados)
+
+    def opciones():
+        return no_disponible() or _responder_con_etag(data_processor, 'opciones', _opciones)
+
+    def pagina():
+        return render_template('index.html')
+
+    server.add_url_rule(ruta, 'api_datos', datos)
+    server.add_url_rule(f'{ruta}/opciones', 'api_datos_opciones', opciones)
+    server.add_url_rule(ruta_pagina, 'pagina_tablero', pagina)
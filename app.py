@@ -10,29 +10,53 @@ Características principales:
 - 6 gráficos: 3 básicos + 3 separados por CENABAST cuando se selecciona "Con y Sin"
 """
 
+import time
 import dash
-from dash import dcc, html
+from dash import dcc, html, dash_table
+from flask import jsonify, request
 import warnings
 warnings.filterwarnings('ignore')
 
 # Importar módulos locales
 from data_processor import OptimizedDataProcessor
-from callbacks import register_callbacks
+from callbacks import register_callbacks, estilos_sidebar
+from metrics import instrumentar_callbacks, registrar_endpoint_metricas
+from profiler import instrumentar_perfilado, registrar_pagina_perfiles
+from serializacion import configurar_serializacion
+from api_datos import registrar_api_datos
+from api_agregados import registrar_api_agregados
+from exportacion import registrar_exportacion
+from detalle import columnas_tabla, FILAS_POR_PAGINA
 from utils import CORPORATE_COLORS
 
+# Inicio del proceso para medir el tiempo hasta el primer request
+t_inicio_proceso = time.time()
+
 # Configuración de la aplicación
 app = dash.Dash(__name__)
 app.title = "Dashboard Mercado Farmacéutico - Final"
 
-# Inicializar procesador de datos
+# JSON rápido (orjson) y compresión gzip/brotli de las respuestas
+configurar_serializacion(app)
+
+# Inicializar procesador de datos; la carga corre en segundo plano para que el
+# servidor acepte conexiones de inmediato
 data_processor = OptimizedDataProcessor()
-data_processor.load_data()
+data_processor.load_data_async()
 
 # Layout corporativo del dashboard con sidebar colapsable
 app.layout = html.Div([
     
     # Store para manejar estado del sidebar
     dcc.Store(id='sidebar-state', data={'collapsed': False}),
+    dcc.Store(id='sidebar-estilos', data=estilos_sidebar()),
+    
+    # Estado de la carga de datos en segundo plano
+    dcc.Store(id='estado-carga'),
+    dcc.Interval(id='intervalo-carga', interval=1000),
+    
+    # Firmas de las figuras que tiene el navegador (para actualizaciones parciales)
+    dcc.Store(id='firma-graficos'),
     
     # Contenedor principal con estilo corporativo
     html.Div([
@@ -206,6 +230,38 @@ app.layout = html.Div([
                         style={'marginBottom': '20px', 'fontSize': '12px'},
                         labelStyle={'display': 'block', 'marginBottom': '5px'}
                     )
+                ]),
+                
+                # Rango de fechas para los totales del período (no recalcula los gráficos)
+                html.Div([
+                    html.Label("Rango de Fechas (Totales)", style={
+                        'fontWeight': 'bold', 'marginBottom': '10px', 'display': 'block',
+                        'color': CORPORATE_COLORS['dark_blue'], 'fontSize': '13px'
+                    }),
+                    dcc.RangeSlider(
+                        id='filtro-rango-fechas',
+                        min=0, max=1, step=1, value=[0, 1],
+                        marks=None, allowCross=False,
+                        tooltip={'placement': 'bottom', 'transform': 'etiquetaMes'},
+                        disabled=True
+                    )
+                ], style={'marginBottom': '10px'}),
+                
+                # Separador
+                html.Hr(style={'border': f'1px solid {CORPORATE_COLORS["warm_gray"]}', 'margin': '20px 0'}),
+                
+                # Exportación de las filas filtradas (el href se arma en el navegador)
+                html.Div([
+                    html.Label("Exportar Datos Filtrados", style={
+                        'fontWeight': 'bold', 'marginBottom': '10px', 'display': 'block',
+                        'color': CORPORATE_COLORS['dark_blue'], 'fontSize': '13px'
+                    }),
+                    html.A("CSV", id='exportar-csv', href='/exportar?formato=csv', style={
+                        'marginRight': '15px', 'fontSize': '12px', 'color': CORPORATE_COLORS['primary_blue']
+                    }),
+                    html.A("Excel (XLSX)", id='exportar-xlsx', href='/exportar?formato=xlsx', style={
+                        'fontSize': '12px', 'color': CORPORATE_COLORS['primary_blue']
+                    })
                 ])
                 
             ], id='sidebar', style={
@@ -227,6 +283,12 @@ app.layout = html.Div([
                         'border': f'1px solid {CORPORATE_COLORS["primary_blue"]}30',
                         'borderRadius': '5px', 'fontSize': '14px',
                         'color': CORPORATE_COLORS['dark_blue']
+                    }),
+                    
+                    # Totales del rango de fechas seleccionado (sumas acumuladas por grupo)
+                    html.Div(id='kpi-rango', style={
+                        'padding': '0 15px', 'marginTop': '-12px', 'marginBottom': '20px',
+                        'fontSize': '13px', 'color': CORPORATE_COLORS['dark_blue']
                     })
                 ]),
                 
@@ -271,7 +333,38 @@ app.layout = html.Div([
                         'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'
                     }),
                     
-                ])
+                ]),
+                
+                # Detalle de licitaciones de la barra clickeada (paginado en el servidor)
+                html.Div([
+                    html.H4(id='titulo-detalle', style={
+                        'color': CORPORATE_COLORS['primary_blue'], 'margin': '0 0 10px 0', 'fontSize': '16px'
+                    }),
+                    dash_table.DataTable(
+                        id='tabla-detalle',
+                        columns=columnas_tabla(),
+                        data=[],
+                        page_current=0,
+                        page_size=FILAS_POR_PAGINA,
+                        page_action='custom',
+                        sort_action='custom',
+                        sort_mode='multi',
+                        sort_by=[],
+                        filter_action='custom',
+                        filter_query='',
+                        style_table={'overflowX': 'auto'},
+                        style_cell={'fontSize': '12px', 'padding': '5px', 'textAlign': 'left'},
+                        style_header={
+                            'backgroundColor': CORPORATE_COLORS['primary_blue'],
+                            'color': CORPORATE_COLORS['white'], 'fontWeight': 'bold'
+                        }
+                    )
+                ], id='container-detalle', style={
+                    'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'
+                }),
+                
+                # Barra seleccionada para el detalle (período, serie y filtros al hacer clic)
+                dcc.Store(id='seleccion-detalle')
                 
             ], id='main-content', style={
                 'flexGrow': '1', 'padding': '20px', 'height': '100vh', 'overflowY': 'auto',
@@ -287,5 +380,48 @@ app.layout = html.Div([
 # Registrar todos los callbacks
 register_callbacks(app, data_processor)
 
+# Perfilado opcional por callback (DASHBOARD_PROFILE, o ?profile= y /admin/perfiles con DASHBOARD_PROFILE_TOKEN)
+instrumentar_perfilado(app)
+registrar_pagina_perfiles(app.server)
+
+# Métricas de latencia y payload por callback (expuestas en /metrics)
+instrumentar_callbacks(app)
+registrar_endpoint_metricas(app.server)
+
+# API de datos agregados (/data) para la página templates/index.html (/tablero)
+registrar_api_datos(app.server, data_processor)
+
+# Exportación en streaming de las filas filtradas (/exportar?formato=csv|xlsx)
+registrar_exportacion(app.server, data_processor)
+
+# API de solo lectura con los agregados de los gráficos (/api/v1/agregados/<vista>)
+registrar_api_agregados(app.server, data_processor)
+
+
+primer_request = {'atendido': False}
+
+
+@app.server.route('/ready')
+def readiness():
+    """Endpoint de readiness: 200 cuando los datos están cargados, 503 mientras tanto"""
+    return jsonify(data_processor.load_status), 200 if data_processor.is_ready() else 503
+
+
+# Requests del dashboard que cuentan como primer uso (no /ready, /metrics ni assets)
+RUTAS_DASHBOARD = {
+    app.config.routes_pathname_prefix + ruta
+    for ruta in ('', '_dash-layout', '_dash-update-component')
+}
+
+
+@app.server.before_request
+def reportar_primer_request():
+    """Informa el tiempo transcurrido desde el arranque hasta el primer request del dashboard con datos"""
+    if (not primer_request['atendido'] and request.path in RUTAS_DASHBOARD and
+            data_processor.is_ready()):
+        primer_request['atendido'] = True
+        print(f"Tiempo hasta el primer request: {time.time() - t_inicio_proceso:.3f}s "
+              f"(carga: {data_processor.load_info})")
+
 if __name__ == '__main__':
     app.run(debug=True, port=8052, host='127.0.0.1')
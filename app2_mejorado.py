@@ -1,12 +1,17 @@
 import re
-import time
 import datetime
+import threading
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction
 import plotly.express as px
 import plotly.graph_objects as go
 
+from metrics import marcar_fase, registrar_cache, instrumentar_callbacks, registrar_endpoint_metricas
+from profiler import instrumentar_perfilado, registrar_pagina_perfiles
+from serializacion import configurar_serializacion
+
 # ————— Configuración de colores y estilos —————
 CORPORATE_BLUE = '#0063BE'
 DARK_BLUE      = '#0C2863'
@@ -96,6 +101,7 @@ app = Dash(__name__,
     suppress_callback_exceptions=True
 )
 server = app.server
+configurar_serializacion(app)  # JSON rápido y compresión gzip/brotli
 
 # ————— Layout —————
 app.layout = html.Div([
@@ -242,25 +248,24 @@ def set_conc_options(actives, orgs, cenabast):
     options = [{'label': c, 'value': c} for c in unique_combos]
     return options, []
 
-# ————— Callbacks de datos procesados —————
-@app.callback(
-    Output('processed-data','data'),
-    Input('act-dropdown','value'),
-    Input('org-dropdown','value'),
-    Input('conc-dropdown','value'),
-    Input('view-mode','value'),
-    Input('current-only','value')
-)
-def process_data(actives, orgs, concs, view, current):
-    t0 = time.time()
-    
-    # Validar que hay principios activos seleccionados
-    if not actives:
-        return {
-            'agg': [], 'no': [], 'only': [], 'xcol': 'Año de emision', 
-            'view': view, 'orders': [], 'filters_info': {}
-        }
-    
+# ————— Datos filtrados por combinación de filtros —————
+# Se guardan los últimos resultados para que revelar un gráfico (cambiar CENABAST o
+# "Mostrar gráficos") solo calcule la agrupación que falta, sin volver a filtrar.
+MAX_FILTRADOS = 8
+_filtrados = OrderedDict()
+_filtrados_lock = threading.Lock()
+
+
+def preparar_filtrados(actives, orgs, concs, view, current):
+    """Filtra y aplica la lógica de la vista; devuelve (dff, xcol, filters_info)"""
+    clave = (tuple(actives), tuple(orgs or ()), tuple(concs or ()), view, tuple(current or ()))
+    with _filtrados_lock:
+        if clave in _filtrados:
+            _filtrados.move_to_end(clave)
+            registrar_cache(True)
+            return _filtrados[clave]
+    registrar_cache(False)
+
     # — filtros básicos —
     dff = df[df['Principio Activo'].isin(actives)].copy()
     if orgs:
@@ -329,67 +334,76 @@ def process_data(actives, orgs, concs, view, current):
     else:
         xcol = 'Año de emision'
 
-    # — agrupación TODOS los datos —
-    agg = (
-      dff.groupby([xcol,'Grupo Proveedor'])[['Cantidad','Total']]
+
+    resultado = (dff, xcol, filters_info)
+    with _filtrados_lock:
+        _filtrados[clave] = resultado
+        while len(_filtrados) > MAX_FILTRADOS:
+            _filtrados.popitem(last=False)
+    return resultado
+
+
+def tablas_visibles(cenabast, charts):
+    """Agrupaciones que necesitan los gráficos en pantalla"""
+    if not charts:
+        return set()
+    tablas = set()
+    if cenabast in ['with', 'both']:
+        tablas.add('agg')
+    if cenabast in ['without', 'both']:
+        tablas.add('no')
+    if cenabast == 'only':
+        tablas.add('only')
+    return tablas
+
+
+def agrupar_con_market_share(dff_, xcol):
+    """Suma Cantidad y Total por período y grupo, con market share (MS) y sales market share (SMS)"""
+    agg_ = (
+      dff_.groupby([xcol,'Grupo Proveedor'])[['Cantidad','Total']]
          .sum()
          .reset_index()
     )
+    tot_cant = agg_.groupby(xcol)['Cantidad'].transform('sum')
+    tot_vent = agg_.groupby(xcol)['Total'].transform('sum')
+    agg_['MS']  = (100*agg_['Cantidad']/tot_cant.where(tot_cant > 0)).fillna(0)
+    agg_['SMS'] = (100*agg_['Total']/tot_vent.where(tot_vent > 0)).fillna(0)
+    return agg_
 
-    # — cálculo de market shares —
-    tot_cant = agg.groupby(xcol)['Cantidad'].sum().to_dict()
-    tot_vent = agg.groupby(xcol)['Total'].sum().to_dict()
-    agg['MS']  = agg.apply(lambda r:100*r['Cantidad']/tot_cant[r[xcol]] if tot_cant[r[xcol]]>0 else 0, axis=1)
-    agg['SMS'] = agg.apply(lambda r:100*r['Total']/tot_vent[r[xcol]]   if tot_vent[r[xcol]]>0 else 0, axis=1)
 
-    # — agrupación SIN CENABAST (filtrar por Organismo) —
-    dff_no = dff[ ~dff['Organismo'].str.contains('CENABAST', case=False, na=False) ]
-    no_agg = (
-      dff_no.groupby([xcol,'Grupo Proveedor'])[['Cantidad','Total']]
-         .sum()
-         .reset_index()
-    )
-    tot_cant_no = no_agg.groupby(xcol)['Cantidad'].sum().to_dict()
-    tot_vent_no = no_agg.groupby(xcol)['Total'].sum().to_dict()
-    no_agg['MS']  = no_agg.apply(lambda r:100*r['Cantidad']/tot_cant_no[r[xcol]] if tot_cant_no[r[xcol]]>0 else 0, axis=1)
-    no_agg['SMS'] = no_agg.apply(lambda r:100*r['Total']/tot_vent_no[r[xcol]]   if tot_vent_no[r[xcol]]>0 else 0, axis=1)
-
-    # — agrupación SOLO CENABAST —
-    dff_only = dff[ dff['Organismo'].str.contains('CENABAST', case=False, na=False) ]
-    only_agg = (
-      dff_only.groupby([xcol,'Grupo Proveedor'])[['Cantidad','Total']]
-         .sum()
-         .reset_index()
-    )
-    if not only_agg.empty:
-        tot_cant_only = only_agg.groupby(xcol)['Cantidad'].sum().to_dict()
-        tot_vent_only = only_agg.groupby(xcol)['Total'].sum().to_dict()
-        
-        # Calcular MS (Market Share) de forma más robusta
-        ms_values = []
-        for _, row in only_agg.iterrows():
-            xcol_val = row[xcol]
-            if xcol_val in tot_cant_only and tot_cant_only[xcol_val] > 0:
-                ms_values.append(100 * row['Cantidad'] / tot_cant_only[xcol_val])
-            else:
-                ms_values.append(0)
-        only_agg['MS'] = ms_values
-        
-        # Calcular SMS (Sales Market Share) de forma más robusta
-        sms_values = []
-        for _, row in only_agg.iterrows():
-            xcol_val = row[xcol]
-            if xcol_val in tot_vent_only and tot_vent_only[xcol_val] > 0:
-                sms_values.append(100 * row['Total'] / tot_vent_only[xcol_val])
-            else:
-                sms_values.append(0)
-        only_agg['SMS'] = sms_values
-    else:
-        # Si no hay datos de CENABAST, crear DataFrame vacío con las columnas necesarias
-        only_agg = pd.DataFrame(columns=[xcol, 'Grupo Proveedor', 'Cantidad', 'Total', 'MS', 'SMS'])
+# ————— Callbacks de datos procesados —————
+@app.callback(
+    Output('processed-data','data'),
+    Input('act-dropdown','value'),
+    Input('org-dropdown','value'),
+    Input('conc-dropdown','value'),
+    Input('view-mode','value'),
+    Input('current-only','value'),
+    Input('cenabast-filter','value'),
+    Input('chart-select','value')
+)
+def process_data(actives, orgs, concs, view, current, cenabast, charts):
+    # Validar que hay principios activos seleccionados
+    if not actives:
+        return {
+            'agg': [], 'no': [], 'only': [], 'xcol': 'Año de emision', 
+            'view': view, 'orders': [], 'filters_info': {}
+        }
+    
+    dff, xcol, filters_info = preparar_filtrados(actives, orgs, concs, view, current)
+
+    marcar_fase('filtro')
+
+    # — solo se agrupan los datos de los gráficos visibles (TODOS, SIN y SOLO CENABAST) —
+    es_cenabast = dff['Organismo'].str.contains('CENABAST', case=False, na=False)
+    subconjuntos = {'agg': dff, 'no': dff[~es_cenabast], 'only': dff[es_cenabast]}
+    tablas = {
+        nombre: agrupar_con_market_share(subconjuntos[nombre], xcol)
+        for nombre in tablas_visibles(cenabast, charts)
+    }
 
     # — si es mensual, traducir labels a español —
-    orders = sorted(agg[xcol].unique().tolist())
+    orders = sorted(dff.dropna(subset=[xcol, 'Grupo Proveedor'])[xcol].unique().tolist())
     labels = orders
     if xcol=='Periodo':
         # orders = ['2025-01', '2025-02', …]
@@ -399,26 +413,23 @@ def process_data(actives, orgs, concs, view, current):
             mes_i = int(mes)-1
             labels.append(f"{MESES_ES[mes_i]} {año}")
         # para usar directamente los labels en lugar de las keys:
-        agg['Label']   = agg[xcol].apply(lambda p: labels[orders.index(p)])
-        no_agg['Label']= no_agg[xcol].apply(lambda p: labels[orders.index(p)])
-        if not only_agg.empty:
-            only_agg['Label']= only_agg[xcol].apply(lambda p: labels[orders.index(p)] if p in orders else p)
+        etiquetas = dict(zip(orders, labels))
+        for tabla in tablas.values():
+            tabla['Label'] = tabla[xcol].map(etiquetas)
         xcol = 'Label'
 
-    agg['Cantidad'] = agg['Cantidad'].round().astype(int)
-    agg['Total']    = agg['Total'].round().astype(int)
-    no_agg['Cantidad'] = no_agg['Cantidad'].round().astype(int)
-    no_agg['Total']    = no_agg['Total'].round().astype(int)
-    if not only_agg.empty:
-        only_agg['Cantidad'] = only_agg['Cantidad'].round().astype(int)
-        only_agg['Total']    = only_agg['Total'].round().astype(int)
+    for tabla in tablas.values():
+        tabla['Cantidad'] = tabla['Cantidad'].round().astype(int)
+        tabla['Total']    = tabla['Total'].round().astype(int)
+
 
+    marcar_fase('agregacion')
 
     # — preparar output —
     return {
-        'agg'   : agg.to_dict('records'),
-        'no'    : no_agg.to_dict('records'),
-        'only'  : only_agg.to_dict('records'),
+        'agg'   : tablas['agg'].to_dict('records') if 'agg' in tablas else [],
+        'no'    : tablas['no'].to_dict('records') if 'no' in tablas else [],
+        'only'  : tablas['only'].to_dict('records') if 'only' in tablas else [],
         'xcol'  : xcol,
         'view'  : view,
         'orders': labels,
@@ -649,116 +660,40 @@ def render_graphs(data, charts, cenabast):
                 fig.update_layout(title='Tendencia Precio Promedio solo CENABAST', margin=dict(l=20, r=20, t=30, b=20))
                 figs.append(dcc.Graph(figure=fig, config={'modeBarButtonsToAdd':['toImage'],'displaylogo':False}))
 
+    marcar_fase('graficos')
     return figs
 
-@app.callback(
+# ————— Totales sobre barras apiladas según la leyenda (en el navegador, assets/dynamic_totals.js) —————
+app.clientside_callback(
+    ClientsideFunction(namespace='totales', function_name='unidades'),
     Output('units-chart', 'figure'),
     Input('units-chart', 'restyleData'),
     State('units-chart', 'figure')
 )
-def update_units_annotations(restyle, existing_fig):
-    if not existing_fig or not existing_fig.get('data') or len(existing_fig['data']) == 0:
-        return existing_fig
-    
-    fig = go.Figure(existing_fig)
-    
-    # Verificar que el primer trace tenga datos x válidos
-    if not fig.data[0].x or len(fig.data[0].x) == 0:
-        return existing_fig
-    
-    x_vals = list(fig.data[0].x)
-
-    # inicializamos totales a 0
-    totals = [0]*len(x_vals)
-    for trace in fig.data:
-        if trace.visible is None or trace.visible:
-            # Verificar que trace.y existe y tiene la misma longitud que x_vals
-            if not trace.y or len(trace.y) != len(x_vals):
-                continue
-                
-            # convertimos cada punto y a float antes de sumar
-            new_totals = []
-            for t, y in zip(totals, trace.y):
-                try:
-                    y_val = float(y)
-                except Exception:
-                    y_val = 0
-                new_totals.append(t + y_val)
-            totals = new_totals
-
-    # construimos las anotaciones, pero solo para valores > 0
-    ann = []
-    for i in range(min(len(x_vals), len(totals))):
-        if totals[i] > 0:  # Solo mostrar anotaciones para valores mayores a 0
-            ann.append(dict(
-                x=x_vals[i],
-                y=int(totals[i]),
-                text=f"{int(totals[i]):,}",
-                showarrow=False,
-                yshift=10,
-                font=dict(size=11, color='black')
-            ))
-    fig.update_layout(annotations=ann)
-    return fig
 
-
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='totales', function_name='ventas'),
     Output('sales-chart','figure'),
     Input('sales-chart','restyleData'),
     State('sales-chart','figure')
 )
-def update_sales_annotations(restyle, existing_fig):
-    if not existing_fig or not existing_fig.get('data') or len(existing_fig['data']) == 0:
-        return existing_fig
-    
-    fig = go.Figure(existing_fig)
-    
-    # Verificar que el primer trace tenga datos x válidos
-    if not fig.data[0].x or len(fig.data[0].x) == 0:
-        return existing_fig
-        
-    x_vals = list(fig.data[0].x)
 
-    totals = [0]*len(x_vals)
-    for trace in fig.data:
-        if trace.visible is None or trace.visible:
-            # Verificar que trace.y existe y tiene la misma longitud que x_vals
-            if not trace.y or len(trace.y) != len(x_vals):
-                continue
-                
-            new_totals = []
-            for t, y in zip(totals, trace.y):
-                try:
-                    y_val = float(y)
-                except Exception:
-                    y_val = 0
-                new_totals.append(t + y_val)
-            totals = new_totals
-
-    # construimos las anotaciones, pero solo para valores > 0
-    ann = []
-    for i in range(min(len(x_vals), len(totals))):
-        if totals[i] > 0:  # Solo mostrar anotaciones para valores mayores a 0
-            ann.append(dict(
-                x=x_vals[i],
-                y=int(totals[i]),
-                text=f"${int(totals[i]):,}",
-                showarrow=False,
-                yshift=10,
-                font=dict(size=11, color='black')
-            ))
-    fig.update_layout(annotations=ann)
-    return fig
 
-
-# ————— Toggle filtros —————
-@app.callback(
+# ————— Toggle filtros (en el navegador, assets/clientside.js) —————
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='toggle_filtros'),
     Output('filter-container','className'),
     Input('toggle-filters','n_clicks'),
     prevent_initial_call=True
 )
-def toggle(c):
-    return 'filter-container hidden' if c and c%2 else 'filter-container visible'
+
+# ————— Perfilado opcional por callback (/admin/perfiles) —————
+instrumentar_perfilado(app)
+registrar_pagina_perfiles(server)
+
+# ————— Métricas por callback (expuestas en /metrics) —————
+instrumentar_callbacks(app)
+registrar_endpoint_metricas(server)
 
 # ————— Run —————
 import os
@@ -0,0 +1,53 @@
+// Callbacks del lado del cliente: interacciones de UI que no necesitan datos del servidor
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // Colapsa/expande el sidebar usando los estilos calculados en el servidor al cargar
+        toggle_sidebar: function(n_clicks, sidebarData, estilos) {
+            const clicks = n_clicks || 0;
+            const isCollapsed = sidebarData ? Boolean(sidebarData.collapsed) : false;
+            const newCollapsed = clicks > 0 ? !isCollapsed : isCollapsed;
+            const estilo = newCollapsed ? estilos.colapsado : estilos.expandido;
+            return [estilo.sidebar, estilo.main, {collapsed: newCollapsed}];
+        },
+
+        // Quita de cada filtro los valores que ya no existen en sus opciones
+        limpiar_valores_filtros: function(optPrincipio, optOrganismo, optConcentracion, optGrupo,
+                                          valPrincipio, valOrganismo, valConcentracion, valGrupo) {
+            function limpiar(opciones, valores) {
+                const disponibles = new Set((opciones || []).map(opt => opt.value));
+                return (valores || []).filter(valor => disponibles.has(valor));
+            }
+            return [
+                limpiar(optPrincipio, valPrincipio),
+                limpiar(optOrganismo, valOrganismo),
+                limpiar(optConcentracion, valConcentracion),
+                limpiar(optGrupo, valGrupo)
+            ];
+        },
+
+        // URLs de /exportar con los filtros actuales, una por formato
+        enlaces_exportacion: function(principios, organismos, concentraciones, grupos, cenabast, opciones) {
+            const params = new URLSearchParams();
+            (principios || []).forEach(v => params.append('principio', v));
+            (organismos || []).forEach(v => params.append('organismo', v));
+            (concentraciones || []).forEach(v => params.append('concentracion', v));
+            (grupos || []).forEach(v => params.append('grupo', v));
+            (opciones || []).forEach(v => params.append('opciones', v));
+            params.append('cenabast', cenabast || 'ambos');
+            return ['csv', 'xlsx'].map(formato => '/exportar?' + params.toString() + '&formato=' + formato);
+        },
+
+        // Muestra/oculta el contenedor de filtros (app2_mejorado)
+        toggle_filtros: function(n_clicks) {
+            return n_clicks && n_clicks % 2 ? 'filter-container hidden' : 'filter-container visible';
+        }
+    }
+});
+
+// Formato 'AAAA-MM' del tooltip del slider de fechas (índice de mes = año * 12 + mes - 1)
+window.dccFunctions = window.dccFunctions || {};
+window.dccFunctions.etiquetaMes = function(indice) {
+    const año = Math.floor(indice / 12);
+    const mes = indice % 12 + 1;
+    return año + '-' + String(mes).padStart(2, '0');
+};
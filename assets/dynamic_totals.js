@@ -1,74 +1,138 @@
+// Totales dinámicos sobre barras apiladas: solo suman las series visibles en la leyenda
+(function() {
+    // Tipos de arreglos binarios que plotly (Python) envía como {dtype, bdata}
+    const TIPOS_BDATA = {
+        f8: Float64Array, f4: Float32Array,
+        i4: Int32Array, i2: Int16Array, i1: Int8Array,
+        u4: Uint32Array, u2: Uint16Array, u1: Uint8Array
+    };
+
+    // Devuelve un arreglo indexable a partir de una lista o de un arreglo codificado en base64
+    function valores(arr) {
+        if (!arr) return [];
+        if (Array.isArray(arr) || ArrayBuffer.isView(arr)) return arr;
+        if (arr.bdata !== undefined) {
+            const binario = atob(arr.bdata);
+            const bytes = new Uint8Array(binario.length);
+            for (let i = 0; i < binario.length; i++) bytes[i] = binario.charCodeAt(i);
+            if (arr.dtype === 'i8' || arr.dtype === 'u8') {
+                const Tipo = arr.dtype === 'i8' ? BigInt64Array : BigUint64Array;
+                return Array.from(new Tipo(bytes.buffer), Number);
+            }
+            const Tipo = TIPOS_BDATA[arr.dtype] || Float64Array;
+            return new Tipo(bytes.buffer);
+        }
+        return [];
+    }
+
+    // Suma por valor de x las series de barras visibles
+    function calcularTotales(traces) {
+        const totales = new Map();
+        (traces || []).forEach(trace => {
+            if (trace.type && trace.type !== 'bar') return;
+            if (trace.visible === 'legendonly' || trace.visible === false) return;
+            const xs = valores(trace.x);
+            const ys = valores(trace.y);
+            for (let i = 0; i < xs.length; i++) {
+                const y = Number(ys[i]) || 0;
+                totales.set(xs[i], (totales.get(xs[i]) || 0) + y);
+            }
+        });
+        return totales;
+    }
+
+    // Anotaciones de total sobre cada barra (solo totales mayores a 0)
+    function anotacionesTotales(traces, prefijo, locale) {
+        const anotaciones = [];
+        calcularTotales(traces).forEach((total, x) => {
+            if (total <= 0) return;
+            const entero = Math.trunc(total);
+            anotaciones.push({
+                x: x,
+                y: entero,
+                text: `${prefijo || ''}${entero.toLocaleString(locale || 'en-US')}`,
+                showarrow: false,
+                yshift: 10,
+                font: {size: 11, color: 'black'}
+            });
+        });
+        return anotaciones;
+    }
+
+    // Callback clientside: al montar el gráfico usa la figura; en clics de leyenda lee el
+    // estado real del gráfico y solo actualiza las anotaciones (sin tocar la visibilidad)
+    function crearCallbackTotales(graphId, prefijo) {
+        return function(restyleData, figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!figure || !figure.data || figure.data.length === 0) return noUpdate;
+
+            const graphDiv = document.querySelector(`#${graphId} .js-plotly-plot`);
+            if (restyleData && graphDiv && graphDiv.data) {
+                Plotly.relayout(graphDiv, {annotations: anotacionesTotales(graphDiv.data, prefijo)});
+                return noUpdate;
+            }
+
+            const layout = Object.assign({}, figure.layout, {
+                annotations: anotacionesTotales(figure.data, prefijo)
+            });
+            return Object.assign({}, figure, {layout: layout});
+        };
+    }
+
+    window.dashboardTotales = {valores, calcularTotales, anotacionesTotales};
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        totales: {
+            unidades: crearCallbackTotales('units-chart', ''),
+            ventas: crearCallbackTotales('sales-chart', '$')
+        }
+    });
+})();
+
 window.onload = function() {
     // Función para actualizar los totales en las gráficas
     function updateTotals(graphDiv) {
         // Verificar si es una gráfica de barras
-        if (!graphDiv || !graphDiv.data || graphDiv.data.length === 0 || 
+        if (!graphDiv || !graphDiv.data || graphDiv.data.length === 0 ||
             (graphDiv.data[0].type !== 'bar' && graphDiv.data[0].type !== 'scatter')) {
             return;
         }
-        
-        // Obtener los datos visibles
-        const visibleData = graphDiv.data.filter(trace => trace.visible !== 'legendonly');
-        
-        if (visibleData.length === 0) return;
-        
+
         // Eliminar anotaciones existentes
         let layout = graphDiv.layout;
         let updatedAnnotations = [];
-        
+
         // Mantener solo anotaciones que no sean de totales
         if (layout.annotations) {
-            updatedAnnotations = layout.annotations.filter(ann => 
+            updatedAnnotations = layout.annotations.filter(ann =>
                 !ann.text || !ann.text.includes(',') || ann.yshift !== 10);
         }
-        
-        // Si es una gráfica de barras apiladas
+
+        // Si es una gráfica de barras apiladas, agregar los totales de las series visibles
         if (graphDiv.data[0].type === 'bar') {
-            // Calcular totales por cada valor de x
-            const totals = {};
-            
-            visibleData.forEach(trace => {
-                if (trace.x && trace.y) {
-                    trace.x.forEach((x, i) => {
-                        if (!totals[x]) totals[x] = 0;
-                        totals[x] += trace.y[i] || 0;
-                    });
-                }
-            });
-            
-            // Crear anotaciones para los totales
-            Object.keys(totals).forEach(x => {
-                updatedAnnotations.push({
-                    x: x,
-                    y: totals[x],
-                    text: `${parseInt(totals[x]).toLocaleString('es-ES')}`,
-                    font: {size: 10, color: 'black'},
-                    showarrow: false,
-                    yshift: 10
-                });
-            });
+            updatedAnnotations = updatedAnnotations.concat(
+                window.dashboardTotales.anotacionesTotales(graphDiv.data, '', 'es-ES'));
         }
-        
+
         // Actualizar las anotaciones
         Plotly.relayout(graphDiv, {annotations: updatedAnnotations});
     }
-    
+
     // Conectar a eventos de redibujo de Plotly
-    const graphIds = ['units-all-chart', 'units-no-cenabast-chart', 
+    const graphIds = ['units-all-chart', 'units-no-cenabast-chart',
                      'sales-all-chart', 'sales-no-cenabast-chart'];
-    
+
     graphIds.forEach(id => {
         const graphDiv = document.getElementById(id);
         if (graphDiv) {
             graphDiv.on('plotly_afterplot', function() {
                 updateTotals(this);
             });
-            
+
             // Evento para click en la leyenda
             graphDiv.on('plotly_legendclick', function() {
                 setTimeout(() => updateTotals(this), 100);
             });
-            
+
             // Evento para doble click en la leyenda
             graphDiv.on('plotly_legenddoubleclick', function() {
                 setTimeout(() => updateTotals(this), 100);
@@ -0,0 +1,235 @@
+"""
+Benchmark del pipeline del dashboard farmacéutico con datos sintéticos
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Genera un dataset sintético escalable (10k a 10M licitaciones) con cardinalidades
+realistas y mide cada etapa del pipeline: process_data, filtrar_datos,
+agregar_datos_por_vista (por vista y modo CENABAST), la mensualización y cada
+función crear_grafico_*. Los resultados se escriben en JSON para comparar commits.
+
+Uso:
+    python benchmark.py --filas 10000 100000 --salida resultados.json
+    python benchmark.py --filas 100000 --comparar resultados_anteriores.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_processor import OptimizedDataProcessor
+from utils import (
+    filtrar_datos, agregar_datos_por_vista, aplicar_logica_mensualizada_mejorada,
+    crear_grafico_unidades, crear_grafico_ventas, crear_grafico_precio,
+    crear_grafico_unidades_cenabast, crear_grafico_ventas_cenabast,
+    crear_grafico_precio_cenabast
+)
+
+
+VISTAS = ['anual', 'mensual', 'mensualizado']
+MODOS_CENABAST = ['con', 'sin', 'solo', 'ambos']
+
+# Cardinalidades aproximadas del archivo real de Mercado Público
+N_PRINCIPIOS = 600
+N_ORGANISMOS = 1500
+N_PROVEEDORES = 150
+
+# Proporción de licitaciones CENABAST y mezcla de duraciones de contrato (meses)
+RATIO_CENABAST = 0.25
+DURACIONES_CONTRATO = [1, 3, 6, 12, 24, 36, np.nan]
+PESOS_DURACION = [0.30, 0.15, 0.15, 0.20, 0.08, 0.04, 0.08]
+
+
+def _pesos_zipf(n, s=1.1):
+    """Pesos con distribución Zipf: pocos valores concentran la mayoría de las filas"""
+    pesos = 1.0 / np.arange(1, n + 1) ** s
+    return pesos / pesos.sum()
+
+
+def generar_datos_sinteticos(n_filas, seed=42):
+    """Genera licitaciones sintéticas con el formato de la hoja 'Data' del Excel"""
+    rng = np.random.default_rng(seed)
+
+    principios = np.array([f'PRINCIPIO {i:04d}' for i in range(N_PRINCIPIOS)])
+    organismos = np.array(['CENABAST'] + [f'HOSPITAL {i:04d}' for i in range(N_ORGANISMOS - 1)])
+    proveedores = np.array(['FRESENIUS CORP', 'THERAPIA IV'] +
+                           [f'PROVEEDOR {i:03d}' for i in range(N_PROVEEDORES - 2)])
+
+    # Organismos: CENABAST con la proporción indicada, el resto con distribución Zipf
+    es_cenabast = rng.random(n_filas) < RATIO_CENABAST
+    idx_organismo = rng.choice(np.arange(1, N_ORGANISMOS), n_filas, p=_pesos_zipf(N_ORGANISMOS - 1))
+    idx_organismo[es_cenabast] = 0
+
+    fechas = pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 4 * 365, n_filas), unit='D')
+    precio = rng.lognormal(mean=7.5, sigma=1.2, size=n_filas).round(2)
+    cantidad = rng.integers(1, 5000, n_filas)
+
+    return pd.DataFrame({
+        'Principio Activo': principios[rng.choice(N_PRINCIPIOS, n_filas, p=_pesos_zipf(N_PRINCIPIOS))],
+        'Organismo': organismos[idx_organismo],
+        'Concentration': rng.choice(['1 MG/ML', '5 MG/ML', '10 MG', '100 MG', '500 MG', '1 G'], n_filas),
+        'Forma': rng.choice(['AMPOLLA', 'FRASCO', 'BOLSA', 'COMPRIMIDO', 'VIAL'], n_filas),
+        'Grupo Proveedor': proveedores[rng.choice(N_PROVEEDORES, n_filas, p=_pesos_zipf(N_PROVEEDORES, 0.9))],
+        'Fecha': fechas,
+        'Precio Unitario': precio,
+        'Cantidad': cantidad,
+        'Total': (precio * cantidad).round(0),
+        'duracion_contrato_meses': rng.choice(DURACIONES_CONTRATO, n_filas, p=PESOS_DURACION)
+    })
+
+
+def medir(funcion, repeticiones=3):
+    """Ejecuta la función varias veces y devuelve tiempos mínimo y mediano (segundos)"""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return {'min': round(min(tiempos), 6), 'mediana': round(float(np.median(tiempos)), 6)}, resultado
+
+
+def ejecutar_benchmark(n_filas, repeticiones=3, max_filas_mensualizado=20000):
+    """Mide todas las etapas del pipeline para un tamaño de dataset"""
+    resultados = {}
+    print(f"\n=== Benchmark con {n_filas:,} licitaciones ===")
+
+    datos_crudos = generar_datos_sinteticos(n_filas)
+
+    # process_data sobre una copia fresca en cada repetición
+    procesador = OptimizedDataProcessor()
+
+    def procesar():
+        procesador.df = datos_crudos.copy()
+        procesador.process_data()
+        return procesador.df
+
+    resultados['process_data'], df = medir(procesar, repeticiones)
+
+    # Principio activo con más ventas: caso típico de uso del dashboard
+    principio_top = df.groupby('principio_activo')['ventas'].sum().idxmax()
+    estados_filtro = {
+        'sin_filtros': ([], [], [], []),
+        'principio_top': ([principio_top], [], [], []),
+        'principio_y_proveedor': ([principio_top], [], [], ['FRESENIUS CORP', 'THERAPIA IV'])
+    }
+
+    for nombre, (principios, organismos, concentraciones, grupos) in estados_filtro.items():
+        resultados[f'filtrar_datos/{nombre}'], _ = medir(
+            lambda: filtrar_datos(df, principios, organismos, concentraciones, grupos, 'ambos', []),
+            repeticiones
+        )
+
+    # La agregación se mide sobre el filtro por principio activo (interacción habitual)
+    df_filtrado = filtrar_datos(df, [principio_top], [], [], [], 'ambos', [])
+    if len(df_filtrado) > max_filas_mensualizado:
+        df_filtrado_mensualizado = df_filtrado.sample(max_filas_mensualizado, random_state=0)
+    else:
+        df_filtrado_mensualizado = df_filtrado
+
+    resultados['mensualizacion'], _ = medir(
+        lambda: aplicar_logica_mensualizada_mejorada(df_filtrado_mensualizado), 1
+    )
+    resultados['mensualizacion']['filas'] = len(df_filtrado_mensualizado)
+
+    agregados = {}
+    for vista in VISTAS:
+        df_vista = df_filtrado_mensualizado if vista == 'mensualizado' else df_filtrado
+        for modo in MODOS_CENABAST:
+            df_modo = filtrar_datos(df_vista, [], [], [], [], modo, [])
+            reps = 1 if vista == 'mensualizado' else repeticiones
+            resultados[f'agregar_datos_por_vista/{vista}/{modo}'], agregados[(vista, modo)] = medir(
+                lambda: agregar_datos_por_vista(df_modo, vista, modo), reps
+            )
+
+    # Gráficos
+    for vista in VISTAS:
+        df_agregado = agregados[(vista, 'ambos')]
+        df_agregado_solo = agregados[(vista, 'solo')]
+        graficos = {
+            'crear_grafico_unidades': lambda: crear_grafico_unidades(df_agregado, vista, 'ambos'),
+            'crear_grafico_ventas': lambda: crear_grafico_ventas(df_agregado, vista, 'ambos'),
+            'crear_grafico_precio': lambda: crear_grafico_precio(df_agregado, vista, 'ambos'),
+            'crear_grafico_unidades_cenabast': lambda: crear_grafico_unidades_cenabast(df_agregado_solo, vista),
+            'crear_grafico_ventas_cenabast': lambda: crear_grafico_ventas_cenabast(df_agregado_solo, vista),
+            'crear_grafico_precio_cenabast': lambda: crear_grafico_precio_cenabast(df_agregado_solo, vista)
+        }
+        for nombre, funcion in graficos.items():
+            resultados[f'{nombre}/{vista}'], _ = medir(funcion, repeticiones)
+
+    for etapa, tiempos in resultados.items():
+        print(f"  {etapa:<50} min={tiempos['min']:.4f}s  mediana={tiempos['mediana']:.4f}s")
+
+    return resultados
+
+
+def _commit_actual():
+    """Hash del commit actual de git (o None si no está disponible)"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def comparar_resultados(actual, anterior, umbral=1.2):
+    """Imprime las etapas cuyo tiempo mediano empeoró más que el umbral"""
+    print(f"\n=== Comparación con commit {anterior.get('commit')} ===")
+    regresiones = 0
+    for n_filas, etapas in actual['resultados'].items():
+        previas = anterior.get('resultados', {}).get(n_filas, {})
+        for etapa, tiempos in etapas.items():
+            if etapa not in previas or previas[etapa]['mediana'] <= 0:
+                continue
+            ratio = tiempos['mediana'] / previas[etapa]['mediana']
+            marca = 'REGRESIÓN' if ratio > umbral else ''
+            if ratio > umbral:
+                regresiones += 1
+            print(f"  [{n_filas}] {etapa:<50} x{ratio:.2f} {marca}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del pipeline del dashboard')
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000],
+                        help='Tamaños del dataset sintético (10k a 10M)')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--max-filas-mensualizado', type=int, default=20000,
+                        help='Máximo de filas para medir la mensualización (muestra del filtro)')
+    parser.add_argument('--salida', default='benchmark_resultados.json')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+    args = parser.parse_args()
+
+    salida = {
+        'commit': _commit_actual(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'resultados': {}
+    }
+    for n_filas in args.filas:
+        salida['resultados'][str(n_filas)] = ejecutar_benchmark(
+            n_filas, args.repeticiones, args.max_filas_mensualizado
+        )
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en: {args.salida}")
+
+    if args.comparar and os.path.exists(args.comparar):
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        if comparar_resultados(salida, anterior):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
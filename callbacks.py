@@ -4,19 +4,132 @@ Autor: Sistema automatizado
 Fecha: Junio 2025
 """
 
+import os
+import hashlib
 import dash
-from dash import Input, Output, State, callback_context
+from dash import Input, Output, State, ClientsideFunction, Patch, callback_context
 import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
 from datetime import datetime
 
+from coalescencia import SingleFlight, CacheLRU, ORIGEN_CACHE, ORIGEN_COMPARTIDO, ORIGEN_CALCULADO
+from precalentamiento import iniciar_precalentamiento, crear_prefetch, PREFETCH_MAX, PrefetchCancelado
+from metrics import marcar_fase, reiniciar_marca, registrar_cache, registrar_coalescencia
+from detalle import filas_seleccion, formatear_detalle, filtrar_y_ordenar_detalle, pagina_detalle
+from indice_temporal import totales_rango, marcas_slider, etiqueta_mes
+
 from utils import (
-    CORPORATE_COLORS, filtrar_datos, agregar_datos_por_vista,
+    CORPORATE_COLORS, TOP_PROVEEDORES, NOMBRE_OTROS, filtrar_datos, mascara_filtros, agregar_datos_por_vista,
     crear_grafico_unidades, crear_grafico_ventas, crear_grafico_precio,
     crear_grafico_unidades_cenabast, crear_grafico_ventas_cenabast, 
     crear_grafico_precio_cenabast
 )
 
 
+def estilos_sidebar():
+    """Estilos del sidebar y del contenido para los estados expandido y colapsado"""
+    return {
+        'colapsado': {
+            'sidebar': {
+                'width': '0px', 'minWidth': '0px', 'height': '100vh', 'overflowY': 'hidden',
+                'background': f'linear-gradient(180deg, {CORPORATE_COLORS["warm_white"]}, {CORPORATE_COLORS["white"]})',
+                'padding': '0px', 'borderRight': f'1px solid {CORPORATE_COLORS["cool_gray"]}',
+                'transition': 'all 0.3s ease', 'position': 'relative',
+                'boxShadow': '2px 0 4px rgba(0,0,0,0.1)'
+            },
+            'main': {
+                'flexGrow': '1', 'padding': '20px', 'height': '100vh', 'overflowY': 'auto',
+                'background': CORPORATE_COLORS['white'], 'marginLeft': '0px', 'transition': 'all 0.3s ease'
+            }
+        },
+        'expandido': {
+            'sidebar': {
+                'width': '280px', 'minWidth': '280px', 'height': '100vh', 'overflowY': 'auto',
+                'background': f'linear-gradient(180deg, {CORPORATE_COLORS["warm_white"]}, {CORPORATE_COLORS["white"]})',
+                'padding': '20px', 'borderRight': f'1px solid {CORPORATE_COLORS["cool_gray"]}',
+                'transition': 'all 0.3s ease', 'position': 'relative',
+                'boxShadow': '2px 0 4px rgba(0,0,0,0.1)'
+            },
+            'main': {
+                'flexGrow': '1', 'padding': '20px', 'height': '100vh', 'overflowY': 'auto',
+                'background': CORPORATE_COLORS['white']
+            }
+        }
+    }
+
+
+# Resultados de calcular_dashboard guardados por estado de filtros
+CACHE_ENTRADAS = int(os.environ.get('DASHBOARD_CACHE_ENTRADAS', '32'))
+
+# Selecciones de detalle formateadas (y filtradas/ordenadas) reutilizadas entre páginas
+CACHE_DETALLE = 16
+
+
+def _hash_json(valor):
+    """Hash corto del JSON de una parte de la figura"""
+    return hashlib.blake2b(to_json_plotly(valor).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def firma_figura(figura):
+    """Firma de una figura: layout (sin anotaciones), anotaciones y cada traza por separado"""
+    layout = figura['layout']
+    return {
+        'layout': _hash_json({k: v for k, v in layout.items() if k != 'annotations'}),
+        'anotaciones': _hash_json(layout.get('annotations', [])),
+        'nombres': [traza.get('name') for traza in figura['data']],
+        'trazas': [_hash_json(traza) for traza in figura['data']]
+    }
+
+
+def preparar_figura(fig):
+    """Convierte la figura a dict y calcula su firma (una vez, compartible entre requests)"""
+    figura = fig.to_dict()
+    return {'figura': figura, 'firma': firma_figura(figura)}
+
+
+def actualizar_figura_parcial(preparada, firma_previa):
+    """Devuelve la figura completa o, si el layout no cambió, solo las trazas que cambiaron
+    
+    La firma previa describe la figura que ya tiene el navegador. Con el mismo layout
+    (ejes, títulos, template) se envía un Patch con las trazas y anotaciones nuevas.
+    Retorna (salida, firma_nueva).
+    """
+    figura, firma = preparada['figura'], preparada['firma']
+    
+    if not firma_previa or firma_previa.get('layout') != firma['layout']:
+        return figura, firma
+    if firma_previa == firma:
+        return dash.no_update, firma
+    
+    parche = Patch()
+    if firma_previa['nombres'] == firma['nombres']:
+        # Mismas series en el mismo orden: solo se reemplazan las que cambiaron
+        for i, (antes, ahora) in enumerate(zip(firma_previa['trazas'], firma['trazas'])):
+            if antes != ahora:
+                parche['data'][i] = figura['data'][i]
+    else:
+        parche['data'] = figura['data']
+    
+    if firma_previa['anotaciones'] != firma['anotaciones']:
+        parche['layout']['annotations'] = figura['layout'].get('annotations', [])
+    
+    return parche, firma
+
+
+def clave_filtros(principios, organismos, concentraciones, grupos, vista, cenabast, opciones, generacion):
+    """Estado canónico de los filtros (el orden de selección no importa) más la generación de datos"""
+    return (
+        tuple(sorted(principios or [])),
+        tuple(sorted(organismos or [])),
+        tuple(sorted(concentraciones or [])),
+        tuple(sorted(grupos or [])),
+        vista,
+        cenabast,
+        tuple(sorted(opciones or [])),
+        generacion
+    )
+
+
 def register_callbacks(app, data_processor):
     """Registra todos los callbacks del dashboard"""
 
@@ -27,16 +140,26 @@ def register_callbacks(app, data_processor):
          Output('filtro-concentracion', 'options'),
          Output('filtro-grupo-proveedor', 'options')],
         [Input('filtro-cenabast', 'value'),
-         Input('opciones-adicionales', 'value')]
+         Input('opciones-adicionales', 'value'),
+         Input('estado-carga', 'data')]
     )
-    def inicializar_opciones_filtros(cenabast, opciones):
+    def inicializar_opciones_filtros(cenabast, opciones, estado_carga):
         """Inicializa las opciones de los filtros basado en filtros globales"""
         
         df = data_processor.df
         
-        if df is None or len(df) == 0:
+        if not data_processor.is_ready() or df is None or len(df) == 0:
             return [], [], [], []
         
+        # Usar el índice de facetas precalculado cuando no hay truncamiento por fecha
+        if not (opciones and 'truncar_mes' in opciones):
+            facetas = data_processor.get_facet_values(cenabast)
+            if facetas:
+                return tuple(
+                    [{'label': v, 'value': v} for v in facetas[col]]
+                    for col in ['principio_activo', 'organismo', 'concentracion', 'grupo_proveedor']
+                )
+        
         # Aplicar filtros globales
         df_base = df.copy()
         
@@ -76,7 +199,7 @@ def register_callbacks(app, data_processor):
         
         df = data_processor.df
         
-        if df is None or len(df) == 0:
+        if not data_processor.is_ready() or df is None or len(df) == 0:
             return [], [], []
         
         # Aplicar filtros base
@@ -108,54 +231,222 @@ def register_callbacks(app, data_processor):
         
         return opciones_organismo, opciones_concentracion, opciones_grupo
 
-    # Callback para el toggle del sidebar
+    # Callback que consulta el progreso de la carga en segundo plano
     @app.callback(
+        [Output('estado-carga', 'data'),
+         Output('intervalo-carga', 'disabled')],
+        [Input('intervalo-carga', 'n_intervals')],
+        [State('estado-carga', 'data')]
+    )
+    def consultar_estado_carga(n_intervals, estado_actual):
+        """Publica el estado de carga; se desactiva cuando los datos están listos"""
+        estado = dict(data_processor.load_status)
+        terminado = estado['estado'] in ('listo', 'error')
+        
+        # Solo propagar cambios reales para no redibujar los gráficos en cada tick
+        if estado == estado_actual:
+            return dash.no_update, terminado
+        
+        return estado, terminado
+
+    # Toggle del sidebar en el navegador (sin round-trip al servidor)
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='toggle_sidebar'),
         [Output('sidebar', 'style'),
          Output('main-content', 'style'),
          Output('sidebar-state', 'data')],
         [Input('sidebar-toggle', 'n_clicks')],
-        [State('sidebar-state', 'data')]
+        [State('sidebar-state', 'data'),
+         State('sidebar-estilos', 'data')]
     )
-    def toggle_sidebar(n_clicks, sidebar_data):
-        """Maneja el colapso/expansión del sidebar"""
-        if n_clicks is None:
-            n_clicks = 0
+
+    # Cálculo de los 6 gráficos para un estado de filtros (compartible entre requests)
+    def calcular_dashboard(principios, organismos, concentraciones, grupos, vista, cenabast, opciones,
+                           cancelado=None):
+        """Filtra, agrega y construye las figuras del dashboard (sin estado del navegador)
         
-        # Obtener estado actual
-        is_collapsed = sidebar_data.get('collapsed', False) if sidebar_data else False
+        cancelado es el Event del prefetch especulativo: se revisa entre fases y
+        corta el cálculo con PrefetchCancelado cuando empieza un request real.
+        """
         
-        # Alternar estado si se hizo clic
-        new_collapsed = not is_collapsed if n_clicks > 0 else is_collapsed
+        def fase(nombre):
+            marcar_fase(nombre)
+            if cancelado is not None and cancelado.is_set():
+                raise PrefetchCancelado()
         
-        if new_collapsed:
-            # Sidebar colapsado
-            sidebar_style = {
-                'width': '0px', 'minWidth': '0px', 'height': '100vh', 'overflowY': 'hidden',
-                'background': f'linear-gradient(180deg, {CORPORATE_COLORS["warm_white"]}, {CORPORATE_COLORS["white"]})',
-                'padding': '0px', 'borderRight': f'1px solid {CORPORATE_COLORS["cool_gray"]}',
-                'transition': 'all 0.3s ease', 'position': 'relative',
-                'boxShadow': '2px 0 4px rgba(0,0,0,0.1)'
-            }
-            main_style = {
-                'flexGrow': '1', 'padding': '20px', 'height': '100vh', 'overflowY': 'auto',
-                'background': CORPORATE_COLORS['white'], 'marginLeft': '0px', 'transition': 'all 0.3s ease'
-            }
+        # Sin filtros (página de inicio) se usan las tablas precalculadas al cargar
+        sin_filtros = not (principios or organismos or concentraciones or grupos or
+                           (opciones and 'truncar_mes' in opciones))
+        usar_base = sin_filtros and 'agregados_base' in data_processor.derived
+        
+        # Filtrar datos
+        if not usar_base:
+            df_filtrado = filtrar_datos(
+                data_processor.df, principios, organismos, concentraciones, grupos, 
+                cenabast, opciones
+            )
+        fase('filtro')
+        
+        def agregado(modo):
+            """Tabla agregada del modo CENABAST: precalculada o sobre los datos filtrados"""
+            if usar_base:
+                return data_processor.get_agregados_base(vista, modo)
+            if modo == 'sin':
+                df_modo = df_filtrado[df_filtrado['es_cenabast'] == False]
+            elif modo == 'solo':
+                df_modo = df_filtrado[df_filtrado['es_cenabast'] == True]
+            else:
+                df_modo = df_filtrado
+            # Con proveedores elegidos en el filtro se muestran todos (sin "Otros")
+            return agregar_datos_por_vista(df_modo, vista, modo, top_proveedores=0 if grupos else TOP_PROVEEDORES)
+        
+        # Estilos para los contenedores - Layout apilado
+        style_visible = {'width': '100%', 'marginBottom': '20px', 'padding': '0 10px'}
+        style_hidden = {'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'}
+        
+        # Colores y orden de series fijos para todo el dataset (no dependen de los filtros)
+        colores = data_processor.derived.get('colores')
+        
+        # Crear gráficos básicos
+        if cenabast in ['con', 'ambos']:
+            # Datos con CENABAST
+            df_agregado_con = agregado('con')
+            fase('agregacion')
+            
+            fig_unidades = crear_grafico_unidades(df_agregado_con, vista, 'con', colores)
+            fig_ventas = crear_grafico_ventas(df_agregado_con, vista, 'con', colores)
+            fig_precio = crear_grafico_precio(df_agregado_con, vista, 'con', colores)
+            fase('graficos')
+        elif cenabast == 'sin':
+            # Datos sin CENABAST
+            df_agregado_sin = agregado('sin')
+            fase('agregacion')
+            
+            fig_unidades = crear_grafico_unidades(df_agregado_sin, vista, 'sin', colores)
+            fig_ventas = crear_grafico_ventas(df_agregado_sin, vista, 'sin', colores)
+            fig_precio = crear_grafico_precio(df_agregado_sin, vista, 'sin', colores)
+            fase('graficos')
+        else:  # solo
+            # Solo datos CENABAST
+            df_agregado_solo = agregado('solo')
+            fase('agregacion')
+            
+            fig_unidades = crear_grafico_unidades(df_agregado_solo, vista, 'solo', colores)
+            fig_ventas = crear_grafico_ventas(df_agregado_solo, vista, 'solo', colores)
+            fig_precio = crear_grafico_precio(df_agregado_solo, vista, 'solo', colores)
+            fase('graficos')
+        
+        # Determinar si mostrar gráficos CENABAST
+        mostrar_cenabast = cenabast == 'ambos'
+        
+        if mostrar_cenabast:
+            # Crear gráficos específicos de CENABAST
+            df_agregado_cenabast = agregado('solo')
+            fase('agregacion')
+            
+            fig_unidades_cenabast = crear_grafico_unidades_cenabast(df_agregado_cenabast, vista, colores)
+            fig_ventas_cenabast = crear_grafico_ventas_cenabast(df_agregado_cenabast, vista, colores)
+            fig_precio_cenabast = crear_grafico_precio_cenabast(df_agregado_cenabast, vista, colores)
+            fase('graficos')
+            
+            # Estilos de contenedores CENABAST (visibles)
+            style_cenabast = style_visible
         else:
-            # Sidebar expandido
-            sidebar_style = {
-                'width': '280px', 'minWidth': '280px', 'height': '100vh', 'overflowY': 'auto',
-                'background': f'linear-gradient(180deg, {CORPORATE_COLORS["warm_white"]}, {CORPORATE_COLORS["white"]})',
-                'padding': '20px', 'borderRight': f'1px solid {CORPORATE_COLORS["cool_gray"]}',
-                'transition': 'all 0.3s ease', 'position': 'relative',
-                'boxShadow': '2px 0 4px rgba(0,0,0,0.1)'
-            }
-            main_style = {
-                'flexGrow': '1', 'padding': '20px', 'height': '100vh', 'overflowY': 'auto',
-                'background': CORPORATE_COLORS['white']
-            }
+            # Los gráficos CENABAST quedan ocultos: no se agregan ni se construyen; se
+            # calculan recién cuando el usuario vuelve a "Con y Sin"
+            fig_unidades_cenabast = None
+            fig_ventas_cenabast = None
+            fig_precio_cenabast = None
+            
+            # Estilos de contenedores CENABAST (ocultos)
+            style_cenabast = style_hidden
         
-        return sidebar_style, main_style, {'collapsed': new_collapsed}
-
+        # Información de datos
+        if usar_base:
+            totales = data_processor.derived['totales_base'][cenabast]
+            total_registros, total_unidades, total_ventas = totales['registros'], totales['unidades'], totales['ventas']
+        else:
+            total_registros = len(df_filtrado)
+            total_unidades = df_filtrado['unidades'].sum()
+            total_ventas = df_filtrado['ventas'].sum()
+        precio_promedio = (total_ventas / total_unidades) if total_unidades > 0 else 0
+        
+        info_text = f"""
+        📊 Registros mostrados: {total_registros:,} | 
+        📦 Total Unidades: {total_unidades:,.0f} | 
+        💰 Total Ventas: ${total_ventas:,.0f} | 
+        💵 Precio Promedio: ${precio_promedio:,.0f}
+        {' | 🏥 Modo: Con y Sin CENABAST (6 gráficos)' if mostrar_cenabast else f' | 🏥 Modo: {cenabast.upper()}'}
+        """
+        
+        # Figuras listas para enviar (None = gráfico oculto, no se calcula)
+        figuras = {
+            'grafico-unidades': fig_unidades,
+            'grafico-ventas': fig_ventas,
+            'grafico-precio': fig_precio,
+            'grafico-unidades-cenabast': fig_unidades_cenabast,
+            'grafico-ventas-cenabast': fig_ventas_cenabast,
+            'grafico-precio-cenabast': fig_precio_cenabast
+        }
+        figuras = {id_grafico: preparar_figura(fig) if fig is not None else None
+                   for id_grafico, fig in figuras.items()}
+        fase('graficos')
+        
+        return {
+            'figuras': figuras,
+            'estilos': (style_visible, style_visible, style_visible,
+                        style_cenabast, style_cenabast, style_cenabast),
+            'info': info_text
+        }
+    
+    # Requests idénticos concurrentes comparten un solo cálculo; los resultados quedan en caché
+    calculos_en_curso = SingleFlight()
+    resultados = CacheLRU(CACHE_ENTRADAS)
+    # Estados del prefetch especulativo: caché propia para no desplazar a los precalentados
+    especulativos = CacheLRU(max(1, PREFETCH_MAX))
+    
+    def clave_estado(estado):
+        return clave_filtros(estado['principios'], estado['organismos'], estado['concentraciones'],
+                             estado['grupos'], estado['vista'], estado['cenabast'], estado['opciones'],
+                             data_processor.generacion)
+    
+    def obtener_dashboard(estado, cancelado=None):
+        """Resultado de calcular_dashboard para un estado de filtros: (resultado, origen)
+        
+        origen es ORIGEN_CACHE, ORIGEN_COMPARTIDO (esperó un cálculo idéntico en curso)
+        u ORIGEN_CALCULADO.
+        Con cancelado (Event del prefetch) el cálculo es especulativo: se guarda
+        aparte y un request real que lo usa lo pasa a la caché principal.
+        """
+        especulativo = cancelado is not None
+        clave = clave_estado(estado)
+        resultado = resultados.obtener(clave)
+        if resultado is not None:
+            return resultado, ORIGEN_CACHE
+        resultado = especulativos.obtener(clave)
+        if resultado is not None:
+            if not especulativo:
+                resultados.guardar(clave, resultado)
+            return resultado, ORIGEN_CACHE
+        
+        while True:
+            try:
+                return calculos_en_curso.ejecutar(clave, lambda: calcular_dashboard(
+                    estado['principios'], estado['organismos'], estado['concentraciones'], estado['grupos'],
+                    estado['vista'], estado['cenabast'], estado['opciones'], cancelado),
+                    especulativos if especulativo else resultados)
+            except PrefetchCancelado:
+                # El request real esperaba un cálculo especulativo que se canceló: se calcula de nuevo
+                if especulativo:
+                    raise
+    
+    # Estados más consultados precalculados al terminar la carga de datos
+    iniciar_precalentamiento(data_processor, lambda estado: obtener_dashboard(estado)[1])
+    
+    # Otras vistas y opciones CENABAST del último request, calculadas mientras el servidor está ocioso
+    prefetch = crear_prefetch(lambda estado, cancelado: obtener_dashboard(estado, cancelado)[1],
+                              lambda estado: clave_estado(estado) in resultados or clave_estado(estado) in especulativos)
+    
     # Callback principal para actualizar gráficos - ACTUALIZADO PARA 6 GRÁFICOS
     @app.callback(
         [Output('grafico-unidades', 'figure'),
@@ -170,18 +461,41 @@ def register_callbacks(app, data_processor):
          Output('container-unidades-cenabast', 'style'),
          Output('container-ventas-cenabast', 'style'),
          Output('container-precio-cenabast', 'style'),
-         Output('info-datos', 'children')],
+         Output('info-datos', 'children'),
+         Output('firma-graficos', 'data')],
         [Input('filtro-principio-activo', 'value'),
          Input('filtro-organismo', 'value'),
          Input('filtro-concentracion', 'value'),
          Input('filtro-grupo-proveedor', 'value'),
          Input('selector-vista', 'value'),
          Input('filtro-cenabast', 'value'),
-         Input('opciones-adicionales', 'value')]
+         Input('opciones-adicionales', 'value'),
+         Input('estado-carga', 'data')],
+        [State('firma-graficos', 'data')]
     )
-    def actualizar_dashboard_6_graficos(principios, organismos, concentraciones, grupos, vista, cenabast, opciones):
+    def actualizar_dashboard_6_graficos(principios, organismos, concentraciones, grupos, vista, cenabast, opciones,
+                                        estado_carga, firmas_previas):
         """Actualiza todos los gráficos (6 en total) y la información del dashboard"""
         
+        # Mientras la carga en segundo plano no termina se muestra el progreso
+        if not data_processor.is_ready():
+            fig_empty = go.Figure()
+            fig_empty.add_annotation(text="Cargando datos...", x=0.5, y=0.5, showarrow=False)
+            
+            style_visible = {'width': '100%', 'marginBottom': '20px', 'padding': '0 10px'}
+            style_hidden = {'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'}
+            
+            estado = data_processor.load_status
+            if estado['estado'] == 'error':
+                texto_carga = f"❌ Error al cargar los datos: {estado['mensaje']}"
+            else:
+                texto_carga = f"⏳ Cargando datos... {estado['progreso']}% - {estado['mensaje']}"
+            
+            return (fig_empty, fig_empty, fig_empty, fig_empty, fig_empty, fig_empty,
+                    style_visible, style_visible, style_visible,
+                    style_hidden, style_hidden, style_hidden,
+                    texto_carga, {})
+        
         # Verificar que tenemos datos
         if data_processor.df is None or len(data_processor.df) == 0:
             fig_empty = go.Figure()
@@ -194,90 +508,197 @@ def register_callbacks(app, data_processor):
             return (fig_empty, fig_empty, fig_empty, fig_empty, fig_empty, fig_empty,
                     style_visible, style_visible, style_visible,
                     style_hidden, style_hidden, style_hidden,
-                    "No hay datos para mostrar")
+                    "No hay datos para mostrar", {})
         
-        # Filtrar datos
-        df_filtrado = filtrar_datos(
-            data_processor.df, principios, organismos, concentraciones, grupos, 
-            cenabast, opciones
-        )
+        # Resultado en caché, o un solo cálculo para requests idénticos en curso
+        estado = {
+            'principios': principios, 'organismos': organismos, 'concentraciones': concentraciones,
+            'grupos': grupos, 'vista': vista, 'cenabast': cenabast, 'opciones': opciones
+        }
+        if prefetch is None:
+            resultado, origen = obtener_dashboard(estado)
+        else:
+            prefetch.inicio_request()
+            try:
+                resultado, origen = obtener_dashboard(estado)
+            finally:
+                prefetch.fin_request(estado)
+        registrar_cache(origen == ORIGEN_CACHE)
+        if origen == ORIGEN_COMPARTIDO:
+            registrar_coalescencia()
+        if origen != ORIGEN_CALCULADO:
+            reiniciar_marca()
         
-        # Estilos para los contenedores - Layout apilado
-        style_visible = {'width': '100%', 'marginBottom': '20px', 'padding': '0 10px'}
-        style_hidden = {'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'}
+        # Solo se envían las partes de cada figura que cambiaron respecto del navegador
+        firmas_previas = firmas_previas or {}
+        salidas, firmas = [], {}
+        for id_grafico, preparada in resultado['figuras'].items():
+            if preparada is None:
+                # Gráfico oculto: el navegador conserva la figura que ya tenía
+                salidas.append(dash.no_update)
+                firmas[id_grafico] = firmas_previas.get(id_grafico)
+                continue
+            salida, firmas[id_grafico] = actualizar_figura_parcial(preparada, firmas_previas.get(id_grafico))
+            salidas.append(salida)
         
-        # Crear gráficos básicos
-        if cenabast in ['con', 'ambos']:
-            # Datos con CENABAST
-            df_con_cenabast = df_filtrado.copy()
-            df_agregado_con = agregar_datos_por_vista(df_con_cenabast, vista, 'con')
-            
-            fig_unidades = crear_grafico_unidades(df_agregado_con, vista, 'con')
-            fig_ventas = crear_grafico_ventas(df_agregado_con, vista, 'con')
-            fig_precio = crear_grafico_precio(df_agregado_con, vista, 'con')
-        elif cenabast == 'sin':
-            # Datos sin CENABAST
-            df_sin_cenabast = df_filtrado[df_filtrado['es_cenabast'] == False].copy()
-            df_agregado_sin = agregar_datos_por_vista(df_sin_cenabast, vista, 'sin')
-            
-            fig_unidades = crear_grafico_unidades(df_agregado_sin, vista, 'sin')
-            fig_ventas = crear_grafico_ventas(df_agregado_sin, vista, 'sin')
-            fig_precio = crear_grafico_precio(df_agregado_sin, vista, 'sin')
-        else:  # solo
-            # Solo datos CENABAST
-            df_solo_cenabast = df_filtrado[df_filtrado['es_cenabast'] == True].copy()
-            df_agregado_solo = agregar_datos_por_vista(df_solo_cenabast, vista, 'solo')
-            
-            fig_unidades = crear_grafico_unidades(df_agregado_solo, vista, 'solo')
-            fig_ventas = crear_grafico_ventas(df_agregado_solo, vista, 'solo')
-            fig_precio = crear_grafico_precio(df_agregado_solo, vista, 'solo')
+        return (*salidas, *resultado['estilos'], resultado['info'], firmas)
+
+    # Límites del slider de fechas cuando terminan de cargar los datos
+    @app.callback(
+        [Output('filtro-rango-fechas', 'min'),
+         Output('filtro-rango-fechas', 'max'),
+         Output('filtro-rango-fechas', 'marks'),
+         Output('filtro-rango-fechas', 'value'),
+         Output('filtro-rango-fechas', 'disabled')],
+        [Input('estado-carga', 'data')]
+    )
+    def configurar_rango_fechas(estado_carga):
+        """Ajusta el slider al primer y último mes con licitaciones"""
+        acumulados = data_processor.derived.get('acumulados') if data_processor.is_ready() else None
+        if not acumulados:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update, True
         
-        # Determinar si mostrar gráficos CENABAST
-        mostrar_cenabast = cenabast == 'ambos'
+        inicio, fin = acumulados['mes_inicial'], acumulados['mes_final']
+        return inicio, fin, marcas_slider(inicio, fin), [inicio, fin], False
+    
+    # Totales del rango de fechas: O(1) por grupo con las sumas acumuladas del procesador
+    @app.callback(
+        Output('kpi-rango', 'children'),
+        [Input('filtro-rango-fechas', 'value'),
+         Input('filtro-principio-activo', 'value'),
+         Input('filtro-organismo', 'value'),
+         Input('filtro-concentracion', 'value'),
+         Input('filtro-grupo-proveedor', 'value'),
+         Input('filtro-cenabast', 'value'),
+         Input('opciones-adicionales', 'value')],
+        [State('filtro-rango-fechas', 'disabled')]
+    )
+    def actualizar_kpi_rango(rango, principios, organismos, concentraciones, grupos, cenabast, opciones,
+                             deshabilitado):
+        """Unidades, ventas y precio ponderado del rango de fechas seleccionado"""
+        acumulados = data_processor.derived.get('acumulados') if data_processor.is_ready() else None
+        if not acumulados or deshabilitado or not rango:
+            return ''
         
-        if mostrar_cenabast:
-            # Crear gráficos específicos de CENABAST
-            df_cenabast_separado = df_filtrado[df_filtrado['es_cenabast'] == True].copy()
-            df_agregado_cenabast = agregar_datos_por_vista(df_cenabast_separado, vista, 'solo')
-            
-            fig_unidades_cenabast = crear_grafico_unidades_cenabast(df_agregado_cenabast, vista)
-            fig_ventas_cenabast = crear_grafico_ventas_cenabast(df_agregado_cenabast, vista)
-            fig_precio_cenabast = crear_grafico_precio_cenabast(df_agregado_cenabast, vista)
-            
-            # Estilos de contenedores CENABAST (visibles)
-            style_cenabast = style_visible
+        desde, hasta = rango
+        if organismos or concentraciones:
+            # Organismo y concentración no forman parte del índice: suma sobre las filas filtradas
+            df = data_processor.df
+            mascara = mascara_filtros(df, principios, organismos, concentraciones, grupos, cenabast, opciones)
+            meses = df['año'] * 12 + df['mes'] - 1
+            mascara &= (meses >= desde) & (meses <= hasta)
+            unidades, ventas = df.loc[mascara, 'unidades'].sum(), df.loc[mascara, 'ventas'].sum()
+            totales = {'unidades': unidades, 'ventas': ventas,
+                       'precio': ventas / unidades if unidades > 0 else 0}
         else:
-            # Gráficos vacíos cuando no se muestran CENABAST
-            fig_empty = go.Figure()
-            fig_unidades_cenabast = fig_empty
-            fig_ventas_cenabast = fig_empty  
-            fig_precio_cenabast = fig_empty
-            
-            # Estilos de contenedores CENABAST (ocultos)
-            style_cenabast = style_hidden
+            totales = totales_rango(acumulados, desde, hasta, principios, grupos, cenabast, opciones)
         
-        # Información de datos
-        total_registros = len(df_filtrado)
-        total_unidades = df_filtrado['unidades'].sum()
-        total_ventas = df_filtrado['ventas'].sum()
-        precio_promedio = (df_filtrado['ventas'].sum() / df_filtrado['unidades'].sum()) if df_filtrado['unidades'].sum() > 0 else 0
+        return (f"📅 {etiqueta_mes(desde)} a {etiqueta_mes(hasta)}: "
+                f"📦 Unidades: {totales['unidades']:,.0f} | "
+                f"💰 Ventas: ${totales['ventas']:,.0f} | "
+                f"💵 Precio Ponderado: ${totales['precio']:,.0f}")
+    
+    # Barra clickeada en unidades o ventas -> selección para la tabla de detalle
+    @app.callback(
+        [Output('seleccion-detalle', 'data'),
+         Output('tabla-detalle', 'page_current')],
+        [Input('grafico-unidades', 'clickData'),
+         Input('grafico-ventas', 'clickData'),
+         Input('filtro-principio-activo', 'value'),
+         Input('filtro-organismo', 'value'),
+         Input('filtro-concentracion', 'value'),
+         Input('filtro-grupo-proveedor', 'value'),
+         Input('selector-vista', 'value'),
+         Input('filtro-cenabast', 'value'),
+         Input('opciones-adicionales', 'value')],
+        [State('firma-graficos', 'data')]
+    )
+    def seleccionar_detalle(click_unidades, click_ventas, principios, organismos, concentraciones, grupos,
+                            vista, cenabast, opciones, firmas):
+        """Guarda período, serie y filtros de la barra clickeada; un cambio de filtros cierra el detalle"""
+        id_grafico = callback_context.triggered_id
+        if id_grafico not in ('grafico-unidades', 'grafico-ventas'):
+            return None, 0
         
-        info_text = f"""
-        📊 Registros mostrados: {total_registros:,} | 
-        📦 Total Unidades: {total_unidades:,.0f} | 
-        💰 Total Ventas: ${total_ventas:,.0f} | 
-        💵 Precio Promedio: ${precio_promedio:,.0f}
-        {' | 🏥 Modo: Con y Sin CENABAST (6 gráficos)' if mostrar_cenabast else f' | 🏥 Modo: {cenabast.upper()}'}
-        """
+        click = click_unidades if id_grafico == 'grafico-unidades' else click_ventas
+        puntos = (click or {}).get('points') or []
+        nombres = ((firmas or {}).get(id_grafico) or {}).get('nombres') or []
+        if not puntos or puntos[0].get('curveNumber', len(nombres)) >= len(nombres):
+            return dash.no_update, dash.no_update
         
-        return (fig_unidades, fig_ventas, fig_precio,
-                fig_unidades_cenabast, fig_ventas_cenabast, fig_precio_cenabast,
-                style_visible, style_visible, style_visible,
-                style_cenabast, style_cenabast, style_cenabast,
-                info_text)
-
-    # Callback para limpiar valores de filtros que ya no están disponibles
+        serie = nombres[puntos[0]['curveNumber']]
+        return {
+            'grafico': id_grafico,
+            'periodo': puntos[0]['x'],
+            'serie': serie,
+            # "Otros" son los proveedores que no tienen serie propia en el gráfico
+            'excluir': [n for n in nombres if n != NOMBRE_OTROS] if serie == NOMBRE_OTROS else None,
+            'vista': vista,
+            'filtros': {
+                'principios': principios, 'organismos': organismos, 'concentraciones': concentraciones,
+                'grupos': grupos, 'cenabast': cenabast, 'opciones': opciones
+            },
+            'generacion': data_processor.generacion
+        }, 0
+    
+    # Página visible de la tabla de detalle: filtro, orden y paginación en el servidor
+    detalles = CacheLRU(CACHE_DETALLE)
+    
     @app.callback(
+        [Output('tabla-detalle', 'data'),
+         Output('tabla-detalle', 'page_count'),
+         Output('titulo-detalle', 'children'),
+         Output('container-detalle', 'style')],
+        [Input('seleccion-detalle', 'data'),
+         Input('tabla-detalle', 'page_current'),
+         Input('tabla-detalle', 'page_size'),
+         Input('tabla-detalle', 'sort_by'),
+         Input('tabla-detalle', 'filter_query')]
+    )
+    def actualizar_tabla_detalle(seleccion, page_current, page_size, sort_by, filter_query):
+        """Devuelve solo la página pedida de las licitaciones de la barra seleccionada"""
+        style_visible = {'width': '100%', 'marginBottom': '20px', 'padding': '0 10px'}
+        style_hidden = {'width': '100%', 'display': 'none', 'marginBottom': '20px', 'padding': '0 10px'}
+        
+        # Sin selección, o la selección es de datos anteriores a una recarga
+        if (not seleccion or not data_processor.is_ready() or
+                seleccion.get('generacion') != data_processor.generacion or
+                'indice_filas' not in data_processor.derived):
+            return [], 1, '', style_hidden
+        
+        # La selección se arma una vez por clic; paginar solo recorta la tabla ya ordenada
+        clave = _hash_json(seleccion)
+        clave_tabla = (clave, _hash_json(sort_by or []), filter_query or '')
+        tabla = detalles.obtener(clave_tabla)
+        if tabla is None:
+            formateadas = detalles.obtener(clave)
+            if formateadas is None:
+                filas = filas_seleccion(data_processor.df, data_processor.derived['indice_filas'], seleccion)
+                formateadas = formatear_detalle(filas)
+                detalles.guardar(clave, formateadas)
+            tabla = filtrar_y_ordenar_detalle(formateadas, sort_by, filter_query)
+            detalles.guardar(clave_tabla, tabla)
+        registros, paginas, total = pagina_detalle(tabla, page_current, page_size)
+        
+        titulo = f"🔎 Detalle: {seleccion['serie']} - {seleccion['periodo']} ({total:,} licitaciones)"
+        return registros, paginas, titulo, style_visible
+
+    # Enlaces de exportación con los filtros actuales, armados en el navegador
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='enlaces_exportacion'),
+        [Output('exportar-csv', 'href'),
+         Output('exportar-xlsx', 'href')],
+        [Input('filtro-principio-activo', 'value'),
+         Input('filtro-organismo', 'value'),
+         Input('filtro-concentracion', 'value'),
+         Input('filtro-grupo-proveedor', 'value'),
+         Input('filtro-cenabast', 'value'),
+         Input('opciones-adicionales', 'value')]
+    )
+
+    # Limpieza de valores de filtros que ya no están disponibles, en el navegador
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='limpiar_valores_filtros'),
         [Output('filtro-principio-activo', 'value'),
          Output('filtro-organismo', 'value'),
          Output('filtro-concentracion', 'value'),
@@ -291,20 +712,3 @@ def register_callbacks(app, data_processor):
          State('filtro-concentracion', 'value'),
          State('filtro-grupo-proveedor', 'value')]
     )
-    def limpiar_valores_filtros(opt_principio, opt_organismo, opt_concentracion, opt_grupo,
-                               val_principio, val_organismo, val_concentracion, val_grupo):
-        """Limpia valores seleccionados que ya no están disponibles en las opciones actualizadas"""
-        
-        # Obtener valores disponibles de las opciones
-        valores_disponibles_principio = [opt['value'] for opt in opt_principio] if opt_principio else []
-        valores_disponibles_organismo = [opt['value'] for opt in opt_organismo] if opt_organismo else []
-        valores_disponibles_concentracion = [opt['value'] for opt in opt_concentracion] if opt_concentracion else []
-        valores_disponibles_grupo = [opt['value'] for opt in opt_grupo] if opt_grupo else []
-        
-        # Filtrar valores seleccionados que aún están disponibles
-        nuevos_principios = [v for v in (val_principio or []) if v in valores_disponibles_principio]
-        nuevos_organismos = [v for v in (val_organismo or []) if v in valores_disponibles_organismo]
-        nuevas_concentraciones = [v for v in (val_concentracion or []) if v in valores_disponibles_concentracion]
-        nuevos_grupos = [v for v in (val_grupo or []) if v in valores_disponibles_grupo]
-        
-        return nuevos_principios, nuevos_organismos, nuevas_concentraciones, nuevos_grupos
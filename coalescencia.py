@@ -0,0 +1,110 @@
+"""
+Coalescencia de cálculos idénticos concurrentes (single-flight)
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Cuando varios usuarios abren el dashboard a la vez con los mismos filtros, el
+primer request calcula y los demás esperan ese mismo cálculo en lugar de
+repetirlo. La clave debe incluir el estado canónico de los filtros y la
+generación de los datos, para no compartir resultados entre recargas.
+
+CacheLRU guarda los resultados ya calculados (por ejemplo los que deja el
+precalentamiento al arrancar) con un máximo de entradas.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+# Origen del resultado que devuelve SingleFlight.ejecutar
+ORIGEN_CACHE = 'cache'            # ya estaba en la caché
+ORIGEN_COMPARTIDO = 'compartido'  # esperó un cálculo idéntico iniciado por otro request
+ORIGEN_CALCULADO = 'calculado'    # lo calculó este request
+
+
+class _Llamada:
+    """Cálculo en curso para una clave"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """Ejecuta una sola vez cada cálculo en curso y comparte su resultado"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso = {}
+
+    def ejecutar(self, clave, funcion, cache=None):
+        """Ejecuta funcion() o espera a la ejecución en curso con la misma clave
+
+        Retorna (resultado, origen) con origen ORIGEN_CACHE, ORIGEN_COMPARTIDO u
+        ORIGEN_CALCULADO; solo ORIGEN_COMPARTIDO es una espera real de coalescencia.
+        Si el cálculo falla, la excepción se propaga a todos los que lo esperaban.
+
+        Con cache (CacheLRU) el resultado se guarda antes de quitar el cálculo en
+        curso: un request que llega en el medio lo encuentra en uno de los dos.
+        """
+        with self._lock:
+            if cache is not None:
+                resultado = cache.obtener(clave)
+                if resultado is not None:
+                    return resultado, ORIGEN_CACHE
+            llamada = self._en_curso.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = self._en_curso[clave] = _Llamada()
+
+        if not lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado, ORIGEN_COMPARTIDO
+
+        try:
+            llamada.resultado = funcion()
+            if cache is not None:
+                cache.guardar(clave, llamada.resultado)
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            llamada.evento.set()
+        return llamada.resultado, ORIGEN_CALCULADO
+
+
+class CacheLRU:
+    """Caché acotada que descarta primero las entradas usadas hace más tiempo"""
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """Valor guardado para la clave o None"""
+        with self._lock:
+            if clave not in self._entradas:
+                return None
+            self._entradas.move_to_end(clave)
+            return self._entradas[clave]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def __contains__(self, clave):
+        with self._lock:
+            return clave in self._entradas
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
@@ -4,22 +4,102 @@ Autor: Sistema automatizado
 Fecha: Junio 2025
 """
 
+import os
+import time
+import pickle
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+    pa_ipc = None
+
+
+# Archivo Arrow IPC compartido entre workers (se abre con memory-map)
+ARROW_CACHE_PATH = os.environ.get('DASHBOARD_ARROW_PATH', 'data/dashboard_dataset.arrow')
+
+# Versión del formato persistido; incrementar si cambia process_data
+ARROW_FORMAT_VERSION = '1'
+
+# Snapshot de las estructuras derivadas (los datos se abren desde el archivo Arrow)
+SNAPSHOT_PATH = os.environ.get('DASHBOARD_SNAPSHOT_PATH', 'data/dashboard_snapshot.pkl')
+SNAPSHOT_VERSION = '2'
+
+# Columnas de filtro indexadas para generar opciones sin recorrer el DataFrame
+FACET_COLUMNS = ['principio_activo', 'organismo', 'concentracion', 'grupo_proveedor']
+
+# Vistas temporales y modos CENABAST de los agregados precalculados sin filtros
+VISTAS = ('anual', 'mensual', 'mensualizado')
+MODOS_CENABAST = ('con', 'sin', 'solo', 'ambos')
+
+# Vistas cuyos agregados sin filtros se calculan en segundo plano después de
+# marcar los datos como listos (no demoran el arranque ni el snapshot)
+VISTAS_DIFERIDAS = ('mensualizado',)
+
+
+def calcular_version_codigo():
+    """Hash del código que genera el estado derivado; invalida snapshots tras un deploy"""
+    hash_codigo = hashlib.sha1(SNAPSHOT_VERSION.encode())
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    for nombre in ('data_processor.py', 'utils.py', 'detalle.py', 'indice_temporal.py'):
+        with open(os.path.join(directorio, nombre), 'rb') as f:
+            hash_codigo.update(f.read())
+    return hash_codigo.hexdigest()
+
 
 class OptimizedDataProcessor:
     """Procesador de datos optimizado para el dashboard farmacéutico"""
     
-    def __init__(self):
+    def __init__(self, arrow_path=None, snapshot_path=None):
         self.df = None
         self.file_path = None
+        self.arrow_path = arrow_path or ARROW_CACHE_PATH
+        self.arrow_table = None
+        self.snapshot_path = snapshot_path or SNAPSHOT_PATH
+        self.derived = {}
+        self._lock_agregados = threading.Lock()
+        self.load_info = {}
+        self.load_status = {'estado': 'pendiente', 'progreso': 0, 'mensaje': ''}
+        self.ready = threading.Event()
+        # Generación de los datos: aumenta con cada carga completada (invalida resultados previos)
+        self.generacion = 0
+    
+    def is_ready(self):
+        """Indica si el dataset terminó de cargarse y puede consultarse"""
+        return self.ready.is_set()
+    
+    def _actualizar_estado(self, estado, progreso, mensaje=''):
+        """Actualiza el estado de carga que reporta el endpoint de readiness"""
+        self.load_status = {'estado': estado, 'progreso': progreso, 'mensaje': mensaje}
+    
+    def load_data_async(self, file_path=None):
+        """Carga los datos en un hilo de fondo para no bloquear el arranque del servidor"""
+        hilo = threading.Thread(target=self._load_data_background, args=(file_path,),
+                                name='carga-datos', daemon=True)
+        hilo.start()
+        return hilo
+    
+    def _load_data_background(self, file_path):
+        """Ejecuta load_data registrando errores en el estado de carga"""
+        try:
+            self.load_data(file_path)
+        except Exception as e:
+            print(f"Error en la carga de datos en segundo plano: {str(e)}")
+            self._actualizar_estado('error', self.load_status.get('progreso', 0), str(e))
         
     def load_data(self, file_path=None):
         """Carga y procesa los datos del archivo Excel"""
         
+        t0 = time.time()
+        self._actualizar_estado('cargando', 5, 'Buscando archivo de datos')
+        
         # Intentar diferentes rutas para el archivo
         paths_to_try = []
         if file_path:
@@ -34,13 +114,43 @@ class OptimizedDataProcessor:
         for path in paths_to_try:
             try:
                 print(f"Intentando cargar datos desde: {path}")
+                fingerprint = self.source_fingerprint(path)
+                
+                self._actualizar_estado('cargando', 10, f'Leyendo {path}')
+                
+                # Reutilizar el dataset ya procesado por otro worker si corresponde a esta fuente
+                # (memory-map compartido) y adjuntarle las estructuras derivadas del snapshot
+                if self.open_arrow(fingerprint):
+                    self.file_path = path
+                    if self.restore_snapshot(fingerprint):
+                        self._registrar_carga('snapshot', t0)
+                        return
+                    self._actualizar_estado('cargando', 70, 'Construyendo estructuras derivadas')
+                    self.build_derived_state()
+                    self.save_snapshot(fingerprint)
+                    self._registrar_carga('arrow', t0)
+                    return
+                
                 self.df = pd.read_excel(path, sheet_name='Data')
+                self.arrow_table = None
                 self.file_path = path
                 print(f"Datos cargados exitosamente: {self.df.shape[0]} filas, {self.df.shape[1]} columnas")
                 
                 # Procesar datos
+                self._actualizar_estado('cargando', 50, 'Procesando datos')
                 self.process_data()
                 print("Procesamiento de datos completado exitosamente")
+                
+                # Persistir y reabrir con memory-map para compartir páginas entre workers
+                if self.persist_arrow(fingerprint):
+                    self.open_arrow(fingerprint)
+                
+                self._actualizar_estado('cargando', 80, 'Construyendo estructuras derivadas')
+                self.build_derived_state()
+                # El snapshot solo sirve junto al archivo Arrow del que se restauran los datos
+                if self.arrow_table is not None:
+                    self.save_snapshot(fingerprint)
+                self._registrar_carga('excel', t0)
                 return
                 
             except Exception as e:
@@ -49,7 +159,207 @@ class OptimizedDataProcessor:
         
         # Si no se pudo cargar ningún archivo, crear datos de muestra
         print("No se pudo cargar el archivo Excel. Creando datos de muestra...")
+        self.arrow_table = None
         self.create_sample_data()
+        self.build_derived_state()
+        self._registrar_carga('muestra', t0)
+    
+    def _registrar_carga(self, origen, t0):
+        """Guarda el origen y la duración de la carga"""
+        self.load_info = {'origen': origen, 'segundos': round(time.time() - t0, 3)}
+        print(f"Carga completada desde {origen} en {self.load_info['segundos']:.3f}s")
+        self.generacion += 1
+        self._actualizar_estado('listo', 100, f'Datos cargados desde {origen}')
+        self.ready.set()
+        self.build_agregados_diferidos_async()
+    
+    def build_agregados_diferidos_async(self):
+        """Calcula en un hilo daemon los agregados sin filtros de VISTAS_DIFERIDAS
+        
+        Corre apenas los datos quedan listos; una consulta que llega antes espera
+        el mismo cálculo en get_agregados_base en lugar de repetirlo.
+        """
+        def ejecutar():
+            for vista in VISTAS_DIFERIDAS:
+                try:
+                    self.get_agregados_base(vista, 'con')
+                except Exception as e:
+                    print(f"Error al precalcular los agregados de la vista {vista}: {str(e)}")
+        
+        hilo = threading.Thread(target=ejecutar, name='agregados-diferidos', daemon=True)
+        hilo.start()
+        return hilo
+    
+    def build_derived_state(self):
+        """Construye las estructuras derivadas que se reutilizan entre requests"""
+        from utils import asignar_colores_proveedores
+        from detalle import construir_indice_filas
+        from indice_temporal import construir_acumulados
+        
+        self.derived = {
+            'facetas': self.build_facet_index(),
+            'colores': asignar_colores_proveedores(self.df, 'grupo_proveedor')[0],
+            'resumen_anual': self.build_resumen_anual(),
+            'indice_filas': construir_indice_filas(self.df),
+            'acumulados': construir_acumulados(self.df),
+            **self.build_agregados_base()
+        }
+    
+    def build_facet_index(self):
+        """Valores únicos ordenados de cada filtro, por modo CENABAST"""
+        subconjuntos = {
+            'todos': self.df,
+            'sin': self.df[self.df['es_cenabast'] == False],
+            'solo': self.df[self.df['es_cenabast'] == True]
+        }
+        return {
+            modo: {col: sorted(df_modo[col].dropna().unique()) for col in FACET_COLUMNS}
+            for modo, df_modo in subconjuntos.items()
+        }
+    
+    def build_resumen_anual(self):
+        """Unidades y ventas sumadas por principio activo, organismo, grupo proveedor y año
+        
+        Es la granularidad que consulta la API /data: mucho más chica que los registros
+        de licitaciones y suficiente para filtrar por principio, organismo y año.
+        """
+        return (
+            self.df.groupby(['principio_activo', 'organismo', 'grupo_proveedor', 'año'], observed=True)
+            [['unidades', 'ventas']].sum()
+            .reset_index()
+        )
+    
+    def build_agregados_base(self):
+        """Agregados sin filtros de cada vista y modo CENABAST (con participación de mercado)
+        
+        Son las tablas que muestra el dashboard al abrirse, iguales a las de
+        agregar_datos_por_vista sobre filtrar_datos sin filtros. Se guardan junto con
+        los totales de cada modo para el texto informativo. Las de VISTAS_DIFERIDAS
+        (la mensualizada expande cada contrato a sus meses) se arman en segundo
+        plano al terminar la carga, ver build_agregados_diferidos_async.
+        """
+        t0 = time.time()
+        totales = {}
+        for modo in MODOS_CENABAST:
+            df_modo = self._datos_modo(modo)
+            totales[modo] = {
+                'registros': len(df_modo),
+                'unidades': df_modo['unidades'].sum(),
+                'ventas': df_modo['ventas'].sum()
+            }
+        agregados = {}
+        for vista in VISTAS:
+            if vista not in VISTAS_DIFERIDAS:
+                agregados.update(self._agregados_vista(vista))
+        print(f"Agregados sin filtros precalculados en {time.time() - t0:.2f}s")
+        return {'agregados_base': agregados, 'totales_base': totales}
+    
+    def _datos_modo(self, modo):
+        """Registros de un modo CENABAST sin otros filtros ('con' y 'ambos' no copian el DataFrame)"""
+        from utils import filtrar_datos
+        if modo in ('con', 'ambos'):
+            return self.df
+        return filtrar_datos(self.df, [], [], [], [], modo, [])
+    
+    def _agregados_vista(self, vista):
+        """Tablas sin filtros de una vista para los 4 modos CENABAST
+        
+        'con' se obtiene sumando los dos estados de la tabla de 'ambos' (mismos
+        registros), así el dataset completo se recorre una sola vez.
+        """
+        from utils import agregar_datos_por_vista, reagrupar_sin_separar_cenabast
+        
+        ambos = agregar_datos_por_vista(self.df, vista, 'ambos')
+        return {
+            (vista, 'ambos'): ambos,
+            (vista, 'con'): reagrupar_sin_separar_cenabast(ambos, vista),
+            (vista, 'sin'): agregar_datos_por_vista(self._datos_modo('sin'), vista, 'sin'),
+            (vista, 'solo'): agregar_datos_por_vista(self._datos_modo('solo'), vista, 'solo')
+        }
+    
+    def get_agregados_base(self, vista, cenabast):
+        """Tabla agregada sin filtros precalculada para la vista y el modo CENABAST (o None)
+        
+        Las vistas diferidas se calculan una vez por carga (en segundo plano o en
+        la primera consulta que llegue antes) y quedan en las estructuras derivadas.
+        """
+        derived = self.derived
+        agregados = derived.get('agregados_base')
+        if agregados is None or vista not in VISTAS or cenabast not in MODOS_CENABAST:
+            return None
+        if (vista, cenabast) not in agregados:
+            with self._lock_agregados:
+                if (vista, cenabast) not in agregados:
+                    t0 = time.time()
+                    agregados.update(self._agregados_vista(vista))
+                    print(f"Agregados sin filtros de la vista {vista} calculados en {time.time() - t0:.2f}s")
+        return agregados[(vista, cenabast)]
+    
+    def get_facet_values(self, cenabast):
+        """Opciones precalculadas de los filtros para un modo CENABAST (o None)"""
+        facetas = self.derived.get('facetas')
+        if not facetas:
+            return None
+        return facetas.get(cenabast if cenabast in ('sin', 'solo') else 'todos')
+    
+    def save_snapshot(self, fingerprint):
+        """Serializa las estructuras derivadas en un snapshot versionado
+        
+        El archivo son dos pickles seguidos: una cabecera chica (versión, versión de
+        código y huella de la fuente) y luego las estructuras. El DataFrame no se
+        guarda: se abre desde el archivo Arrow compartido entre workers.
+        """
+        try:
+            cabecera = {
+                'version': SNAPSHOT_VERSION,
+                'code_version': calcular_version_codigo(),
+                'fingerprint': fingerprint,
+                'registros': len(self.df)
+            }
+            directorio = os.path.dirname(self.snapshot_path)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cabecera, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self.derived, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+            print(f"Snapshot del procesador guardado en: {self.snapshot_path}")
+            return True
+        
+        except Exception as e:
+            print(f"No se pudo guardar el snapshot: {str(e)}")
+            return False
+    
+    def restore_snapshot(self, fingerprint):
+        """Adjunta al DataFrame abierto las estructuras derivadas del snapshot
+        
+        Solo si la huella de la fuente, la versión de código y la cantidad de
+        registros coinciden; la cabecera se valida antes de leer el resto del archivo.
+        """
+        if self.df is None or not os.path.exists(self.snapshot_path):
+            return False
+        
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                cabecera = pickle.load(f)
+                
+                if (not isinstance(cabecera, dict) or
+                        cabecera.get('version') != SNAPSHOT_VERSION or
+                        cabecera.get('fingerprint') != fingerprint or
+                        cabecera.get('registros') != len(self.df) or
+                        cabecera.get('code_version') != calcular_version_codigo()):
+                    print("Snapshot desactualizado, se reconstruirá el estado")
+                    return False
+                
+                self.derived = pickle.load(f)
+            print(f"Snapshot restaurado: estructuras derivadas de {len(self.df)} registros")
+            return True
+        
+        except Exception as e:
+            print(f"No se pudo restaurar el snapshot: {str(e)}")
+            return False
     
     def process_data(self):
         """Procesa y limpia los datos"""
@@ -118,6 +428,70 @@ class OptimizedDataProcessor:
         
         print(f"Datos procesados: {len(self.df)} registros finales")
     
+    @staticmethod
+    def source_fingerprint(path):
+        """Huella del archivo fuente (tamaño y fecha de modificación)"""
+        stat = os.stat(path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    
+    def persist_arrow(self, fingerprint):
+        """Guarda el dataset procesado como archivo Arrow IPC sin compresión"""
+        if pa is None or self.df is None:
+            return False
+        
+        try:
+            # 'año_mes' es un Period de pandas; se reconstruye al abrir desde 'fecha'
+            df_arrow = self.df.drop(columns=['año_mes'], errors='ignore')
+            table = pa.Table.from_pandas(df_arrow, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b'dashboard_fingerprint': fingerprint.encode(),
+                b'dashboard_version': ARROW_FORMAT_VERSION.encode()
+            })
+            
+            directorio = os.path.dirname(self.arrow_path)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            
+            # Escritura atómica: otros workers nunca ven un archivo a medio escribir
+            tmp_path = f"{self.arrow_path}.{os.getpid()}.tmp"
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa_ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, self.arrow_path)
+            print(f"Dataset Arrow guardado en: {self.arrow_path}")
+            return True
+        
+        except Exception as e:
+            print(f"No se pudo guardar el dataset Arrow: {str(e)}")
+            return False
+    
+    def open_arrow(self, fingerprint):
+        """Abre el dataset Arrow con memory-map si corresponde a la huella de la fuente"""
+        if pa is None or not os.path.exists(self.arrow_path):
+            return False
+        
+        try:
+            source = pa.memory_map(self.arrow_path, 'r')
+            table = pa_ipc.open_file(source).read_all()
+            metadata = table.schema.metadata or {}
+            if (metadata.get(b'dashboard_fingerprint') != fingerprint.encode() or
+                    metadata.get(b'dashboard_version') != ARROW_FORMAT_VERSION.encode()):
+                print("Dataset Arrow desactualizado, se reprocesará la fuente")
+                return False
+            
+            # split_blocks evita consolidar columnas: las numéricas sin nulos
+            # quedan apuntando a los buffers del archivo mapeado (sin copia)
+            self.arrow_table = table
+            self.df = table.to_pandas(split_blocks=True)
+            self.df['año_mes'] = self.df['fecha'].dt.to_period('M')
+            print(f"Dataset Arrow abierto con memory-map: {len(self.df)} registros")
+            return True
+        
+        except Exception as e:
+            print(f"No se pudo abrir el dataset Arrow: {str(e)}")
+            return False
+    
     def identify_cenabast_records(self):
         """Identifica registros relacionados con CENABAST"""
         cenabast_flags = pd.Series(False, index=self.df.index)
@@ -0,0 +1,215 @@
+"""
+Detalle de licitaciones detrás de una barra de los gráficos (drill-down)
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Al hacer clic en una barra (período × grupo proveedor) de los gráficos de
+unidades o ventas se muestra la tabla de licitaciones que la componen. La tabla
+pagina, ordena y filtra en el servidor: cada request devuelve solo la página
+visible. Las filas de la barra salen del índice grupo_proveedor → (año, mes) →
+posiciones que arma el procesador al cargar, sin recorrer todo el DataFrame; la
+selección ya formateada y su versión filtrada y ordenada se reutilizan entre
+páginas (ver callbacks.actualizar_tabla_detalle).
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from utils import mascara_filtros, distribucion_contratos, MESES_ESPANOL, NOMBRE_OTROS
+
+
+# Columnas que se muestran en la tabla de detalle
+COLUMNAS_DETALLE = [
+    ('fecha', 'Fecha'),
+    ('principio_activo', 'Principio Activo'),
+    ('organismo', 'Organismo'),
+    ('concentracion', 'Concentración'),
+    ('grupo_proveedor', 'Grupo Proveedor'),
+    ('es_cenabast', 'CENABAST'),
+    ('Duración de Contrato', 'Duración'),
+    ('unidades', 'Unidades'),
+    ('ventas', 'Ventas'),
+    ('precio', 'Precio')
+]
+
+FILAS_POR_PAGINA = 20
+
+NUMERO_MES = {nombre: i for i, nombre in enumerate(
+    ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+     'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'], start=1)}
+NUMERO_MES.update({ingles: NUMERO_MES[espanol] for ingles, espanol in MESES_ESPANOL.items()
+                   if espanol in NUMERO_MES})
+
+OPERADORES_FILTRO = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith ']
+]
+
+
+def construir_indice_filas(df):
+    """Posiciones de las filas por grupo_proveedor y (año, mes): {grupo: {(año, mes): posiciones}}"""
+    indice = {}
+    for (grupo, año, mes), posiciones in df.groupby(['grupo_proveedor', 'año', 'mes'],
+                                                    observed=True, sort=False).indices.items():
+        indice.setdefault(grupo, {})[(int(año), int(mes))] = posiciones
+    return indice
+
+
+def columnas_tabla(df_columnas=None):
+    """Definición de columnas para el DataTable de detalle"""
+    columnas = []
+    for columna, nombre in COLUMNAS_DETALLE:
+        if df_columnas is not None and columna not in df_columnas:
+            continue
+        definicion = {'name': nombre, 'id': columna}
+        if columna in ('unidades', 'ventas', 'precio'):
+            definicion.update(type='numeric', format={'specifier': ',.0f'})
+        columnas.append(definicion)
+    return columnas
+
+
+def periodo_a_meses(vista, periodo):
+    """Claves (año, mes) del índice para el valor del eje X clickeado en la vista dada
+
+    Plotly puede entregar el período convertido (2024 como número en la vista
+    anual, '2024-01-01' si interpretó '2024-01' como fecha en la mensual). En la
+    vista mensualizada cualquier mes de inicio puede aportar (se filtra después):
+    retorna None, es decir todos los meses del grupo.
+    """
+    texto = str(periodo)
+    if vista == 'anual':
+        año = int(float(texto))
+        return [(año, mes) for mes in range(1, 13)]
+    if vista == 'mensual':
+        return [(int(texto[:4]), int(texto[5:7]))]
+    return None
+
+
+def cubre_mes(filas, mes):
+    """Contratos cuya distribución mensualizada cae en el mes del año dado (1-12)"""
+    _, meses_distribucion, _ = distribucion_contratos(filas)
+    desfase = (mes - filas['mes'].to_numpy()) % 12
+    return desfase < meses_distribucion
+
+
+def filas_seleccion(df, indice, seleccion):
+    """Licitaciones de la barra seleccionada con los filtros vigentes al hacer clic
+
+    La serie clickeada es el grupo proveedor (los gráficos de unidades y ventas
+    no separan las series por CENABAST). En la vista mensualizada son los
+    contratos que reparten algún mes en el mes clickeado (de cualquier año).
+    La serie "Otros" son todos los grupos sin serie propia en el gráfico.
+    """
+    grupo = seleccion['serie']
+    excluir = seleccion.get('excluir')
+    if grupo == NOMBRE_OTROS and excluir is not None:
+        excluidos = set(excluir)
+        grupos = [g for g in indice if g not in excluidos]
+    else:
+        grupos = [grupo]
+    
+    claves = periodo_a_meses(seleccion['vista'], seleccion['periodo'])
+    posiciones = []
+    for g in grupos:
+        meses_grupo = indice.get(g, {})
+        if claves is None:
+            posiciones.extend(meses_grupo.values())
+        else:
+            posiciones.extend(meses_grupo[clave] for clave in claves if clave in meses_grupo)
+    if not posiciones:
+        return df.iloc[0:0]
+
+    filas = df.iloc[np.sort(np.concatenate(posiciones))]
+    filtros = seleccion['filtros']
+    mascara = mascara_filtros(filas, filtros['principios'], filtros['organismos'], filtros['concentraciones'],
+                              filtros['grupos'], filtros['cenabast'], filtros['opciones'])
+    if seleccion['vista'] == 'mensualizado':
+        mascara &= cubre_mes(filas, NUMERO_MES.get(str(seleccion['periodo'])))
+    return filas[mascara]
+
+
+def _separar_filtro(parte):
+    """Descompone una expresión '{columna} op valor' del filtro del DataTable"""
+    for operadores in OPERADORES_FILTRO:
+        for operador in operadores:
+            if operador not in parte:
+                continue
+            nombre, valor = parte.split(operador, 1)
+            nombre = nombre[nombre.find('{') + 1: nombre.rfind('}')]
+            valor = valor.strip()
+            if valor and valor[0] == valor[-1] and valor[0] in ('"', "'", '`'):
+                valor = valor[1:-1].replace('\\' + valor[0], valor[0])
+            else:
+                try:
+                    valor = float(valor)
+                except ValueError:
+                    pass
+            return nombre, operadores[0].strip(), valor
+    return None, None, None
+
+
+def aplicar_filtro_tabla(df, filter_query):
+    """Aplica el filter_query del DataTable (sintaxis de filtros nativa de Dash)"""
+    if not filter_query:
+        return df
+    for parte in filter_query.split(' && '):
+        columna, operador, valor = _separar_filtro(parte)
+        if columna not in df.columns:
+            continue
+        serie = df[columna]
+        if operador in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            if pd.api.types.is_numeric_dtype(serie):
+                if not isinstance(valor, float):
+                    continue
+            elif isinstance(valor, float):
+                valor = f'{valor:g}'
+            mascara = getattr(serie, operador)(valor)
+        elif operador == 'contains':
+            mascara = serie.astype(str).str.contains(str(valor), case=False, regex=False)
+        else:  # datestartswith
+            mascara = serie.astype(str).str.startswith(str(valor))
+        df = df[mascara]
+    return df
+
+
+def formatear_detalle(df):
+    """Columnas de la tabla formateadas como las ve el usuario (fecha ISO, CENABAST Sí/No)
+
+    Se formatea antes de filtrar para que el filtro del DataTable compare con lo
+    mismo que se muestra.
+    """
+    columnas = [columna for columna, _ in COLUMNAS_DETALLE if columna in df.columns]
+    df = df[columnas].copy()
+    if 'fecha' in df.columns:
+        df['fecha'] = df['fecha'].dt.strftime('%Y-%m-%d')
+    if 'es_cenabast' in df.columns:
+        df['es_cenabast'] = df['es_cenabast'].map({True: 'Sí', False: 'No'})
+    return df
+
+
+def filtrar_y_ordenar_detalle(df, sort_by, filter_query):
+    """Aplica el filtro y el orden del DataTable a la selección ya formateada"""
+    df = aplicar_filtro_tabla(df, filter_query)
+    if sort_by:
+        orden = [o for o in sort_by if o['column_id'] in df.columns]
+        if orden:
+            df = df.sort_values([o['column_id'] for o in orden],
+                                ascending=[o['direction'] == 'asc' for o in orden], kind='mergesort')
+    return df
+
+
+def pagina_detalle(df, page_current, page_size):
+    """Recorta la página pedida: (registros, cantidad de páginas, filas totales)"""
+    page_size = page_size or FILAS_POR_PAGINA
+    total = len(df)
+    paginas = max(1, math.ceil(total / page_size))
+    inicio = min(page_current or 0, paginas - 1) * page_size
+    return df.iloc[inicio:inicio + page_size].to_dict('records'), paginas, total
@@ -21,9 +21,14 @@ from pyngrok import ngrok
 from threading import Thread
 import time
 
+from serializacion import configurar_serializacion
+
 # Obtenemos la app de Dash del módulo importado
 app = dashboard_app.app
 
+# Comprimir las respuestas: todo el tráfico pasa por el túnel
+configurar_serializacion(app)
+
 def main():
     try:
         # Definir el puerto a utilizar
@@ -0,0 +1,193 @@
+"""
+Exportación de las licitaciones filtradas a CSV/XLSX en streaming
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Devuelve las filas que están detrás de los gráficos con los mismos filtros del
+dashboard (ver utils.mascara_filtros), sin armar el resultado completo en memoria:
+
+    GET /exportar?principio=X&organismo=Y&cenabast=sin&opciones=truncar_mes&formato=csv|xlsx|arrow
+
+- CSV: se escribe por bloques de filas y cada bloque se envía apenas está listo
+  (respuesta chunked); la memoria queda acotada por el tamaño del bloque
+- XLSX: openpyxl en modo write-only vuelca las filas a un archivo temporal que
+  luego se envía por bloques y se borra
+- Arrow: stream IPC de record batches tomados de la tabla Arrow del procesador
+  (sin filtros, rebanadas sin copia de los buffers mapeados); los clientes
+  leen con pyarrow.ipc.open_stream
+
+Cada bloque se genera en el hilo del request y entre bloques los demás hilos
+del servidor siguen atendiendo a otros usuarios.
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from flask import Response, jsonify, request, stream_with_context
+from openpyxl import Workbook
+
+from serializacion import TIPO_ARROW_STREAM, arrow_disponible, stream_arrow
+from utils import mascara_filtros
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# Filas por bloque (acota la memoria de la exportación)
+FILAS_POR_BLOQUE = int(os.environ.get('DASHBOARD_EXPORT_BLOQUE', '50000'))
+BYTES_POR_BLOQUE = 256 * 1024
+
+# Columnas exportadas (las derivadas para agrupar, como año_mes, quedan fuera)
+COLUMNAS_EXPORTACION = [
+    'principio_activo', 'organismo', 'concentracion', 'concentracion_base', 'forma',
+    'grupo_proveedor', 'es_cenabast', 'fecha', 'año', 'mes', 'mes_nombre',
+    'Duración de Contrato', 'unidades', 'ventas', 'precio'
+]
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'arrow': TIPO_ARROW_STREAM
+}
+
+
+def _valores_parametro(nombre):
+    """Valores de un parámetro repetido (los nombres de organismos pueden llevar comas)"""
+    return [v for v in request.args.getlist(nombre) if v.strip()]
+
+
+def _filtros_consulta():
+    """Filtros de la query con los nombres de argumentos de filtrar_datos"""
+    return {
+        'principios': _valores_parametro('principio'),
+        'organismos': _valores_parametro('organismo'),
+        'concentraciones': _valores_parametro('concentracion'),
+        'grupos': _valores_parametro('grupo'),
+        'cenabast': request.args.get('cenabast', 'ambos'),
+        'opciones': _valores_parametro('opciones')
+    }
+
+
+def _bloques(df, filas, columnas):
+    """DataFrames consecutivos de hasta FILAS_POR_BLOQUE filas de las posiciones dadas"""
+    posiciones = [df.columns.get_loc(c) for c in columnas]
+    for inicio in range(0, len(filas), FILAS_POR_BLOQUE):
+        yield df.iloc[filas[inicio:inicio + FILAS_POR_BLOQUE], posiciones]
+
+
+def generar_csv(df, filas, columnas):
+    """Genera el CSV por bloques (BOM para que Excel detecte UTF-8)"""
+    yield '\ufeff' + ','.join(columnas) + '\n'
+    for bloque in _bloques(df, filas, columnas):
+        yield bloque.to_csv(index=False, header=False, date_format='%Y-%m-%d')
+
+
+def _valor_celda(valor):
+    """Convierte escalares de NumPy/pandas a tipos que openpyxl acepta"""
+    if valor is None or valor is pd.NaT:
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    return valor
+
+
+def generar_xlsx(df, filas, columnas):
+    """Escribe el XLSX en modo write-only a un temporal y lo envía por bloques"""
+    archivo = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    archivo.close()
+    try:
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet('Datos')
+        hoja.append(columnas)
+        for bloque in _bloques(df, filas, columnas):
+            for fila in bloque.itertuples(index=False, name=None):
+                hoja.append([_valor_celda(valor) for valor in fila])
+        libro.save(archivo.name)
+
+        with open(archivo.name, 'rb') as f:
+            while True:
+                datos = f.read(BYTES_POR_BLOQUE)
+                if not datos:
+                    break
+                yield datos
+    finally:
+        os.remove(archivo.name)
+
+
+def _columnas_tabla(tabla, df, columnas):
+    """Columnas pedidas de la tabla Arrow del procesador, o None si no corresponde al df"""
+    if tabla is None or tabla.num_rows != len(df) or any(c not in tabla.column_names for c in columnas):
+        return None
+    return tabla.select(columnas)
+
+
+def _lotes_arrow(tabla, df, filas, columnas):
+    """Record batches de las filas pedidas, de a FILAS_POR_BLOQUE"""
+    if tabla is not None:
+        if len(filas) == tabla.num_rows:
+            # Sin filtros: rebanadas que apuntan a los buffers originales (sin copia)
+            yield from tabla.to_batches(max_chunksize=FILAS_POR_BLOQUE)
+            return
+        for inicio in range(0, len(filas), FILAS_POR_BLOQUE):
+            yield from tabla.take(pa.array(filas[inicio:inicio + FILAS_POR_BLOQUE])).to_batches()
+        return
+
+    # Datos de muestra o sin archivo Arrow: conversión desde pandas por bloque
+    for bloque in _bloques(df, filas, columnas):
+        yield pa.RecordBatch.from_pandas(bloque, preserve_index=False)
+
+
+def generar_arrow(df, filas, columnas, tabla=None):
+    """Stream Arrow IPC por record batches con un esquema fijo"""
+    tabla = _columnas_tabla(tabla, df, columnas)
+    if tabla is not None:
+        schema = tabla.schema
+    else:
+        schema = pa.Schema.from_pandas(df.iloc[:FILAS_POR_BLOQUE, [df.columns.get_loc(c) for c in columnas]],
+                                       preserve_index=False)
+    lotes = (lote if lote.schema.equals(schema) else lote.cast(schema)
+             for lote in _lotes_arrow(tabla, df, filas, columnas))
+    yield from stream_arrow(lotes, schema)
+
+
+def registrar_exportacion(server, data_processor, ruta='/exportar'):
+    """Registra el endpoint de exportación de los datos filtrados"""
+
+    def exportar():
+        if not data_processor.is_ready() or data_processor.df is None:
+            return jsonify({'error': 'Los datos aún se están cargando'}), 503
+
+        formato = request.args.get('formato', 'csv').lower()
+        if formato not in TIPOS_CONTENIDO:
+            return jsonify({'error': f'Formato no soportado: {formato}'}), 400
+        if formato == 'arrow' and not arrow_disponible():
+            return jsonify({'error': 'El formato arrow requiere pyarrow instalado en el servidor'}), 400
+
+        # Referencia fija al DataFrame: una recarga posterior no altera la exportación en curso
+        df, tabla = data_processor.df, data_processor.arrow_table
+        columnas = [c for c in COLUMNAS_EXPORTACION if c in df.columns]
+        filas = np.flatnonzero(mascara_filtros(df, **_filtros_consulta()).to_numpy())
+
+        if formato == 'arrow':
+            generador = generar_arrow(df, filas, columnas, tabla)
+        elif formato == 'xlsx':
+            generador = generar_xlsx(df, filas, columnas)
+        else:
+            generador = generar_csv(df, filas, columnas)
+        nombre = f"licitaciones_{datetime.now():%Y%m%d_%H%M}.{formato}"
+        respuesta = Response(stream_with_context(generador),
+                             content_type=TIPOS_CONTENIDO[formato])
+        respuesta.headers['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        respuesta.headers['X-Filas-Exportadas'] = str(len(filas))
+        return respuesta
+
+    server.add_url_rule(ruta, 'exportar_datos', exportar)
@@ -0,0 +1,113 @@
+"""
+Índice temporal de sumas acumuladas para totales por rango de fechas
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Al cargar los datos se arma, para cada combinación (grupo_proveedor,
+es_cenabast, principio_activo), la suma acumulada de unidades y ventas a lo
+largo del eje de meses. El total de cualquier rango [desde, hasta] de una
+combinación es una resta de dos posiciones (O(1) por grupo), sin recorrer las
+licitaciones; el precio ponderado sale de ventas / unidades.
+
+Los meses se representan como índice absoluto: año * 12 + (mes - 1).
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNAS_GRUPO = ['grupo_proveedor', 'es_cenabast', 'principio_activo']
+
+
+def indice_mes(año, mes):
+    """Índice absoluto del mes (año * 12 + mes - 1)"""
+    return int(año) * 12 + int(mes) - 1
+
+
+def etiqueta_mes(indice):
+    """'AAAA-MM' de un índice absoluto de mes"""
+    año, mes = divmod(int(indice), 12)
+    return f"{año}-{mes + 1:02d}"
+
+
+def construir_acumulados(df):
+    """Sumas acumuladas de unidades y ventas por grupo a lo largo de los meses
+
+    Retorna un dict con:
+        'mes_inicial', 'mes_final': índices absolutos del primer y último mes
+        'grupos': DataFrame con las columnas de COLUMNAS_GRUPO (fila i = grupo i)
+        'unidades', 'ventas': matrices (grupos × meses + 1); la columna j es la
+            suma de los meses anteriores a mes_inicial + j (la primera es 0)
+    """
+    if df is None or len(df) == 0:
+        return None
+
+    meses = df['año'].to_numpy(dtype='int64') * 12 + df['mes'].to_numpy(dtype='int64') - 1
+    mes_inicial, mes_final = int(meses.min()), int(meses.max())
+    n_meses = mes_final - mes_inicial + 1
+
+    agrupado = df.groupby(COLUMNAS_GRUPO, observed=True, sort=True)
+    codigos = agrupado.ngroup().to_numpy()
+    grupos = agrupado.size().index.to_frame(index=False)[COLUMNAS_GRUPO]
+    validos = codigos >= 0
+
+    posicion = codigos[validos] * n_meses + (meses[validos] - mes_inicial)
+    acumulados = {}
+    for medida in ('unidades', 'ventas'):
+        valores = np.nan_to_num(pd.to_numeric(df[medida], errors='coerce').to_numpy(dtype='float64')[validos])
+        por_mes = np.bincount(posicion, weights=valores, minlength=len(grupos) * n_meses)
+        matriz = np.zeros((len(grupos), n_meses + 1))
+        np.cumsum(por_mes.reshape(len(grupos), n_meses), axis=1, out=matriz[:, 1:])
+        acumulados[medida] = matriz
+
+    return {
+        'mes_inicial': mes_inicial,
+        'mes_final': mes_final,
+        'grupos': grupos,
+        **acumulados
+    }
+
+
+def totales_rango(acumulados, desde, hasta, principios=None, grupos=None, cenabast=None, opciones=None):
+    """Unidades, ventas y precio ponderado en [desde, hasta] (índices absolutos, inclusive)
+
+    Solo recorre la tabla de grupos (no las licitaciones): cada grupo aporta
+    acumulado[hasta + 1] - acumulado[desde].
+    """
+    if opciones and 'truncar_mes' in opciones:
+        hoy = datetime.now()
+        hasta = min(hasta, indice_mes(hoy.year, hoy.month))
+
+    inicio = max(desde, acumulados['mes_inicial']) - acumulados['mes_inicial']
+    fin = min(hasta, acumulados['mes_final']) - acumulados['mes_inicial']
+    if fin < inicio:
+        return {'unidades': 0.0, 'ventas': 0.0, 'precio': 0.0}
+
+    tabla = acumulados['grupos']
+    mascara = np.ones(len(tabla), dtype=bool)
+    if principios:
+        mascara &= tabla['principio_activo'].isin(principios).to_numpy()
+    if grupos:
+        mascara &= tabla['grupo_proveedor'].isin(grupos).to_numpy()
+    if cenabast == 'sin':
+        mascara &= ~tabla['es_cenabast'].to_numpy(dtype=bool)
+    elif cenabast == 'solo':
+        mascara &= tabla['es_cenabast'].to_numpy(dtype=bool)
+
+    filas = np.flatnonzero(mascara)
+    unidades = float((acumulados['unidades'][filas, fin + 1] - acumulados['unidades'][filas, inicio]).sum())
+    ventas = float((acumulados['ventas'][filas, fin + 1] - acumulados['ventas'][filas, inicio]).sum())
+    return {
+        'unidades': unidades,
+        'ventas': ventas,
+        'precio': ventas / unidades if unidades > 0 else 0.0
+    }
+
+
+def marcas_slider(mes_inicial, mes_final):
+    """Marcas del RangeSlider: cada enero con el año (y el primer mes si no es enero)"""
+    marcas = {indice: str(indice // 12) for indice in range(mes_inicial, mes_final + 1) if indice % 12 == 0}
+    marcas.setdefault(mes_inicial, etiqueta_mes(mes_inicial))
+    return marcas
@@ -0,0 +1,277 @@
+"""
+Prueba de carga con usuarios concurrentes contra el endpoint de callbacks de Dash
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Reproduce secuencias realistas de filtros (selección de principio activo, cambios
+de vista y de opción CENABAST) como POST a /_dash-update-component, igual que el
+navegador: cada cambio dispara los callbacks cuyos inputs cambiaron y las
+salidas de un callback alimentan a los siguientes (p. ej. processed-data).
+
+La concurrencia sube por escalones y para cada escalón se reporta throughput,
+latencias p50/p95/p99 por callback y tasa de errores.
+
+Uso:
+    python loadtest.py --iniciar app.py --usuarios 1 2 4 8 --duracion 30
+    python loadtest.py --url http://127.0.0.1:8050 --app app2 --salida carga.json
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+
+# Componentes que cada dashboard usa para los filtros principales
+PERFILES_APP = {
+    'app': {
+        'url': 'http://127.0.0.1:8052',
+        'principio': 'filtro-principio-activo',
+        'vista': ('selector-vista', ['anual', 'mensual', 'mensualizado']),
+        'cenabast': ('filtro-cenabast', ['con', 'sin', 'solo', 'ambos'])
+    },
+    'app2': {
+        'url': 'http://127.0.0.1:8050',
+        'principio': 'act-dropdown',
+        'vista': ('view-mode', ['annual', 'monthly', 'monthlyavg']),
+        'cenabast': ('cenabast-filter', ['with', 'without', 'only', 'both'])
+    }
+}
+
+
+def _recolectar_props(componente, estado):
+    """Recorre el layout y guarda las propiedades de cada componente con id"""
+    if isinstance(componente, list):
+        for hijo in componente:
+            _recolectar_props(hijo, estado)
+        return
+    if not isinstance(componente, dict) or 'props' not in componente:
+        return
+    props = componente['props']
+    if 'id' in props and isinstance(props['id'], str):
+        for prop, valor in props.items():
+            if prop not in ('id', 'children', 'style'):
+                estado[(props['id'], prop)] = valor
+    _recolectar_props(props.get('children'), estado)
+
+
+class SesionDash:
+    """Cliente que imita al renderer de Dash para un usuario"""
+
+    def __init__(self, url, dependencias, estado_inicial, registrar, fin=None):
+        self.url = url
+        self.fin = fin
+        self.dependencias = dependencias
+        self.estado = dict(estado_inicial)
+        self.registrar = registrar
+        self.http = requests.Session()
+
+    def _payload(self, dep, cambiados):
+        def spec(item):
+            return {'id': item['id'], 'property': item['property'],
+                    'value': self.estado.get((item['id'], item['property']))}
+
+        salida = dep['output']
+        multi = salida.startswith('..')
+        partes = salida.strip('.').split('...') if multi else [salida]
+        outputs = []
+        for parte in partes:
+            id_, prop = parte.split('.', 1)
+            outputs.append({'id': id_, 'property': prop.split('@')[0]})
+        return {
+            'output': salida,
+            'outputs': outputs if multi else outputs[0],
+            'inputs': [spec(i) for i in dep['inputs']],
+            'state': [spec(s) for s in dep['state']],
+            'changedPropIds': [f'{i}.{p}' for i, p in cambiados]
+        }
+
+    def _disparar(self, dep, cambiados):
+        """Envía un callback y aplica su respuesta al estado; devuelve props actualizadas"""
+        nombre = dep['output'].strip('.').split('...')[0]
+        inicio = time.perf_counter()
+        try:
+            respuesta = self.http.post(f'{self.url}/_dash-update-component',
+                                       json=self._payload(dep, cambiados), timeout=120)
+            error = respuesta.status_code not in (200, 204)
+            cuerpo = respuesta.content
+        except requests.RequestException:
+            error, cuerpo = True, b''
+        self.registrar(nombre, time.perf_counter() - inicio, error, len(cuerpo))
+
+        if error or not cuerpo:
+            return set()
+        actualizados = set()
+        for id_, props in json.loads(cuerpo).get('response', {}).items():
+            for prop, valor in props.items():
+                self.estado[(id_, prop)] = valor
+                actualizados.add((id_, prop))
+        return actualizados
+
+    def cambiar(self, cambios, inicial=False):
+        """Aplica cambios de props y dispara en cascada los callbacks afectados"""
+        # Al terminar el escalón la sesión deja de generar requests
+        if self.fin is not None and time.time() >= self.fin:
+            return
+        self.estado.update(cambios)
+        cambiados = set(cambios)
+        for _ in range(4):
+            siguientes = set()
+            for dep in self.dependencias:
+                if dep.get('clientside_function'):
+                    continue
+                entradas = {(i['id'], i['property']) for i in dep['inputs']}
+                afectados = entradas & cambiados
+                if afectados or (inicial and not dep.get('prevent_initial_call')):
+                    siguientes |= self._disparar(dep, afectados)
+            inicial = False
+            cambiados = siguientes
+            if not cambiados:
+                break
+
+
+def _opciones(estado, componente):
+    opciones = estado.get((componente, 'options')) or []
+    return [o['value'] if isinstance(o, dict) else o for o in opciones]
+
+
+def ejecutar_sesion(sesion, perfil, rng):
+    """Secuencia típica de un analista: principio activo, vistas y modos CENABAST"""
+    sesion.cambiar({}, inicial=True)
+
+    principios = _opciones(sesion.estado, perfil['principio'])
+    if principios:
+        seleccion = rng.sample(principios, min(len(principios), rng.choice([1, 1, 2])))
+        sesion.cambiar({(perfil['principio'], 'value'): seleccion})
+
+    vista_id, vistas = perfil['vista']
+    for vista in rng.sample(vistas, len(vistas)):
+        sesion.cambiar({(vista_id, 'value'): vista})
+
+    cenabast_id, modos = perfil['cenabast']
+    for modo in rng.sample(modos, rng.randint(1, len(modos))):
+        sesion.cambiar({(cenabast_id, 'value'): modo})
+
+
+def ejecutar_escalon(url, perfil, dependencias, estado_inicial, usuarios, duracion, seed):
+    """Mantiene N usuarios concurrentes durante la duración indicada"""
+    registros = []
+    lock = threading.Lock()
+    fin = time.time() + duracion
+
+    def registrar(nombre, segundos, error, bytes_respuesta):
+        with lock:
+            registros.append((nombre, segundos, error, bytes_respuesta))
+
+    def usuario(indice):
+        rng = random.Random(seed + indice)
+        while time.time() < fin:
+            sesion = SesionDash(url, dependencias, estado_inicial, registrar, fin)
+            ejecutar_sesion(sesion, perfil, rng)
+
+    hilos = [threading.Thread(target=usuario, args=(i,), daemon=True) for i in range(usuarios)]
+    inicio = time.time()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.time() - inicio
+
+    por_callback = defaultdict(list)
+    errores = defaultdict(int)
+    for nombre, segundos, error, _ in registros:
+        por_callback[nombre].append(segundos)
+        errores[nombre] += int(error)
+
+    resumen = {
+        'usuarios': usuarios,
+        'requests': len(registros),
+        'throughput_rps': round(len(registros) / transcurrido, 2) if transcurrido else 0,
+        'tasa_error': round(sum(errores.values()) / len(registros), 4) if registros else 0,
+        'callbacks': {}
+    }
+    for nombre, tiempos in sorted(por_callback.items()):
+        p50, p95, p99 = np.percentile(tiempos, [50, 95, 99])
+        resumen['callbacks'][nombre] = {
+            'requests': len(tiempos),
+            'p50_ms': round(p50 * 1000, 1),
+            'p95_ms': round(p95 * 1000, 1),
+            'p99_ms': round(p99 * 1000, 1),
+            'tasa_error': round(errores[nombre] / len(tiempos), 4)
+        }
+    return resumen
+
+
+def imprimir_resumen(resumen):
+    print(f"\n=== {resumen['usuarios']} usuarios: {resumen['throughput_rps']} req/s, "
+          f"{resumen['requests']} requests, errores {resumen['tasa_error']:.2%} ===")
+    for nombre, datos in resumen['callbacks'].items():
+        print(f"  {nombre[:55]:<55} n={datos['requests']:<6} p50={datos['p50_ms']:>8.1f}ms "
+              f"p95={datos['p95_ms']:>8.1f}ms p99={datos['p99_ms']:>8.1f}ms err={datos['tasa_error']:.2%}")
+
+
+def esperar_servidor(url, timeout=300):
+    """Espera a que el servidor responda (y a /ready si existe)"""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            listo = requests.get(f'{url}/ready', timeout=5)
+            if listo.status_code == 200 or (listo.status_code == 404 and requests.get(url, timeout=5).ok):
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del dashboard')
+    parser.add_argument('--app', choices=sorted(PERFILES_APP), default='app')
+    parser.add_argument('--url', help='URL del servidor (por defecto la de la app elegida)')
+    parser.add_argument('--iniciar', help='Script a iniciar localmente (app.py o app2_mejorado.py)')
+    parser.add_argument('--usuarios', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duracion', type=int, default=30, help='Segundos por escalón')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--salida', help='Archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    perfil = PERFILES_APP[args.app]
+    url = (args.url or perfil['url']).rstrip('/')
+
+    proceso = None
+    if args.iniciar:
+        proceso = subprocess.Popen([sys.executable, args.iniciar])
+    try:
+        if not esperar_servidor(url):
+            print(f"El servidor {url} no respondió a tiempo")
+            sys.exit(1)
+
+        dependencias = requests.get(f'{url}/_dash-dependencies', timeout=30).json()
+        estado_inicial = {}
+        _recolectar_props(requests.get(f'{url}/_dash-layout', timeout=30).json(), estado_inicial)
+
+        resultados = []
+        for usuarios in args.usuarios:
+            resumen = ejecutar_escalon(url, perfil, dependencias, estado_inicial,
+                                       usuarios, args.duracion, args.seed)
+            imprimir_resumen(resumen)
+            resultados.append(resumen)
+
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'app': args.app, 'escalones': resultados}, f, indent=2)
+            print(f"\nResultados guardados en: {args.salida}")
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+
+
+if __name__ == '__main__':
+    main()
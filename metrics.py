@@ -0,0 +1,194 @@
+"""
+Métricas de latencia y payload por callback del dashboard farmacéutico
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Envuelve cada callback registrado en la app Dash y registra:
+- tiempo total por callback
+- tiempo por fase (filtro, agregacion, graficos, serializacion)
+- bytes de la respuesta enviada al navegador
+- aciertos y fallos de caché
+- requests resueltos esperando un cálculo idéntico en curso
+Las métricas se exponen en /metrics con el formato de texto de Prometheus.
+"""
+
+import time
+import threading
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+from flask import Response
+
+
+# Buckets de los histogramas (segundos y bytes)
+BUCKETS_SEGUNDOS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+BUCKETS_BYTES = [1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7]
+
+
+class Histograma:
+    """Histograma acumulativo con etiquetas, compatible con Prometheus"""
+
+    def __init__(self, nombre, descripcion, buckets):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self.lock:
+            serie = self.series.setdefault(clave, {'buckets': [0] * len(self.buckets), 'suma': 0.0, 'cuenta': 0})
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie['buckets'][i] += 1
+            serie['suma'] += valor
+            serie['cuenta'] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.descripcion}", f"# TYPE {self.nombre} histogram"]
+        with self.lock:
+            for clave, serie in sorted(self.series.items()):
+                base = ','.join(f'{k}="{v}"' for k, v in clave)
+                separador = ',' if base else ''
+                for limite, cuenta in zip(self.buckets, serie['buckets']):
+                    lineas.append(f'{self.nombre}_bucket{{{base}{separador}le="{limite:g}"}} {cuenta}')
+                lineas.append(f'{self.nombre}_bucket{{{base}{separador}le="+Inf"}} {serie["cuenta"]}')
+                lineas.append(f'{self.nombre}_sum{{{base}}} {serie["suma"]:.6f}')
+                lineas.append(f'{self.nombre}_count{{{base}}} {serie["cuenta"]}')
+        return lineas
+
+
+class Contador:
+    """Contador con etiquetas, compatible con Prometheus"""
+
+    def __init__(self, nombre, descripcion):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self.lock:
+            self.series[clave] = self.series.get(clave, 0) + valor
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.descripcion}", f"# TYPE {self.nombre} counter"]
+        with self.lock:
+            for clave, valor in sorted(self.series.items()):
+                base = ','.join(f'{k}="{v}"' for k, v in clave)
+                lineas.append(f'{self.nombre}{{{base}}} {valor}')
+        return lineas
+
+
+DURACION_CALLBACK = Histograma(
+    'dashboard_callback_duration_seconds', 'Tiempo total de cada callback', BUCKETS_SEGUNDOS)
+DURACION_FASE = Histograma(
+    'dashboard_callback_phase_seconds', 'Tiempo por fase dentro de cada callback', BUCKETS_SEGUNDOS)
+PAYLOAD_CALLBACK = Histograma(
+    'dashboard_callback_payload_bytes', 'Bytes de la respuesta JSON de cada callback', BUCKETS_BYTES)
+CACHE_CALLBACK = Contador(
+    'dashboard_cache_requests_total', 'Consultas a caché por callback y resultado')
+ERRORES_CALLBACK = Contador(
+    'dashboard_callback_errors_total', 'Excepciones no controladas por callback')
+COALESCENCIA_CALLBACK = Contador(
+    'dashboard_coalesced_requests_total', 'Requests que esperaron un cálculo idéntico en curso')
+
+METRICAS = [DURACION_CALLBACK, DURACION_FASE, PAYLOAD_CALLBACK, CACHE_CALLBACK, ERRORES_CALLBACK,
+            COALESCENCIA_CALLBACK]
+
+# Estado del callback en curso (uno por hilo del servidor)
+_contexto = threading.local()
+
+
+def marcar_fase(nombre):
+    """Atribuye a la fase indicada el tiempo transcurrido desde la marca anterior"""
+    actual = getattr(_contexto, 'actual', None)
+    if actual is None:
+        return
+    ahora = time.perf_counter()
+    actual['fases'][nombre] = actual['fases'].get(nombre, 0.0) + (ahora - actual['ultima_marca'])
+    actual['ultima_marca'] = ahora
+
+
+def reiniciar_marca():
+    """Descarta el tiempo transcurrido desde la última marca (no se atribuye a ninguna fase)"""
+    actual = getattr(_contexto, 'actual', None)
+    if actual is not None:
+        actual['ultima_marca'] = time.perf_counter()
+
+
+def registrar_cache(acierto):
+    """Registra un acierto o fallo de caché para el callback en curso"""
+    actual = getattr(_contexto, 'actual', None)
+    nombre = actual['callback'] if actual else 'fuera_de_callback'
+    CACHE_CALLBACK.incrementar(callback=nombre, resultado='hit' if acierto else 'miss')
+
+
+def registrar_coalescencia():
+    """Registra que el callback en curso reutilizó el resultado de un cálculo concurrente"""
+    actual = getattr(_contexto, 'actual', None)
+    nombre = actual['callback'] if actual else 'fuera_de_callback'
+    COALESCENCIA_CALLBACK.incrementar(callback=nombre)
+
+
+def _envolver_callback(funcion, nombre):
+    """Envuelve la función registrada por Dash (incluye la serialización a JSON)"""
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        _contexto.actual = {'callback': nombre, 'fases': {}, 'ultima_marca': inicio}
+        try:
+            respuesta = funcion(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            ERRORES_CALLBACK.incrementar(callback=nombre)
+            raise
+        finally:
+            actual = _contexto.actual
+            _contexto.actual = None
+            total = time.perf_counter() - inicio
+
+        # El tiempo no atribuido a fases del callback corresponde a la serialización de Dash
+        fases = actual['fases']
+        if fases:
+            fases['serializacion'] = max(0.0, total - sum(fases.values()))
+        for fase, segundos in fases.items():
+            DURACION_FASE.observar(segundos, callback=nombre, fase=fase)
+        DURACION_CALLBACK.observar(total, callback=nombre)
+        if isinstance(respuesta, (str, bytes)):
+            PAYLOAD_CALLBACK.observar(len(respuesta), callback=nombre)
+        return respuesta
+
+    envoltura.metricas_instrumentadas = True
+    return envoltura
+
+
+def instrumentar_callbacks(app):
+    """Envuelve todos los callbacks registrados en la app con la medición de métricas"""
+    for entrada in app.callback_map.values():
+        funcion = entrada.get('callback')
+        # Los callbacks clientside no tienen función en el servidor
+        if funcion is None or getattr(funcion, 'metricas_instrumentadas', False):
+            continue
+        entrada['callback'] = _envolver_callback(funcion, funcion.__name__)
+
+
+def exportar_metricas():
+    """Texto de todas las métricas en formato de exposición de Prometheus"""
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exportar())
+    return '\n'.join(lineas) + '\n'
+
+
+def registrar_endpoint_metricas(server, ruta='/metrics'):
+    """Registra el endpoint de métricas en el servidor Flask"""
+
+    def metricas():
+        return Response(exportar_metricas(), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule(ruta, 'metricas', metricas)
@@ -0,0 +1,206 @@
+"""
+Precalentamiento de la caché del dashboard al arrancar
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Después de cargar los datos, un hilo en segundo plano calcula los estados de
+filtros más consultados para que el primer usuario no pague el cálculo:
+- el estado inicial del layout (vista mensual, CENABAST "Con y Sin", sin filtros)
+- los N principios activos con más ventas, en cada vista
+Se detiene al agotar el presupuesto de tiempo (se revisa entre estados).
+
+Además, PrefetchEspeculativo calcula tras cada request los estados "vecinos"
+(las otras vistas y opciones CENABAST con los mismos filtros), que suelen ser el
+siguiente clic. Solo trabaja cuando no hay requests reales en curso: cada
+request nuevo descarta lo pendiente y detiene el cálculo especulativo en curso
+(que revisa la cancelación entre fases, ver PrefetchCancelado).
+
+Variables de entorno:
+    DASHBOARD_WARMUP=0              desactiva el precalentamiento
+    DASHBOARD_WARMUP_TOP=5          principios activos por vista
+    DASHBOARD_WARMUP_SEGUNDOS=120   presupuesto de tiempo total
+    DASHBOARD_PREFETCH=0            desactiva el prefetch especulativo
+    DASHBOARD_PREFETCH_MAX=11       estados vecinos calculados por request (memoria)
+    DASHBOARD_PREFETCH_CPU=0.5      segundos de CPU por request para el prefetch
+"""
+
+import os
+import time
+import threading
+
+
+WARMUP_ACTIVO = os.environ.get('DASHBOARD_WARMUP', '1') not in ('0', 'false', 'no')
+WARMUP_TOP = int(os.environ.get('DASHBOARD_WARMUP_TOP', '5'))
+WARMUP_SEGUNDOS = float(os.environ.get('DASHBOARD_WARMUP_SEGUNDOS', '120'))
+
+PREFETCH_ACTIVO = os.environ.get('DASHBOARD_PREFETCH', '1') not in ('0', 'false', 'no')
+PREFETCH_MAX = int(os.environ.get('DASHBOARD_PREFETCH_MAX', '11'))
+# Presupuesto chico: la especulación no debe competir con el tráfico real
+PREFETCH_CPU = float(os.environ.get('DASHBOARD_PREFETCH_CPU', '0.5'))
+
+VISTAS = ['mensual', 'anual', 'mensualizado']
+OPCIONES_CENABAST = ['ambos', 'con', 'sin', 'solo']
+
+
+class PrefetchCancelado(Exception):
+    """Un request real empezó mientras corría un cálculo especulativo"""
+
+
+def estado_filtros(principios=None, vista='mensual', cenabast='ambos'):
+    """Estado de filtros con el formato de los argumentos del callback principal"""
+    return {
+        'principios': principios or [],
+        'organismos': [],
+        'concentraciones': [],
+        'grupos': [],
+        'vista': vista,
+        'cenabast': cenabast,
+        'opciones': []
+    }
+
+
+def estados_a_precalentar(df, top_n=WARMUP_TOP):
+    """Estado inicial del layout y los top-N principios activos por ventas en cada vista"""
+    estados = [estado_filtros()]
+    if df is None or len(df) == 0 or top_n <= 0:
+        return estados
+
+    principales = df.groupby('principio_activo')['ventas'].sum().nlargest(top_n).index.tolist()
+    for principio in principales:
+        for vista in VISTAS:
+            estados.append(estado_filtros([principio], vista))
+    return estados
+
+
+def precalentar(obtener, estados, presupuesto=WARMUP_SEGUNDOS):
+    """Calcula los estados en orden hasta agotar el presupuesto; devuelve los calentados"""
+    inicio = time.time()
+    calentados = []
+    for i, estado in enumerate(estados):
+        if time.time() - inicio >= presupuesto:
+            print(f"Precalentamiento: presupuesto de {presupuesto:.0f}s agotado, "
+                  f"{len(estados) - i} estados pendientes")
+            break
+        t0 = time.time()
+        try:
+            origen = obtener(estado)
+        except Exception as e:
+            print(f"Precalentamiento: error en {estado['vista']} {estado['principios'] or 'sin filtros'}: {e}")
+            continue
+        calentados.append(estado)
+        print(f"Precalentado ({origen}, {time.time() - t0:.2f}s): vista={estado['vista']} "
+              f"cenabast={estado['cenabast']} principios={estado['principios'] or 'todos'}")
+    print(f"Precalentamiento completado: {len(calentados)} estados en {time.time() - inicio:.1f}s")
+    return calentados
+
+
+def iniciar_precalentamiento(data_processor, obtener, top_n=WARMUP_TOP, presupuesto=WARMUP_SEGUNDOS):
+    """Lanza el precalentamiento en un hilo daemon que espera a que terminen de cargar los datos"""
+    if not WARMUP_ACTIVO:
+        return None
+
+    def ejecutar():
+        data_processor.ready.wait()
+        if data_processor.df is None:
+            return
+        precalentar(obtener, estados_a_precalentar(data_processor.df, top_n), presupuesto)
+
+    hilo = threading.Thread(target=ejecutar, name='precalentamiento', daemon=True)
+    hilo.start()
+    return hilo
+
+
+def estados_vecinos(estado):
+    """Mismos filtros con las otras vistas y opciones CENABAST, de más a menos probable
+
+    Primero las otras vistas con el mismo CENABAST, luego las otras opciones
+    CENABAST con la misma vista y al final el resto de combinaciones. La vista
+    mensualizada (la más costosa, expande cada contrato por mes) va al final para
+    no consumir el presupuesto antes que los estados baratos.
+    """
+    def variante(vista, cenabast):
+        return dict(estado, vista=vista, cenabast=cenabast)
+
+    vista, cenabast = estado['vista'], estado['cenabast']
+    vecinos = [variante(v, cenabast) for v in VISTAS if v != vista]
+    vecinos += [variante(vista, c) for c in OPCIONES_CENABAST if c != cenabast]
+    vecinos += [variante(v, c) for v in VISTAS for c in OPCIONES_CENABAST if v != vista and c != cenabast]
+    return sorted(vecinos, key=lambda e: e['vista'] == 'mensualizado')
+
+
+class PrefetchEspeculativo:
+    """Calcula en un hilo ocioso los estados vecinos del último request
+
+    - solo corre cuando no hay requests reales en curso
+    - cada request nuevo descarta los estados pendientes del anterior y marca
+      como cancelado el estado en curso: obtener(estado, cancelado) recibe un
+      threading.Event que debe revisar entre fases y cortar con PrefetchCancelado
+    - presupuesto por request: PREFETCH_MAX estados y PREFETCH_CPU segundos de CPU
+    """
+
+    def __init__(self, obtener, en_cache, max_estados=PREFETCH_MAX, cpu_segundos=PREFETCH_CPU):
+        self.obtener = obtener
+        self.en_cache = en_cache
+        self.max_estados = max_estados
+        self.cpu_segundos = cpu_segundos
+        self._cond = threading.Condition()
+        self._pendientes = []
+        self._activos = 0
+        self._lote = 0
+        self._hilo = None
+        self._cancelado = threading.Event()
+
+    def inicio_request(self):
+        """Un request real empezó: se cancela el prefetch pendiente y el que está corriendo"""
+        with self._cond:
+            self._activos += 1
+            self._lote += 1
+            self._pendientes = []
+            self._cancelado.set()
+
+    def fin_request(self, estado):
+        """Un request real terminó: se programan sus estados vecinos"""
+        with self._cond:
+            self._activos -= 1
+            self._lote += 1
+            self._pendientes = estados_vecinos(estado)[:self.max_estados]
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._trabajar, name='prefetch', daemon=True)
+                self._hilo.start()
+            self._cond.notify()
+
+    def _siguiente(self):
+        """Espera a que haya estados pendientes y ningún request real en curso"""
+        with self._cond:
+            while not self._pendientes or self._activos:
+                self._cond.wait()
+            self._cancelado.clear()
+            return self._lote, self._pendientes.pop(0)
+
+    def _trabajar(self):
+        lote_actual, cpu_inicio = None, 0.0
+        while True:
+            lote, estado = self._siguiente()
+            if lote != lote_actual:
+                lote_actual, cpu_inicio = lote, time.thread_time()
+            if time.thread_time() - cpu_inicio >= self.cpu_segundos:
+                # Presupuesto de CPU agotado: se descarta el resto del lote
+                with self._cond:
+                    if self._lote == lote:
+                        self._pendientes = []
+                continue
+            if self.en_cache(estado):
+                continue
+            try:
+                self.obtener(estado, self._cancelado)
+            except PrefetchCancelado:
+                continue
+            except Exception as e:
+                print(f"Prefetch: error en vista={estado['vista']} cenabast={estado['cenabast']}: {e}")
+
+
+def crear_prefetch(obtener, en_cache):
+    """PrefetchEspeculativo configurado por entorno, o None si está desactivado"""
+    if not PREFETCH_ACTIVO or PREFETCH_MAX <= 0:
+        return None
+    return PrefetchEspeculativo(obtener, en_cache)
@@ -0,0 +1,219 @@
+"""
+Perfilado bajo demanda de callbacks del dashboard farmacéutico
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+El perfilado es opcional y se activa de dos formas:
+- variable de entorno DASHBOARD_PROFILE con los nombres de callbacks separados
+  por coma (o 'all'), p. ej. DASHBOARD_PROFILE=actualizar_dashboard_6_graficos
+- abriendo el dashboard con ?profile=<callbacks>&token=<DASHBOARD_PROFILE_TOKEN>
+  (queda guardado en una cookie firmada; ?profile=off la elimina)
+
+Cada request perfilado se ejecuta bajo cProfile y se guarda como archivo .prof
+en DASHBOARD_PROFILE_DIR (se conservan los últimos MAX_PERFILES). Se perfila un
+request a la vez; los que llegan mientras tanto corren sin perfilar. La página
+/admin/perfiles?token=<DASHBOARD_PROFILE_TOKEN> lista los requests más lentos
+recientes. Sin DASHBOARD_PROFILE_TOKEN la página y la activación por query
+quedan deshabilitadas. Sin perfilado activo el costo es una consulta a un set.
+"""
+
+import os
+import time
+import io
+import hmac
+import hashlib
+import pstats
+import cProfile
+import threading
+from collections import deque
+from datetime import datetime
+from functools import wraps
+from urllib.parse import quote
+
+import flask
+from flask import Response, abort, request, send_from_directory
+
+
+PROFILE_DIR = os.environ.get('DASHBOARD_PROFILE_DIR', 'profiles')
+COOKIE_PERFILADO = 'dashboard_profile'
+
+# Secreto que habilita /admin/perfiles y ?profile= (sin él, ambos quedan apagados)
+TOKEN_PERFILADO = os.environ.get('DASHBOARD_PROFILE_TOKEN', '')
+
+# Archivos .prof que se conservan en disco (igual que la lista de recientes)
+MAX_PERFILES = 200
+
+# Callbacks perfilados siempre (configurados por entorno)
+CALLBACKS_PERFILADOS = {
+    nombre.strip() for nombre in os.environ.get('DASHBOARD_PROFILE', '').split(',') if nombre.strip()
+}
+
+# Últimos requests perfilados (para la página de administración)
+_recientes = deque(maxlen=MAX_PERFILES)
+_lock = threading.Lock()
+
+# Un solo request perfilado a la vez: desde Python 3.12 cProfile es global al
+# proceso y un segundo enable() falla con "Another profiling tool is already active"
+_lock_perfil_activo = threading.Lock()
+
+
+def _firma(valor):
+    """HMAC del valor de la cookie con el token de perfilado"""
+    return hmac.new(TOKEN_PERFILADO.encode(), valor.encode(), hashlib.sha256).hexdigest()
+
+
+def token_valido():
+    """True si el request trae el token de perfilado (query ?token= o header X-Profile-Token)"""
+    if not TOKEN_PERFILADO:
+        return False
+    recibido = request.args.get('token') or request.headers.get('X-Profile-Token') or ''
+    return hmac.compare_digest(recibido.encode(), TOKEN_PERFILADO.encode())
+
+
+def _callbacks_de_cookie():
+    """Callbacks solicitados mediante la cookie firmada de perfilado (solo dentro de un request)"""
+    if not TOKEN_PERFILADO or not flask.has_request_context():
+        return ()
+    valor, _, firma = (request.cookies.get(COOKIE_PERFILADO) or '').rpartition('|')
+    if not valor or not hmac.compare_digest(firma, _firma(valor)):
+        return ()
+    return valor.split(',')
+
+
+def debe_perfilar(nombre):
+    """Indica si el callback debe ejecutarse bajo el profiler en este request"""
+    if CALLBACKS_PERFILADOS and ('all' in CALLBACKS_PERFILADOS or nombre in CALLBACKS_PERFILADOS):
+        return True
+    solicitados = _callbacks_de_cookie()
+    return 'all' in solicitados or nombre in solicitados
+
+
+def _guardar_perfil(perfil, nombre, segundos):
+    """Guarda el perfil en disco y lo registra en la lista de recientes"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    marca = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    archivo = f"{marca}_{nombre}_{int(segundos * 1000)}ms.prof"
+    perfil.dump_stats(os.path.join(PROFILE_DIR, archivo))
+    with _lock:
+        _recientes.append({
+            'callback': nombre,
+            'segundos': segundos,
+            'archivo': archivo,
+            'fecha': datetime.now().isoformat(timespec='seconds')
+        })
+        _podar_perfiles()
+
+
+def _podar_perfiles():
+    """Borra los .prof más viejos por encima de MAX_PERFILES (el nombre empieza con la fecha)"""
+    archivos = sorted(a for a in os.listdir(PROFILE_DIR) if a.endswith('.prof'))
+    for archivo in archivos[:max(0, len(archivos) - MAX_PERFILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, archivo))
+        except OSError:
+            pass
+
+
+def _envolver_callback(funcion, nombre):
+    """Ejecuta el callback bajo cProfile solo cuando está solicitado"""
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not debe_perfilar(nombre):
+            return funcion(*args, **kwargs)
+
+        # Si ya hay un request perfilándose, este corre sin perfilar (no espera)
+        if not _lock_perfil_activo.acquire(blocking=False):
+            return funcion(*args, **kwargs)
+        try:
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                # Otra herramienta de perfilado activa en el proceso
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                perfil.disable()
+                _guardar_perfil(perfil, nombre, time.perf_counter() - inicio)
+        finally:
+            _lock_perfil_activo.release()
+
+    envoltura.perfilado_instrumentado = True
+    return envoltura
+
+
+def instrumentar_perfilado(app):
+    """Envuelve los callbacks registrados para permitir el perfilado bajo demanda"""
+    for entrada in app.callback_map.values():
+        funcion = entrada.get('callback')
+        # Los callbacks clientside no tienen función en el servidor
+        if funcion is None or getattr(funcion, 'perfilado_instrumentado', False):
+            continue
+        entrada['callback'] = _envolver_callback(funcion, funcion.__name__)
+
+
+def _resumen_texto(archivo, limite=40):
+    """Resumen de pstats ordenado por tiempo acumulado"""
+    salida = io.StringIO()
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, archivo), stream=salida)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limite)
+    return salida.getvalue()
+
+
+def registrar_pagina_perfiles(server, ruta='/admin/perfiles'):
+    """Registra la activación por query (?profile=) y las páginas de administración
+    
+    Ambas requieren DASHBOARD_PROFILE_TOKEN; sin él no se registra nada.
+    """
+    if not TOKEN_PERFILADO:
+        return
+
+    @server.after_request
+    def activar_por_query(respuesta):
+        valor = request.args.get('profile')
+        if valor is None:
+            return respuesta
+        if valor in ('off', '0', ''):
+            respuesta.delete_cookie(COOKIE_PERFILADO)
+        elif token_valido():
+            valor = 'all' if valor == '1' else valor
+            respuesta.set_cookie(COOKIE_PERFILADO, f"{valor}|{_firma(valor)}", samesite='Lax', httponly=True)
+        return respuesta
+
+    def listar_perfiles():
+        if not token_valido():
+            abort(404)
+        token = quote(request.args.get('token', ''), safe='')
+        with _lock:
+            recientes = sorted(_recientes, key=lambda r: r['segundos'], reverse=True)[:50]
+        filas = ''.join(
+            f"<tr><td>{r['fecha']}</td><td>{r['callback']}</td><td>{r['segundos'] * 1000:,.0f} ms</td>"
+            f"<td><a href='{ruta}/{r['archivo']}?token={token}'>resumen</a> | "
+            f"<a href='{ruta}/{r['archivo']}?token={token}&descargar=1'>.prof</a></td></tr>"
+            for r in recientes
+        )
+        return (
+            "<html><head><title>Perfiles</title></head><body style='font-family: Arial, sans-serif'>"
+            "<h2>Requests perfilados más lentos</h2>"
+            f"<p>Activos por entorno: {', '.join(sorted(CALLBACKS_PERFILADOS)) or 'ninguno'} | "
+            f"Activos por cookie: {', '.join(_callbacks_de_cookie()) or 'ninguno'}</p>"
+            "<table border='1' cellpadding='4'><tr><th>Fecha</th><th>Callback</th><th>Duración</th><th></th></tr>"
+            f"{filas}</table></body></html>"
+        )
+
+    def ver_perfil(archivo):
+        if not token_valido():
+            abort(404)
+        if os.path.basename(archivo) != archivo or not archivo.endswith('.prof'):
+            abort(404)
+        if not os.path.exists(os.path.join(PROFILE_DIR, archivo)):
+            abort(404)
+        if request.args.get('descargar'):
+            return send_from_directory(os.path.abspath(PROFILE_DIR), archivo, as_attachment=True)
+        return Response(_resumen_texto(archivo), mimetype='text/plain')
+
+    server.add_url_rule(ruta, 'listar_perfiles', listar_perfiles)
+    server.add_url_rule(f'{ruta}/<archivo>', 'ver_perfil', ver_perfil)
@@ -0,0 +1,348 @@
+"""
+Generador de reportes HTML estáticos por principio activo (sin servidor)
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Genera un reporte HTML por principio activo × vista × modo CENABAST con los
+mismos gráficos del dashboard (filtrar_datos, agregar_datos_por_vista y las
+funciones crear_grafico_*), más un index.html con enlaces a todos.
+
+- El dataset se procesa una sola vez en el proceso principal y se deja en el
+  archivo Arrow compartido; cada proceso del pool lo abre con memory-map
+  (ver OptimizedDataProcessor.open_arrow) en lugar de volver a leer el Excel.
+- Cada reporte tiene una huella de entrada: filas de su principio activo,
+  vista, modo, versión del código y colores de proveedores. Si la huella coincide con la de la corrida
+  anterior (manifiesto.json) y el archivo existe, el reporte se omite.
+
+Uso:
+    python reportes.py --salida reportes
+    python reportes.py --principios "PARACETAMOL" --vistas anual mensual --procesos 4
+    python reportes.py --forzar
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import unicodedata
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from data_processor import OptimizedDataProcessor, calcular_version_codigo
+from utils import (
+    CORPORATE_COLORS, filtrar_datos, agregar_datos_por_vista, asignar_colores_proveedores,
+    crear_grafico_unidades, crear_grafico_ventas, crear_grafico_precio,
+    crear_grafico_unidades_cenabast, crear_grafico_ventas_cenabast,
+    crear_grafico_precio_cenabast
+)
+
+
+VISTAS = ['anual', 'mensual', 'mensualizado']
+MODOS_CENABAST = ['con', 'sin', 'solo', 'ambos']
+NOMBRES_MODO = {'con': 'Con CENABAST', 'sin': 'Sin CENABAST', 'solo': 'Solo CENABAST', 'ambos': 'Con y Sin CENABAST'}
+
+MANIFIESTO = 'manifiesto.json'
+
+# Versión del formato de los reportes; incrementar si cambia la plantilla HTML
+REPORTE_VERSION = '1'
+
+# Columnas que determinan el contenido de un reporte (año_mes se deriva de fecha)
+COLUMNAS_HUELLA = ['organismo', 'concentracion', 'grupo_proveedor', 'es_cenabast', 'fecha',
+                   'unidades', 'ventas', 'precio', 'Duración de Contrato', 'duracion_contrato_meses']
+
+PLANTILLA_HTML = """<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>{titulo}</title>
+{script_plotly}
+<style>
+body {{ font-family: Arial, sans-serif; margin: 0; color: {texto}; }}
+header {{ background: linear-gradient(135deg, {primario}, {oscuro}); color: white; padding: 15px 25px; }}
+header h1 {{ margin: 0; font-size: 22px; }}
+header p {{ margin: 5px 0 0 0; font-size: 13px; opacity: 0.9; }}
+.info {{ margin: 20px; padding: 10px 15px; border: 1px solid {primario}30; border-radius: 5px; font-size: 14px; }}
+.grafico {{ margin: 0 20px 20px 20px; }}
+</style>
+</head>
+<body>
+<header><h1>{titulo}</h1><p>{subtitulo}</p></header>
+<div class="info">{info}</div>
+{graficos}
+</body>
+</html>
+"""
+
+
+# Estado de cada proceso del pool (se inicializa una vez por proceso)
+_worker = {}
+
+
+def nombre_archivo(principio, vista, modo):
+    """Nombre de archivo estable y legible para un reporte"""
+    texto = unicodedata.normalize('NFKD', str(principio)).encode('ascii', 'ignore').decode('ascii')
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', texto).strip('_').lower() or 'principio'
+    sufijo = hashlib.blake2b(str(principio).encode('utf-8'), digest_size=3).hexdigest()
+    return f"{slug[:60]}_{sufijo}__{vista}__{modo}.html"
+
+
+def huellas_por_principio(df):
+    """Huella del contenido de las filas de cada principio activo (independiente del orden)"""
+    columnas = [c for c in COLUMNAS_HUELLA if c in df.columns]
+    hash_filas = pd.util.hash_pandas_object(df[columnas], index=False)
+    return hash_filas.groupby(df['principio_activo'].values).sum().astype('uint64').to_dict()
+
+
+def huella_reporte(huella_filas, vista, modo, contexto):
+    """Huella de entrada de un reporte: filas del principio, vista, modo y contexto común
+
+    El contexto reúne lo que comparten todos los reportes: versión del código y
+    colores de proveedores (se calculan sobre el dataset completo).
+    """
+    clave = f"{huella_filas}|{vista}|{modo}|{contexto}|{REPORTE_VERSION}"
+    return hashlib.blake2b(clave.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def cargar_manifiesto(directorio):
+    ruta = os.path.join(directorio, MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"No se pudo leer el manifiesto, se regenerará todo: {str(e)}")
+        return {}
+
+
+def guardar_manifiesto(directorio, manifiesto):
+    """Escritura atómica del manifiesto de huellas"""
+    ruta = os.path.join(directorio, MANIFIESTO)
+    tmp_path = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, ruta)
+
+
+def figuras_reporte(df_filtrado, vista, modo, colores):
+    """Gráficos del dashboard para un modo CENABAST (misma lógica que el callback principal)"""
+    if modo in ('con', 'ambos'):
+        df_modo, modo_agregacion = df_filtrado, 'con'
+    elif modo == 'sin':
+        df_modo, modo_agregacion = df_filtrado[df_filtrado['es_cenabast'] == False], 'sin'
+    else:
+        df_modo, modo_agregacion = df_filtrado[df_filtrado['es_cenabast'] == True], 'solo'
+
+    df_agregado = agregar_datos_por_vista(df_modo, vista, modo_agregacion)
+    figuras = [
+        crear_grafico_unidades(df_agregado, vista, modo_agregacion, colores),
+        crear_grafico_ventas(df_agregado, vista, modo_agregacion, colores),
+        crear_grafico_precio(df_agregado, vista, modo_agregacion, colores)
+    ]
+
+    if modo == 'ambos':
+        df_cenabast = agregar_datos_por_vista(df_filtrado[df_filtrado['es_cenabast'] == True], vista, 'solo')
+        figuras += [
+            crear_grafico_unidades_cenabast(df_cenabast, vista, colores),
+            crear_grafico_ventas_cenabast(df_cenabast, vista, colores),
+            crear_grafico_precio_cenabast(df_cenabast, vista, colores)
+        ]
+    return figuras
+
+
+def renderizar_html(principio, vista, modo, df_filtrado, figuras, script_plotly):
+    """HTML completo del reporte; el bundle de plotly.js se referencia una sola vez"""
+    unidades = df_filtrado['unidades'].sum()
+    ventas = df_filtrado['ventas'].sum()
+    precio_promedio = ventas / unidades if unidades > 0 else 0
+    info = (f"📊 Registros: {len(df_filtrado):,} | 📦 Total Unidades: {unidades:,.0f} | "
+            f"💰 Total Ventas: ${ventas:,.0f} | 💵 Precio Promedio: ${precio_promedio:,.0f}")
+
+    graficos = '\n'.join(
+        f'<div class="grafico">{fig.to_html(full_html=False, include_plotlyjs=False)}</div>'
+        for fig in figuras
+    )
+    return PLANTILLA_HTML.format(
+        titulo=f"{principio} - Vista {vista.title()}",
+        subtitulo=f"{NOMBRES_MODO[modo]} · Generado el {datetime.now():%Y-%m-%d %H:%M}",
+        info=info, graficos=graficos, script_plotly=script_plotly,
+        texto=CORPORATE_COLORS['dark_blue'], primario=CORPORATE_COLORS['primary_blue'],
+        oscuro=CORPORATE_COLORS['dark_blue']
+    )
+
+
+def _iniciar_worker(file_path, fingerprint, colores, script_plotly):
+    """Abre el dataset compartido una vez por proceso del pool"""
+    procesador = OptimizedDataProcessor()
+    if fingerprint is None or not procesador.open_arrow(fingerprint):
+        # Sin Arrow (pyarrow no instalado o datos de muestra): carga normal
+        procesador.load_data(file_path)
+    _worker.update(df=procesador.df, colores=colores, script_plotly=script_plotly)
+
+
+def generar_reportes_principio(principio, trabajos, directorio):
+    """Genera los reportes pendientes de un principio activo (filtra una sola vez)
+
+    trabajos: lista de (vista, modo, huella). Retorna lista de (vista, modo, huella, archivo, segundos).
+    """
+    df_principio = filtrar_datos(_worker['df'], [principio], [], [], [], 'con', [])
+    generados = []
+    for vista, modo, huella in trabajos:
+        t0 = time.time()
+        figuras = figuras_reporte(df_principio, vista, modo, _worker['colores'])
+        df_modo = filtrar_datos(df_principio, [], [], [], [], modo, [])
+        html = renderizar_html(principio, vista, modo, df_modo, figuras, _worker['script_plotly'])
+
+        archivo = nombre_archivo(principio, vista, modo)
+        ruta = os.path.join(directorio, archivo)
+        tmp_path = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, ruta)
+        generados.append((vista, modo, huella, archivo, round(time.time() - t0, 3)))
+    return generados
+
+
+def preparar_bundle_plotly(directorio, modo_plotlyjs):
+    """Etiqueta <script> de plotly.js: 'directory' copia el bundle una vez a la salida"""
+    if modo_plotlyjs == 'cdn':
+        from plotly.offline import get_plotlyjs_version
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+
+    from plotly.offline import get_plotlyjs
+    ruta = os.path.join(directorio, 'plotly.min.js')
+    if not os.path.exists(ruta):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+    return '<script src="plotly.min.js"></script>'
+
+
+def escribir_indice(directorio, manifiesto):
+    """index.html con enlaces a todos los reportes del manifiesto"""
+    por_principio = {}
+    for entrada in manifiesto.values():
+        por_principio.setdefault(entrada['principio'], []).append(entrada)
+
+    filas = []
+    for principio in sorted(por_principio):
+        enlaces = ' · '.join(
+            f'<a href="{e["archivo"]}">{e["vista"].title()} / {NOMBRES_MODO[e["modo"]]}</a>'
+            for e in sorted(por_principio[principio],
+                            key=lambda e: (VISTAS.index(e['vista']), MODOS_CENABAST.index(e['modo'])))
+        )
+        filas.append(f'<tr><td><b>{principio}</b></td><td>{enlaces}</td></tr>')
+
+    html = PLANTILLA_HTML.format(
+        titulo="Reportes por Principio Activo",
+        subtitulo=f"{len(por_principio)} principios activos · Actualizado el {datetime.now():%Y-%m-%d %H:%M}",
+        info=f"{len(manifiesto)} reportes",
+        graficos=f'<table class="grafico">{"".join(filas)}</table>', script_plotly='',
+        texto=CORPORATE_COLORS['dark_blue'], primario=CORPORATE_COLORS['primary_blue'],
+        oscuro=CORPORATE_COLORS['dark_blue']
+    )
+    with open(os.path.join(directorio, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+
+def ejecutar(args):
+    os.makedirs(args.salida, exist_ok=True)
+
+    # Carga única: deja el dataset procesado en el archivo Arrow que abren los workers
+    procesador = OptimizedDataProcessor()
+    procesador.load_data(args.archivo)
+    df = procesador.df
+    fingerprint = None
+    if procesador.file_path:
+        fingerprint = procesador.source_fingerprint(procesador.file_path)
+        if procesador.arrow_table is None and not procesador.open_arrow(fingerprint):
+            if not procesador.persist_arrow(fingerprint):
+                fingerprint = None
+
+    principios = args.principios or sorted(df['principio_activo'].dropna().unique())
+    huellas = huellas_por_principio(df)
+    colores = asignar_colores_proveedores(df, 'grupo_proveedor')[0]
+    contexto = f"{calcular_version_codigo()}|{json.dumps(colores, sort_keys=True)}"
+    manifiesto = {} if args.forzar else cargar_manifiesto(args.salida)
+
+    # Reportes cuya huella cambió (o cuyo archivo no existe)
+    pendientes = {}
+    omitidos = 0
+    for principio in principios:
+        if principio not in huellas:
+            print(f"Principio activo sin datos: {principio}")
+            continue
+        for vista in args.vistas:
+            for modo in args.modos:
+                archivo = nombre_archivo(principio, vista, modo)
+                huella = huella_reporte(huellas[principio], vista, modo, contexto)
+                previa = manifiesto.get(archivo)
+                if (previa and previa['huella'] == huella and
+                        os.path.exists(os.path.join(args.salida, archivo))):
+                    omitidos += 1
+                    continue
+                pendientes.setdefault(principio, []).append((vista, modo, huella))
+
+    total = sum(len(t) for t in pendientes.values())
+    print(f"Reportes a generar: {total} | sin cambios (omitidos): {omitidos}")
+
+    inicio = time.time()
+    errores = 0
+    if pendientes:
+        script_plotly = preparar_bundle_plotly(args.salida, args.plotlyjs)
+        # Principios con más filas primero para repartir mejor la carga
+        filas_principio = df['principio_activo'].value_counts()
+        orden = sorted(pendientes, key=lambda p: -filas_principio.get(p, 0))
+
+        try:
+            with ProcessPoolExecutor(max_workers=args.procesos, initializer=_iniciar_worker,
+                                     initargs=(procesador.file_path, fingerprint, colores,
+                                               script_plotly)) as pool:
+                futuros = {pool.submit(generar_reportes_principio, p, pendientes[p], args.salida): p
+                           for p in orden}
+                for i, futuro in enumerate(as_completed(futuros), 1):
+                    principio = futuros[futuro]
+                    try:
+                        generados = futuro.result()
+                    except Exception as e:
+                        errores += 1
+                        print(f"Error generando reportes de {principio}: {str(e)}")
+                        continue
+                    for vista, modo, huella, archivo, segundos in generados:
+                        manifiesto[archivo] = {'archivo': archivo, 'principio': principio, 'vista': vista, 'modo': modo,
+                                               'huella': huella, 'segundos': segundos,
+                                               'generado': datetime.now().isoformat(timespec='seconds')}
+                    print(f"[{i}/{len(futuros)}] {principio}: {len(generados)} reportes")
+        finally:
+            # Lo generado hasta aquí queda registrado aunque la corrida se interrumpa
+            guardar_manifiesto(args.salida, manifiesto)
+
+    escribir_indice(args.salida, manifiesto)
+    print(f"Reportes completados en {time.time() - inicio:.1f}s "
+          f"({total} generados, {omitidos} omitidos, {errores} principios con error)")
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reportes HTML estáticos por principio activo')
+    parser.add_argument('--archivo', help='Excel de origen (por defecto las rutas habituales)')
+    parser.add_argument('--salida', default='reportes', help='Directorio de salida')
+    parser.add_argument('--principios', nargs='+', help='Solo estos principios activos')
+    parser.add_argument('--vistas', nargs='+', choices=VISTAS, default=VISTAS)
+    parser.add_argument('--modos', nargs='+', choices=MODOS_CENABAST, default=MODOS_CENABAST)
+    parser.add_argument('--procesos', type=int, default=os.cpu_count(),
+                        help='Procesos del pool (por defecto uno por CPU)')
+    parser.add_argument('--plotlyjs', choices=['directory', 'cdn'], default='directory',
+                        help="'directory' copia plotly.min.js a la salida (funciona sin internet)")
+    parser.add_argument('--forzar', action='store_true', help='Regenera aunque la huella no haya cambiado')
+    args = parser.parse_args()
+
+    if ejecutar(args):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Serialización compacta de las respuestas del dashboard farmacéutico
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+- JSON de figuras con orjson (maneja tipos de Plotly y NumPy sin pasar por el
+  encoder estándar) cuando está instalado
+- compresión gzip/brotli de las respuestas con flask-compress, que reduce el
+  tráfico por el túnel de ngrok y las actualizaciones de callbacks
+- stream Arrow IPC para los endpoints de datos (formato=arrow): los clientes
+  Python/BI leen las columnas sin parsear JSON
+Las dependencias son opcionales: sin ellas la app funciona igual que antes.
+"""
+
+import io
+
+import plotly.io as pio
+
+try:
+    import orjson
+except ImportError:  # el encoder estándar sigue funcionando
+    orjson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # formato=arrow no disponible
+    pa = None
+    pa_ipc = None
+
+
+# Respuestas más chicas que esto no se comprimen (el costo supera el ahorro)
+TAMANO_MINIMO_COMPRESION = 500
+
+TIPO_ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+# Sufijos que flask-compress agrega al ETag de una respuesta comprimida ("<etag>:gzip")
+ALGORITMOS_COMPRESION = ('br', 'gzip', 'deflate', 'zstd')
+
+
+def configurar_serializacion(app):
+    """Activa el encoder JSON rápido y la compresión de respuestas en la app Dash"""
+    if orjson is not None:
+        # Dash serializa las respuestas de callbacks con el motor JSON de Plotly
+        pio.json.config.default_engine = 'orjson'
+    else:
+        print("orjson no está instalado; se usa el encoder JSON estándar")
+
+    if Compress is None:
+        print("flask-compress no está instalado; las respuestas se envían sin comprimir")
+        return
+
+    server = app.server
+    server.config.setdefault('COMPRESS_ALGORITHM', ['br', 'gzip'])
+    server.config.setdefault('COMPRESS_MIN_SIZE', TAMANO_MINIMO_COMPRESION)
+    server.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    Compress(server)
+
+
+def etag_coincidente(if_none_match, etag):
+    """Validador de If-None-Match que corresponde al ETag, o None
+
+    flask-compress reescribe el ETag de las respuestas comprimidas como
+    "<etag>:<algoritmo>" y el navegador revalida con ese valor; se acepta también
+    esa forma para responder 304 en la vista, sin armar ni comprimir el cuerpo.
+    """
+    for candidato in (etag,) + tuple(f'{etag}:{algoritmo}' for algoritmo in ALGORITMOS_COMPRESION):
+        if if_none_match.contains(candidato):
+            return candidato
+    return None
+
+
+def arrow_disponible():
+    return pa is not None
+
+
+def _con_metadatos(schema, metadatos):
+    if not metadatos:
+        return schema
+    return schema.with_metadata({
+        **(schema.metadata or {}),
+        **{str(k).encode(): str(v).encode() for k, v in metadatos.items()}
+    })
+
+
+def dataframe_a_arrow(df, metadatos=None):
+    """Bytes de un stream Arrow IPC con el DataFrame completo (respuestas chicas, cacheables)"""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.replace_schema_metadata(_con_metadatos(tabla.schema, metadatos).metadata)
+    destino = io.BytesIO()
+    with pa_ipc.new_stream(destino, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return destino.getvalue()
+
+
+def stream_arrow(lotes, schema, metadatos=None):
+    """Genera los bytes de un stream Arrow IPC a medida que llegan los record batches
+
+    Cada lote se escribe y se entrega enseguida, sin juntar el resultado completo.
+    """
+    schema = _con_metadatos(schema, metadatos)
+    destino = io.BytesIO()
+    with pa_ipc.new_stream(destino, schema) as writer:
+        for lote in lotes:
+            writer.write_batch(lote)
+            yield destino.getvalue()
+            destino.seek(0)
+            destino.truncate(0)
+    # Marca de fin de stream
+    yield destino.getvalue()
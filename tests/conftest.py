@@ -0,0 +1,39 @@
+"""
+Fixtures compartidas de las pruebas del dashboard farmacéutico
+Autor: Sistema automatizado
+Fecha: Junio 2025
+
+Las pruebas usan el generador de licitaciones sintéticas del benchmark (mismo
+formato que la hoja 'Data' del Excel), así no dependen del archivo real.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generar_datos_sinteticos
+from data_processor import OptimizedDataProcessor
+
+
+def crear_procesador(n_filas=4000, seed=7, **kwargs):
+    """Procesador listo para consultar con datos sintéticos procesados y estructuras derivadas"""
+    procesador = OptimizedDataProcessor(**kwargs)
+    procesador.df = generar_datos_sinteticos(n_filas, seed=seed)
+    procesador.process_data()
+    procesador.build_derived_state()
+    procesador.generacion = 1
+    procesador.ready.set()
+    return procesador
+
+
+@pytest.fixture(scope='session')
+def procesador():
+    return crear_procesador()
+
+
+@pytest.fixture(scope='session')
+def df(procesador):
+    return procesador.df
@@ -0,0 +1,91 @@
+"""API de agregados: consulta normalizada, ETag por generación y totales iguales a los registros"""
+
+import pytest
+from flask import Flask
+
+import api_agregados
+from api_agregados import registrar_api_agregados
+from coalescencia import CacheLRU
+from conftest import crear_procesador
+
+
+@pytest.fixture
+def cliente(procesador):
+    server = Flask(__name__)
+    registrar_api_agregados(server, procesador)
+    return server.test_client()
+
+
+def test_agregados_orden_de_parametros_no_cambia_la_etag(cliente, df):
+    principios = sorted(df['principio_activo'].unique())[:2]
+    a = cliente.get(f'/api/v1/agregados/anual?principio={principios[0]}&principio={principios[1]}&cenabast=sin')
+    b = cliente.get(f'/api/v1/agregados/anual?cenabast=sin&principio={principios[1]}&principio={principios[0]}')
+    assert a.status_code == b.status_code == 200
+    assert a.headers['ETag'] == b.headers['ETag']
+
+    esperado = df[df['principio_activo'].isin(principios) & ~df['es_cenabast']]['ventas'].sum()
+    assert sum(a.get_json()['datos']['ventas']) == pytest.approx(esperado)
+
+
+@pytest.mark.parametrize('vista', ['anual', 'mensual'])
+@pytest.mark.parametrize('cenabast', ['con', 'sin', 'solo', 'ambos'])
+def test_agregados_sin_filtros_suman_los_registros(cliente, df, vista, cenabast):
+    cuerpo = cliente.get(f'/api/v1/agregados/{vista}?cenabast={cenabast}').get_json()
+    datos = df if cenabast in ('con', 'ambos') else df[df['es_cenabast'] == (cenabast == 'solo')]
+    assert sum(cuerpo['datos']['ventas']) == pytest.approx(datos['ventas'].sum())
+    assert sum(cuerpo['datos']['registros']) == len(datos)
+
+
+@pytest.mark.parametrize('query', ['/api/v1/agregados/semanal', '/api/v1/agregados/anual?cenabast=todos',
+                                   '/api/v1/agregados/anual?formato=xml'])
+def test_agregados_consulta_invalida(cliente, query):
+    respuesta = cliente.get(query)
+    assert respuesta.status_code == 400
+    assert 'error' in respuesta.get_json()
+
+
+def test_agregados_etag_cambia_al_recargar(cliente, procesador):
+    antes = cliente.get('/api/v1/agregados/anual')
+    procesador.generacion += 1
+    try:
+        despues = cliente.get('/api/v1/agregados/anual', headers={'If-None-Match': antes.headers['ETag']})
+    finally:
+        procesador.generacion -= 1
+    assert despues.status_code == 200
+    assert despues.headers['ETag'] != antes.headers['ETag']
+    assert despues.headers['X-Generacion-Datos'] == str(procesador.generacion + 1)
+
+
+
+def test_agregados_revalidacion_con_etag_comprimida(procesador, monkeypatch):
+    flask_compress = pytest.importorskip('flask_compress')
+    server = Flask(__name__)
+    flask_compress.Compress(server)
+    registrar_api_agregados(server, procesador)
+    cliente = server.test_client()
+
+    respuesta = cliente.get('/api/v1/agregados/anual', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    etag = respuesta.headers['ETag']
+
+    # La vista responde 304 sin volver a calcular ni serializar
+    def no_llamar(*args):
+        raise AssertionError('se recalculó una respuesta vigente')
+    monkeypatch.setattr(api_agregados, 'RESPUESTAS', CacheLRU(4))
+    monkeypatch.setattr(api_agregados, 'calcular_agregados', no_llamar)
+    revalidada = cliente.get('/api/v1/agregados/anual', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidada.status_code == 304
+    assert revalidada.headers['ETag'] == etag
+
+def test_consulta_filtrada_no_calcula_la_vista_diferida(df):
+    procesador = crear_procesador(1500, seed=5)
+    server = Flask(__name__)
+    registrar_api_agregados(server, procesador)
+    principio = df['principio_activo'].iloc[0]
+
+    respuesta = server.test_client().get(f'/api/v1/agregados/mensualizado?principio={principio}')
+    assert respuesta.status_code == 200
+    assert ('mensualizado', 'con') not in procesador.derived['agregados_base']
+
+    procesador.build_agregados_diferidos_async().join()
+    assert ('mensualizado', 'con') in procesador.derived['agregados_base']
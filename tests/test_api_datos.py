@@ -0,0 +1,56 @@
+"""API de datos de templates/index.html: consulta normalizada, ETag y totales"""
+
+import pytest
+from flask import Flask
+
+import api_datos
+from api_datos import registrar_api_datos
+from coalescencia import CacheLRU
+
+
+@pytest.fixture
+def cliente(procesador):
+    server = Flask(__name__)
+    registrar_api_datos(server, procesador)
+    return server.test_client()
+
+
+def test_datos_misma_etag_con_coma_o_repetidos(cliente, df):
+    principios = sorted(df['principio_activo'].unique())[:2]
+    separados = cliente.get(f'/data?principioActivo={principios[0]},{principios[1]}')
+    repetidos = cliente.get(f'/data?principioActivo={principios[1]}&principioActivo={principios[0]}&organismo=Todos')
+    assert separados.status_code == repetidos.status_code == 200
+    assert separados.headers['ETag'] == repetidos.headers['ETag']
+
+    filas = separados.get_json()
+    esperado = df[df['principio_activo'].isin(principios)]['ventas'].sum()
+    assert sum(f['ventas'] for f in filas) == pytest.approx(esperado, abs=len(filas))
+
+
+def test_datos_if_none_match_responde_304(cliente):
+    respuesta = cliente.get('/data')
+    revalidada = cliente.get('/data', headers={'If-None-Match': respuesta.headers['ETag']})
+    assert revalidada.status_code == 304
+    assert revalidada.data == b''
+
+
+def test_datos_revalidacion_con_etag_comprimida(procesador, monkeypatch):
+    flask_compress = pytest.importorskip('flask_compress')
+    server = Flask(__name__)
+    flask_compress.Compress(server)
+    registrar_api_datos(server, procesador)
+    cliente = server.test_client()
+
+    respuesta = cliente.get('/data', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    etag = respuesta.headers['ETag']
+    assert etag.endswith(':gzip"')
+
+    # La vista responde 304 sin volver a armar el cuerpo
+    def no_llamar(*args):
+        raise AssertionError('se recalculó una respuesta vigente')
+    monkeypatch.setattr(api_datos, 'RESPUESTAS', CacheLRU(4))
+    monkeypatch.setattr(api_datos, '_datos_agregados', no_llamar)
+    revalidada = cliente.get('/data', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidada.status_code == 304
+    assert revalidada.headers['ETag'] == etag
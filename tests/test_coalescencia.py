@@ -0,0 +1,89 @@
+"""Single-flight y caché LRU: un solo cálculo por clave aunque lleguen requests en paralelo"""
+
+import threading
+import time
+
+from coalescencia import SingleFlight, CacheLRU, ORIGEN_CACHE, ORIGEN_COMPARTIDO, ORIGEN_CALCULADO
+
+
+def test_cache_lru_descarta_la_menos_usada():
+    cache = CacheLRU(2)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2)
+    assert cache.obtener('a') == 1
+    cache.guardar('c', 3)
+    assert 'b' not in cache
+    assert cache.obtener('a') == 1 and cache.obtener('c') == 3
+    assert len(cache) == 2
+
+
+def test_single_flight_comparte_un_calculo():
+    vuelo, llamadas, resultados = SingleFlight(), [], []
+    barrera = threading.Barrier(8)
+
+    def calcular():
+        llamadas.append(1)
+        time.sleep(0.1)
+        return 'resultado'
+
+    def request():
+        barrera.wait()
+        resultados.append(vuelo.ejecutar('clave', calcular))
+
+    hilos = [threading.Thread(target=request) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(llamadas) == 1
+    assert sorted(origen for _, origen in resultados) == [ORIGEN_CALCULADO] + [ORIGEN_COMPARTIDO] * 7
+    assert {resultado for resultado, _ in resultados} == {'resultado'}
+
+
+def test_single_flight_guarda_en_cache_antes_de_liberar():
+    vuelo, cache, llamadas = SingleFlight(), CacheLRU(4), []
+
+    def calcular():
+        llamadas.append(1)
+        time.sleep(0.02)
+        return len(llamadas)
+
+    hilos = [threading.Thread(target=vuelo.ejecutar, args=('clave', calcular, cache)) for _ in range(30)]
+    for hilo in hilos:
+        hilo.start()
+        time.sleep(0.002)
+    for hilo in hilos:
+        hilo.join()
+
+    # Los que llegan después de terminado el cálculo lo encuentran en la caché
+    assert len(llamadas) == 1
+    assert cache.obtener('clave') == 1
+    # Un acierto de caché no cuenta como espera compartida
+    assert vuelo.ejecutar('clave', calcular, cache) == (1, ORIGEN_CACHE)
+
+
+def test_single_flight_propaga_el_error_a_los_que_esperan():
+    vuelo, errores = SingleFlight(), []
+    barrera = threading.Barrier(4)
+
+    def fallar():
+        time.sleep(0.05)
+        raise ValueError('falló')
+
+    def request():
+        barrera.wait()
+        try:
+            vuelo.ejecutar('clave', fallar)
+        except ValueError as e:
+            errores.append(str(e))
+
+    hilos = [threading.Thread(target=request) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == ['falló'] * 4
+
+    # Un error no queda registrado: el siguiente intento vuelve a calcular
+    assert vuelo.ejecutar('clave', lambda: 'ok') == ('ok', ORIGEN_CALCULADO)
@@ -0,0 +1,72 @@
+"""Arranque rápido: dataset Arrow compartido entre workers + snapshot de estructuras derivadas"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import crear_procesador
+from data_processor import OptimizedDataProcessor, SNAPSHOT_VERSION
+
+pytest.importorskip('pyarrow')
+
+HUELLA = '123-456'
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    return {'arrow_path': str(tmp_path / 'datos.arrow'), 'snapshot_path': str(tmp_path / 'snapshot.pkl')}
+
+
+@pytest.fixture
+def guardado(rutas):
+    procesador = crear_procesador(1500, seed=3, **rutas)
+    assert procesador.persist_arrow(HUELLA)
+    return procesador
+
+
+def test_arrow_abre_los_mismos_registros(guardado, rutas):
+    procesador = OptimizedDataProcessor(**rutas)
+    assert procesador.open_arrow(HUELLA)
+    assert procesador.arrow_table is not None
+    columnas = ['fecha', 'año', 'mes', 'grupo_proveedor', 'es_cenabast', 'unidades', 'ventas', 'precio']
+    pd.testing.assert_frame_equal(procesador.df[columnas], guardado.df[columnas].reset_index(drop=True),
+                                  check_categorical=False)
+    assert (procesador.df['año_mes'] == guardado.df['año_mes'].reset_index(drop=True)).all()
+
+
+def test_arrow_de_otra_fuente_no_se_abre(guardado, rutas):
+    procesador = OptimizedDataProcessor(**rutas)
+    assert not procesador.open_arrow('otra')
+    assert procesador.df is None
+
+
+def test_snapshot_restaura_las_estructuras_sobre_el_arrow(guardado, rutas):
+    assert guardado.save_snapshot(HUELLA)
+    procesador = OptimizedDataProcessor(**rutas)
+    assert procesador.open_arrow(HUELLA) and procesador.restore_snapshot(HUELLA)
+    assert len(procesador.df) == len(guardado.df)
+    assert set(procesador.derived) == set(guardado.derived)
+
+    acumulados, originales = procesador.derived['acumulados'], guardado.derived['acumulados']
+    assert np.array_equal(acumulados['ventas'], originales['ventas'])
+
+
+def test_snapshot_con_otra_huella_no_se_usa(guardado, rutas):
+    assert guardado.save_snapshot(HUELLA)
+    procesador = OptimizedDataProcessor(**rutas)
+    procesador.df = guardado.df
+    assert not procesador.restore_snapshot('otra')
+    assert procesador.derived == {}
+
+
+def test_snapshot_de_otra_version_se_descarta_sin_leer_el_resto(guardado, rutas, capsys):
+    with open(rutas['snapshot_path'], 'wb') as f:
+        pickle.dump({'version': SNAPSHOT_VERSION + '-viejo', 'fingerprint': HUELLA}, f)
+        f.write(b'no es un pickle')
+
+    procesador = OptimizedDataProcessor(**rutas)
+    assert procesador.open_arrow(HUELLA)
+    assert not procesador.restore_snapshot(HUELLA)
+    assert 'desactualizado' in capsys.readouterr().out
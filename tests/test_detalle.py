@@ -0,0 +1,95 @@
+"""Drill-down: las licitaciones de una barra suman lo mismo que la barra"""
+
+import pandas as pd
+import pytest
+
+from detalle import (construir_indice_filas, periodo_a_meses, filas_seleccion, aplicar_filtro_tabla,
+                     _separar_filtro, formatear_detalle, filtrar_y_ordenar_detalle, pagina_detalle)
+from utils import NOMBRE_OTROS, agregar_datos_por_vista
+
+
+SIN_FILTROS = {'principios': [], 'organismos': [], 'concentraciones': [], 'grupos': [],
+               'cenabast': 'con', 'opciones': []}
+
+
+def seleccion(serie, periodo, vista, excluir=None, filtros=SIN_FILTROS):
+    return {'serie': serie, 'periodo': periodo, 'vista': vista, 'excluir': excluir, 'filtros': filtros}
+
+
+def test_periodo_a_meses():
+    assert periodo_a_meses('anual', 2024) == [(2024, mes) for mes in range(1, 13)]
+    assert periodo_a_meses('anual', '2024.0') == [(2024, mes) for mes in range(1, 13)]
+    assert periodo_a_meses('mensual', '2024-03') == [(2024, 3)]
+    assert periodo_a_meses('mensual', '2024-03-01') == [(2024, 3)]
+    assert periodo_a_meses('mensualizado', 'Marzo') is None
+
+
+@pytest.mark.parametrize('vista', ['anual', 'mensual'])
+def test_filas_de_la_barra_suman_la_barra(procesador, df, vista):
+    agregado = agregar_datos_por_vista(df, vista, 'con')
+    indice = procesador.derived['indice_filas']
+    for _, barra in agregado[agregado['grupo_proveedor'] == 'FRESENIUS CORP'].head(6).iterrows():
+        filas = filas_seleccion(df, indice, seleccion('FRESENIUS CORP', barra['periodo'], vista))
+        assert filas['ventas'].sum() == pytest.approx(barra['ventas'])
+        assert filas['unidades'].sum() == pytest.approx(barra['unidades'])
+
+
+def test_filas_de_otros_suman_la_barra_de_otros(procesador, df):
+    agregado = agregar_datos_por_vista(df, 'anual', 'con', top_proveedores=5)
+    nombres = list(dict.fromkeys(agregado['grupo_proveedor']))
+    assert NOMBRE_OTROS in nombres
+
+    barra = agregado[agregado['grupo_proveedor'] == NOMBRE_OTROS].iloc[0]
+    excluir = [n for n in nombres if n != NOMBRE_OTROS]
+    filas = filas_seleccion(df, procesador.derived['indice_filas'],
+                            seleccion(NOMBRE_OTROS, barra['periodo'], 'anual', excluir))
+    assert not filas['grupo_proveedor'].isin(excluir).any()
+    assert filas['ventas'].sum() == pytest.approx(barra['ventas'])
+
+
+def test_filas_respetan_los_filtros_del_clic(procesador, df):
+    filtros = dict(SIN_FILTROS, cenabast='solo')
+    filas = filas_seleccion(df, procesador.derived['indice_filas'],
+                            seleccion('FRESENIUS CORP', 2022, 'anual', filtros=filtros))
+    esperadas = df[(df['grupo_proveedor'] == 'FRESENIUS CORP') & (df['año'] == 2022) & df['es_cenabast']]
+    assert len(filas) == len(esperadas)
+    assert filas['ventas'].sum() == pytest.approx(esperadas['ventas'].sum())
+
+
+def test_mensualizado_incluye_contratos_que_cubren_el_mes():
+    contratos = pd.DataFrame({
+        'grupo_proveedor': ['A', 'A', 'A', 'A'],
+        'fecha': pd.to_datetime(['2024-11-15', '2024-06-01', '2024-01-10', '2024-05-20']),
+        'duracion_contrato_meses': [3, 2, 1, None],
+        'principio_activo': 'X', 'organismo': 'H', 'concentracion': '1 MG', 'es_cenabast': False,
+        'unidades': [30, 20, 10, 18], 'ventas': [300.0, 200.0, 100.0, 180.0]
+    })
+    contratos['año'] = contratos['fecha'].dt.year
+    contratos['mes'] = contratos['fecha'].dt.month
+    indice = construir_indice_filas(contratos)
+
+    # Noviembre + 3 meses cubre enero; junio + 2 no; enero + 1 sí; sin duración: 18 meses (todos)
+    filas = filas_seleccion(contratos, indice, seleccion('A', 'Enero', 'mensualizado'))
+    assert sorted(filas['unidades']) == [10, 18, 30]
+
+
+def test_separar_filtro():
+    assert _separar_filtro('{ventas} > 5') == ('ventas', 'gt', 5.0)
+    assert _separar_filtro('{unidades} ge 100') == ('unidades', 'ge', 100.0)
+    assert _separar_filtro('{organismo} contains "HOSPITAL 0001"') == ('organismo', 'contains', 'HOSPITAL 0001')
+    assert _separar_filtro('sin operador') == (None, None, None)
+
+
+def test_filtro_y_paginacion(df):
+    tabla = formatear_detalle(df.head(500))
+    filtrada = aplicar_filtro_tabla(tabla, '{unidades} ge 1000 && {grupo_proveedor} contains "proveedor"')
+    esperada = tabla[(tabla['unidades'] >= 1000) & tabla['grupo_proveedor'].str.contains('PROVEEDOR')]
+    assert len(filtrada) == len(esperada)
+
+    ordenada = filtrar_y_ordenar_detalle(tabla.head(45), [{'column_id': 'ventas', 'direction': 'desc'}], '')
+    assert ordenada['ventas'].is_monotonic_decreasing
+
+    registros, paginas, total = pagina_detalle(ordenada, 2, 20)
+    assert (paginas, total, len(registros)) == (3, 45, 5)
+    # Una página fuera de rango devuelve la última
+    assert pagina_detalle(ordenada, 10, 20)[0] == registros
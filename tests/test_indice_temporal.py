@@ -0,0 +1,59 @@
+"""Totales por rango de fechas con sumas acumuladas contra la suma directa de los registros"""
+
+import numpy as np
+import pytest
+
+from indice_temporal import indice_mes, etiqueta_mes, totales_rango, marcas_slider
+
+
+def suma_directa(df, desde, hasta, principios=None, grupos=None, cenabast=None):
+    meses = df['año'].astype('int64') * 12 + df['mes'].astype('int64') - 1
+    mascara = (meses >= desde) & (meses <= hasta)
+    if principios:
+        mascara &= df['principio_activo'].isin(principios)
+    if grupos:
+        mascara &= df['grupo_proveedor'].isin(grupos)
+    if cenabast == 'sin':
+        mascara &= ~df['es_cenabast']
+    elif cenabast == 'solo':
+        mascara &= df['es_cenabast']
+    return df.loc[mascara, 'unidades'].sum(), df.loc[mascara, 'ventas'].sum()
+
+
+def test_indice_y_etiqueta_de_mes():
+    assert indice_mes(2024, 3) == 2024 * 12 + 2
+    assert etiqueta_mes(indice_mes(2024, 3)) == '2024-03'
+    assert etiqueta_mes(indice_mes(2023, 12)) == '2023-12'
+
+
+def test_totales_rango_coinciden_con_la_suma_de_registros(procesador, df):
+    acumulados = procesador.derived['acumulados']
+    rng = np.random.default_rng(0)
+    principios = df['principio_activo'].unique()
+    grupos = df['grupo_proveedor'].unique()
+
+    for _ in range(50):
+        desde, hasta = sorted(rng.integers(acumulados['mes_inicial'], acumulados['mes_final'] + 1, 2))
+        filtro_principios = list(rng.choice(principios, 3, replace=False)) if rng.random() < 0.5 else None
+        filtro_grupos = list(rng.choice(grupos, 5, replace=False)) if rng.random() < 0.5 else None
+        cenabast = rng.choice(['con', 'sin', 'solo'])
+
+        totales = totales_rango(acumulados, desde, hasta, filtro_principios, filtro_grupos, cenabast)
+        unidades, ventas = suma_directa(df, desde, hasta, filtro_principios, filtro_grupos, cenabast)
+
+        assert totales['unidades'] == pytest.approx(unidades)
+        assert totales['ventas'] == pytest.approx(ventas)
+        assert totales['precio'] == pytest.approx(ventas / unidades if unidades else 0.0)
+
+
+def test_rango_fuera_de_los_datos_da_cero(procesador):
+    acumulados = procesador.derived['acumulados']
+    inicio = acumulados['mes_inicial']
+    assert totales_rango(acumulados, inicio - 24, inicio - 1) == {'unidades': 0.0, 'ventas': 0.0, 'precio': 0.0}
+
+
+def test_marcas_slider_por_año():
+    marcas = marcas_slider(indice_mes(2021, 6), indice_mes(2023, 2))
+    assert marcas[indice_mes(2021, 6)] == '2021-06'
+    assert marcas[indice_mes(2022, 1)] == '2022'
+    assert marcas[indice_mes(2023, 1)] == '2023'
@@ -0,0 +1,46 @@
+"""Prefetch especulativo: estados vecinos y cancelación al llegar un request real"""
+
+import threading
+import time
+
+from precalentamiento import PrefetchEspeculativo, PrefetchCancelado, estado_filtros, estados_vecinos
+
+
+def test_estados_vecinos_sin_repetir_y_mensualizado_al_final():
+    estado = estado_filtros(['X'], 'anual', 'con')
+    vecinos = estados_vecinos(estado)
+    combinaciones = [(v['vista'], v['cenabast']) for v in vecinos]
+    assert len(combinaciones) == len(set(combinaciones)) == 11
+    assert ('anual', 'con') not in combinaciones
+    assert combinaciones[0] == ('mensual', 'con')
+    vistas = [v['vista'] for v in vecinos]
+    assert vistas == sorted(vistas, key=lambda v: v == 'mensualizado')
+    assert all(v['principios'] == ['X'] for v in vecinos)
+
+
+def test_request_real_corta_el_calculo_especulativo_en_curso():
+    empezado, cortado, calculados = threading.Event(), threading.Event(), []
+
+    def obtener(estado, cancelado):
+        empezado.set()
+        # Cálculo largo por fases: revisa la cancelación entre una y otra
+        for _ in range(500):
+            if cancelado.is_set():
+                cortado.set()
+                raise PrefetchCancelado()
+            time.sleep(0.01)
+        calculados.append(estado)
+
+    prefetch = PrefetchEspeculativo(obtener, lambda estado: False, max_estados=3, cpu_segundos=60)
+    prefetch.inicio_request()
+    prefetch.fin_request(estado_filtros())
+    assert empezado.wait(2)
+
+    inicio = time.time()
+    prefetch.inicio_request()
+    assert cortado.wait(2)
+    assert time.time() - inicio < 0.5
+
+    # Mientras el request real sigue en curso no se calcula nada más
+    time.sleep(0.1)
+    assert calculados == []
@@ -0,0 +1,51 @@
+"""Perfilado bajo demanda: un request perfilado a la vez, sin romper el callback"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import profiler
+
+
+@pytest.fixture
+def perfilado(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiler, 'CALLBACKS_PERFILADOS', {'all'})
+    return tmp_path
+
+
+def callback_lento(valor):
+    time.sleep(0.1)
+    return valor * 2
+
+
+def test_callbacks_concurrentes_se_perfilan_de_a_uno(perfilado):
+    envoltura = profiler._envolver_callback(callback_lento, 'callback_lento')
+    barrera, resultados = threading.Barrier(4), []
+
+    def request(valor):
+        barrera.wait()
+        resultados.append(envoltura(valor))
+
+    hilos = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(resultados) == [0, 2, 4, 6]
+    assert len([a for a in os.listdir(perfilado) if a.endswith('.prof')]) == 1
+
+
+def test_otro_profiler_activo_no_rompe_el_callback(perfilado, monkeypatch):
+    def enable_ocupado(self):
+        raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(profiler.cProfile.Profile, 'enable', enable_ocupado)
+    envoltura = profiler._envolver_callback(callback_lento, 'callback_lento')
+    assert envoltura(21) == 42
+    assert os.listdir(perfilado) == []
+    # El lock quedó libre para el próximo request perfilado
+    assert not profiler._lock_perfil_activo.locked()
@@ -0,0 +1,116 @@
+"""Agregaciones: medidas aditivas, precio ponderado, mensualización y agrupación en "Otros" """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import (preparar_medidas_aditivas, precio_ponderado, agrupar_proveedores_menores,
+                   aplicar_logica_mensualizada_mejorada, distribucion_contratos, agregar_datos_por_vista,
+                   reagrupar_sin_separar_cenabast, filtrar_datos, MEDIDAS_ADITIVAS, NOMBRE_OTROS)
+
+
+VISTAS = ['anual', 'mensual', 'mensualizado']
+
+
+def test_precio_ponderado_por_unidades():
+    registros = preparar_medidas_aditivas(pd.DataFrame({
+        'grupo': ['A', 'A', 'B'],
+        'precio': [10.0, 20.0, 5.0],
+        'unidades': [1, 3, 0]
+    }))
+    agrupado = registros.groupby('grupo')[['unidades', 'precio_x_unidades', 'registros']].sum()
+    precios = precio_ponderado(agrupado)
+    assert precios[0] == pytest.approx((10 * 1 + 20 * 3) / 4)
+    assert precios[1] == 0
+    assert list(agrupado['registros']) == [2, 1]
+
+
+def test_preparar_medidas_aditivas_no_copia_si_ya_estan():
+    df = pd.DataFrame({'unidades': [1], 'precio_x_unidades': [2.0], 'registros': [1]})
+    assert preparar_medidas_aditivas(df) is df
+
+
+def tabla_proveedores():
+    proveedores = ['FRESENIUS CORP', 'THERAPIA IV'] + [f'P{i}' for i in range(8)]
+    ventas = [1.0, 2.0] + [100.0 * (i + 1) for i in range(8)]
+    filas = [{'año': año, 'grupo_proveedor': p, 'unidades': v / 10, 'ventas': v * (año - 2020),
+              'precio_x_unidades': v, 'registros': 1}
+             for año in (2021, 2022) for p, v in zip(proveedores, ventas)]
+    return pd.DataFrame(filas)
+
+
+def test_otros_conserva_totales_y_proveedores_fijos():
+    tabla = tabla_proveedores()
+    agrupada = agrupar_proveedores_menores(tabla, ['año', 'grupo_proveedor'], 3)
+
+    assert set(agrupada['grupo_proveedor']) == {'P7', 'P6', 'P5', 'FRESENIUS CORP', 'THERAPIA IV', NOMBRE_OTROS}
+    for medida in MEDIDAS_ADITIVAS:
+        assert (agrupada.groupby('año')[medida].sum() == tabla.groupby('año')[medida].sum()).all()
+
+
+def test_otros_no_renombra_un_solo_proveedor():
+    tabla = tabla_proveedores()
+    assert agrupar_proveedores_menores(tabla, ['año', 'grupo_proveedor'], 7) is tabla
+    assert agrupar_proveedores_menores(tabla, ['año', 'grupo_proveedor'], 0) is tabla
+
+
+def test_mensualizado_reparte_por_mes_de_contrato():
+    contratos = pd.DataFrame({
+        'fecha': pd.to_datetime(['2024-11-30', '2024-03-01']),
+        'duracion_contrato_meses': [3, 24],
+        'grupo_proveedor': ['A', 'B'],
+        'proveedor': [None, 'B1'],
+        'principio_activo': 'X', 'organismo': 'H', 'concentracion': '1 MG', 'es_cenabast': False,
+        'unidades': [30, 120], 'ventas': [300.0, 1200.0], 'precio': [10.0, 10.0]
+    })
+    resultado = aplicar_logica_mensualizada_mejorada(contratos)
+
+    a = resultado[resultado['grupo_proveedor'] == 'A'].sort_values('fecha')
+    # Mismo día acotado al fin de mes y un tercio por mes; la fila con proveedor vacío no se pierde
+    assert list(a['fecha'].dt.strftime('%Y-%m-%d')) == ['2024-11-30', '2024-12-30', '2025-01-30']
+    assert list(a['unidades']) == [10, 10, 10]
+    assert list(a['mes_nombre']) == ['November', 'December', 'January']
+    # La licitación se cuenta una vez, en el primer mes del contrato
+    assert list(a['registros']) == [1, 0, 0]
+
+    # Más de 12 meses: 18 meses con valores anualizados
+    b = resultado[resultado['grupo_proveedor'] == 'B']
+    assert len(b) == 18
+    assert b['unidades'].sum() == pytest.approx(120 * 18 / 12)
+    assert (b['precio'] == 10.0).all()
+
+
+def test_mensualizado_conserva_unidades_distribuidas(df):
+    muestra = df.head(2000).copy()
+    muestra.loc[muestra.index[:100], 'organismo'] = np.nan
+    resultado = aplicar_logica_mensualizada_mejorada(muestra)
+    _, meses, divisor = distribucion_contratos(muestra)
+    assert resultado['unidades'].sum() == pytest.approx((muestra['unidades'] * meses / divisor).sum())
+    assert resultado['registros'].sum() == len(muestra)
+    assert agregar_datos_por_vista(muestra, 'mensualizado', 'con')['registros'].sum() == len(muestra)
+
+
+@pytest.mark.parametrize('vista', VISTAS)
+def test_participacion_y_precio_por_periodo(df, vista):
+    agregado = agregar_datos_por_vista(df, vista, 'con')
+    por_periodo = agregado.groupby('periodo')
+    assert np.allclose(por_periodo['participacion_ventas'].sum(), 100, atol=0.2)
+    assert np.allclose(por_periodo['ventas'].sum(), por_periodo['total_ventas_periodo'].first())
+    con_unidades = agregado[agregado['unidades'] > 0]
+    assert np.allclose(con_unidades['precio'], con_unidades['precio_x_unidades'] / con_unidades['unidades'])
+
+
+def test_totales_anuales_coinciden_con_registros(df):
+    for modo in ['con', 'sin', 'solo', 'ambos']:
+        datos = filtrar_datos(df, [], [], [], [], modo, [])
+        agregado = agregar_datos_por_vista(datos, 'anual', modo)
+        assert agregado['ventas'].sum() == pytest.approx(datos['ventas'].sum())
+        assert agregado['registros'].sum() == len(datos)
+
+
+@pytest.mark.parametrize('vista', VISTAS)
+def test_con_desde_ambos_igual_a_agregar_directo(df, vista):
+    directo = agregar_datos_por_vista(df, vista, 'con')
+    reagrupado = reagrupar_sin_separar_cenabast(agregar_datos_por_vista(df, vista, 'ambos'), vista)
+    pd.testing.assert_frame_equal(directo.reset_index(drop=True), reagrupado.reset_index(drop=True),
+                                  check_exact=False, rtol=1e-9)
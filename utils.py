@@ -4,8 +4,10 @@ Autor: Sistema automatizado
 Fecha: Junio 2025
 """
 
+import os
 import pandas as pd
 import numpy as np
+import plotly.io as pio
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
@@ -36,7 +38,10 @@ PROVIDER_COLOR_MAP = {
     'Fresenius Kabi': CORPORATE_COLORS['primary_blue'],  # Azul corporativo (alternativo)
     'FRESENIUS CORP - CENABAST': CORPORATE_COLORS['vital_blue'],  # Azul claro para CENABAST
     'THERAPIA IV - CENABAST': '#FF6B6B',  # Rojo claro para CENABAST
-    'Fresenius Kabi - CENABAST': CORPORATE_COLORS['vital_blue']  # Azul claro para CENABAST (alternativo)
+    'Fresenius Kabi - CENABAST': CORPORATE_COLORS['vital_blue'],  # Azul claro para CENABAST (alternativo)
+    'Otros': '#B0B0B0',  # Gris para los proveedores agrupados
+    'Otros - No CENABAST': '#B0B0B0',
+    'Otros - CENABAST': '#D3D3D3'
 }
 
 # Mapeo de meses en inglés a español
@@ -56,6 +61,31 @@ MESES_ESPANOL = {
 }
 
 
+# Decimales con que se muestran las medidas (no se envían más al navegador)
+DECIMALES_MEDIDAS = {
+    'unidades': 0,
+    'ventas': 0,
+    'precio': 2,
+    'participacion_unidades': 1,
+    'participacion_ventas': 1
+}
+
+
+def registrar_plantilla_compacta(nombre='dashboard'):
+    """Registra una copia de la plantilla 'plotly' solo con los tipos de traza usados
+    
+    La plantilla por defecto incluye estilos para ~25 tipos de traza (mapas, 3D,
+    contornos, etc.) que viajan en cada figura; el aspecto de barras y líneas no cambia.
+    """
+    base = pio.templates['plotly'].to_plotly_json()
+    base['data'] = {tipo: base['data'][tipo] for tipo in ('bar', 'scatter') if tipo in base['data']}
+    pio.templates[nombre] = go.layout.Template(base)
+    pio.templates.default = nombre
+
+
+registrar_plantilla_compacta()
+
+
 def convertir_meses_espanol(df):
     """Convierte nombres de meses del inglés al español"""
     df_resultado = df.copy()
@@ -88,6 +118,98 @@ def convertir_meses_espanol(df):
     return df_resultado
 
 
+# Medidas que se suman en cada nivel de agregación; el precio se deriva de ellas
+MEDIDAS_ADITIVAS = {
+    'unidades': 'sum',
+    'ventas': 'sum',
+    'precio_x_unidades': 'sum',
+    'registros': 'sum'
+}
+
+
+# Proveedores con serie propia en los gráficos (los de más ventas); el resto se
+# agrupa en "Otros" para acotar la cantidad de trazas. 0 desactiva la agrupación
+TOP_PROVEEDORES = int(os.environ.get('DASHBOARD_TOP_PROVEEDORES', '15'))
+PROVEEDORES_SIEMPRE_VISIBLES = ('FRESENIUS CORP', 'THERAPIA IV')
+NOMBRE_OTROS = 'Otros'
+
+# Claves de período de cada vista temporal
+CLAVES_PERIODO = {
+    'anual': ['año'],
+    'mensual': ['año', 'mes'],
+    'mensualizado': ['mes_nombre']
+}
+
+
+# Columnas que usa agregar_datos_por_vista (claves de agrupación y medidas)
+COLUMNAS_AGREGACION = ['año', 'mes', 'mes_nombre', 'grupo_proveedor', 'es_cenabast',
+                       'unidades', 'ventas', 'precio', 'precio_x_unidades', 'registros']
+
+
+def preparar_medidas_aditivas(df):
+    """Agrega las medidas aditivas de precio: precio × unidades y cantidad de registros
+    
+    Sumadas en cualquier nivel de agregación permiten derivar al final el precio
+    ponderado por unidades (ver precio_ponderado) sin promediar promedios.
+    """
+    if 'precio_x_unidades' in df.columns and 'registros' in df.columns:
+        return df
+    
+    df = df.copy()
+    if 'precio_x_unidades' not in df.columns:
+        precio = pd.to_numeric(df['precio'], errors='coerce') if 'precio' in df.columns else np.nan
+        df['precio_x_unidades'] = (precio * df['unidades']).fillna(0)
+    if 'registros' not in df.columns:
+        df['registros'] = 1
+    return df
+
+
+def precio_ponderado(df):
+    """Precio promedio ponderado por unidades a partir de las medidas aditivas"""
+    return np.where(df['unidades'] > 0, df['precio_x_unidades'] / df['unidades'].where(df['unidades'] > 0, 1), 0)
+
+
+def agrupar_proveedores_menores(df_agregado, claves, top_n):
+    """Junta en "Otros" los proveedores que quedan fuera de los top_n por ventas
+    
+    Los de PROVEEDORES_SIEMPRE_VISIBLES conservan su serie aunque vendan menos.
+    Las medidas son aditivas, así que los totales de cada período no cambian.
+    """
+    if not top_n or top_n <= 0:
+        return df_agregado
+    
+    ventas = df_agregado.groupby('grupo_proveedor')['ventas'].sum()
+    principales = set(ventas.nlargest(top_n).index) | set(PROVEEDORES_SIEMPRE_VISIBLES)
+    menores = ~df_agregado['grupo_proveedor'].isin(principales)
+    # Con un solo proveedor afuera no se gana nada renombrándolo
+    if df_agregado.loc[menores, 'grupo_proveedor'].nunique() < 2:
+        return df_agregado
+    
+    grupo = df_agregado['grupo_proveedor'].astype(object).where(~menores, NOMBRE_OTROS)
+    return df_agregado.assign(grupo_proveedor=grupo).groupby(claves).agg(MEDIDAS_ADITIVAS).reset_index()
+
+
+def distribucion_contratos(df):
+    """Duración efectiva, meses de distribución y divisor de valores de cada contrato
+    
+    - en blanco, NaN o cero: 18 meses (valor por defecto más conservador)
+    - ≤1 mes: 1 mes, sin dividir
+    - >1 a ≤12 meses: un mes por mes de contrato, valores divididos por esa cantidad
+    - >12 meses: 18 meses con valores anualizados (divididos por 12)
+    """
+    if 'duracion_contrato_meses' in df.columns:
+        duracion = pd.to_numeric(df['duracion_contrato_meses'], errors='coerce').to_numpy(dtype='float64')
+    else:
+        duracion = np.full(len(df), 18.0)
+    duracion = np.where(np.isnan(duracion) | (duracion <= 0), 18.0, duracion)
+    
+    corto = duracion <= 1
+    medio = ~corto & (duracion <= 12)
+    meses_distribucion = np.where(corto, 1, np.where(medio, np.maximum(1, np.round(duracion)), 18)).astype('int64')
+    divisor = np.where(corto, 1, np.where(medio, meses_distribucion, 12))
+    return duracion, meses_distribucion, divisor
+
+
 def aplicar_logica_mensualizada_mejorada(df):
     """
     Aplica la lógica mensualizada refinada con distribución real de contratos por meses:
@@ -100,6 +222,11 @@ def aplicar_logica_mensualizada_mejorada(df):
     - Creación de registros separados por cada mes de duración del contrato
     - Mejor manejo de fechas y períodos
     - Conservación de valores totales del contrato
+    
+    La expansión es vectorizada (np.repeat por fila) y año, mes y mes_nombre se
+    recalculan con la fecha de cada mes del contrato. El precio se consolida con
+    medidas aditivas (precio × unidades) y se deriva al final, ponderado por unidades.
+    'registros' cuenta licitaciones: solo el primer mes de cada contrato suma 1.
     """
     # Verificar que el DataFrame no esté vacío
     if df.empty:
@@ -112,136 +239,67 @@ def aplicar_logica_mensualizada_mejorada(df):
             print(f"Advertencia: Columna '{col}' no encontrada. Retornando DataFrame original.")
             return df.copy()
     
-    # Si no hay información de duración, crear columna con valor por defecto
-    if 'duracion_contrato_meses' not in df.columns:
-        df = df.copy()
-        df['duracion_contrato_meses'] = 18  # Valor por defecto más conservador
-    
-    # Crear lista para almacenar registros expandidos
-    registros_expandidos = []
-    
-    for idx, row in df.iterrows():
-        try:
-            duracion = row['duracion_contrato_meses']
-            fecha_inicio = pd.to_datetime(row['fecha'])
-            unidades_originales = float(row['unidades']) if pd.notna(row['unidades']) else 0
-            ventas_originales = float(row['ventas']) if pd.notna(row['ventas']) else 0
-            
-            # Manejar valores en blanco, NaN o cero
-            if pd.isna(duracion) or duracion <= 0:
-                duracion_efectiva = 18  # Asumir 18 meses por defecto
-            else:
-                duracion_efectiva = float(duracion)
-            
-            # Aplicar lógica según duración del contrato
-            if duracion_efectiva <= 1:
-                # ≤1 mes: aparecer solo en ese mes (sin división)
-                registro_mensual = row.copy()
-                registro_mensual['mes_contrato'] = 1
-                registro_mensual['duracion_aplicada'] = duracion_efectiva
-                registros_expandidos.append(registro_mensual)
-                
-            elif duracion_efectiva <= 12:
-                # >1 mes a ≤12 meses: crear registros separados para cada mes del contrato
-                meses_distribucion = max(1, int(round(duracion_efectiva)))
-                cantidad_mensual = unidades_originales / meses_distribucion
-                ventas_mensual = ventas_originales / meses_distribucion
-                
-                # Crear un registro para cada mes del contrato
-                for mes_offset in range(meses_distribucion):
-                    registro_mensual = row.copy()
-                    # Calcular fecha del mes correspondiente
-                    fecha_mes = fecha_inicio + pd.DateOffset(months=mes_offset)
-                    registro_mensual['fecha'] = fecha_mes
-                    registro_mensual['unidades'] = cantidad_mensual
-                    registro_mensual['ventas'] = ventas_mensual
-                    registro_mensual['mes_contrato'] = mes_offset + 1
-                    registro_mensual['duracion_aplicada'] = duracion_efectiva
-                    registros_expandidos.append(registro_mensual)
-                    
-            else:
-                # >12 meses O en blanco: crear registros mensuales por 18 meses (distribución anualizada)
-                meses_distribucion = 18  # Distribuir por 18 meses
-                cantidad_mensual = unidades_originales / 12  # Dividir por 12 para anualizar
-                ventas_mensual = ventas_originales / 12
-                
-                # Crear registros mensuales
-                for mes_offset in range(meses_distribucion):
-                    registro_mensual = row.copy()
-                    # Calcular fecha del mes correspondiente
-                    fecha_mes = fecha_inicio + pd.DateOffset(months=mes_offset)
-                    registro_mensual['fecha'] = fecha_mes
-                    registro_mensual['unidades'] = cantidad_mensual
-                    registro_mensual['ventas'] = ventas_mensual
-                    registro_mensual['mes_contrato'] = mes_offset + 1
-                    registro_mensual['duracion_aplicada'] = meses_distribucion
-                    registro_mensual['ciclo_anual'] = (mes_offset // 12) + 1
-                    registros_expandidos.append(registro_mensual)
-                    
-        except Exception as e:
-            print(f"Error procesando fila {idx}: {e}")
-            # En caso de error, mantener el registro original
-            registro_original = row.copy()
-            registro_original['mes_contrato'] = 1
-            registro_original['duracion_aplicada'] = 1
-            registros_expandidos.append(registro_original)
-            continue
-    
-    # Crear DataFrame con registros expandidos
-    if registros_expandidos:
-        df_mensualizado = pd.DataFrame(registros_expandidos)
-        
-        # Reagrupar por fecha y otras dimensiones para consolidar registros del mismo período
-        columnas_agrupacion = ['fecha']
-        columnas_opcionales = ['principio_activo', 'organismo', 'concentracion', 'grupo_proveedor', 'proveedor']
-        
-        # Agregar solo las columnas que existan en el DataFrame
-        for col in columnas_opcionales:
-            if col in df_mensualizado.columns:
-                columnas_agrupacion.append(col)
-        
-        # Preparar diccionario de agregación dinámico
-        agg_dict = {
-            'unidades': 'sum',
-            'ventas': 'sum'
-        }
-        
-        # Agregar columnas opcionales al diccionario de agregación
-        columnas_numericas_adicionales = ['precio', 'precio_unitario']
-        for col in columnas_numericas_adicionales:
-            if col in df_mensualizado.columns:
-                # Promedio ponderado por unidades para precios
-                agg_dict[col] = lambda x: np.average(x, weights=df_mensualizado.loc[x.index, 'unidades']) if len(x) > 0 and df_mensualizado.loc[x.index, 'unidades'].sum() > 0 else x.mean()
-        
-        # Columnas categóricas a mantener
-        columnas_categoricas = ['es_cenabast', 'tipo_compra', 'estado_contrato']
-        for col in columnas_categoricas:
-            if col in df_mensualizado.columns:
-                agg_dict[col] = 'first'
-        
-        try:
-            df_final = df_mensualizado.groupby(columnas_agrupacion).agg(agg_dict).reset_index()
-            
-            # Recalcular precio unitario promedio ponderado
-            if 'precio' not in df_final.columns and 'unidades' in df_final.columns and 'ventas' in df_final.columns:
-                # Evitar división por cero
-                df_final['precio'] = np.where(
-                    df_final['unidades'] > 0,
-                    df_final['ventas'] / df_final['unidades'],
-                    0
-                )
-            
-            # Llenar valores NaN en precio
-            if 'precio' in df_final.columns:
-                df_final['precio'] = df_final['precio'].fillna(0)
-            
-        except Exception as e:
-            print(f"Error en agrupación: {e}")
-            df_final = df_mensualizado
-        
-    else:
-        print("No se generaron registros expandidos. Retornando DataFrame original.")
-        df_final = df.copy()
+    duracion, meses_distribucion, divisor = distribucion_contratos(df)
+    largo = duracion > 12
+    
+    # Un registro por mes del contrato
+    posiciones = np.repeat(np.arange(len(df)), meses_distribucion)
+    mes_offset = np.arange(len(posiciones)) - np.repeat(np.cumsum(meses_distribucion) - meses_distribucion,
+                                                        meses_distribucion)
+    df_mensualizado = df.iloc[posiciones].reset_index(drop=True)
+    
+    for medida in ('unidades', 'ventas'):
+        valores = pd.to_numeric(df[medida], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        df_mensualizado[medida] = (valores / divisor)[posiciones]
+    
+    # Cada licitación se cuenta una sola vez, en el primer mes de su contrato
+    registros = df['registros'].to_numpy() if 'registros' in df.columns else np.ones(len(df), dtype='int64')
+    df_mensualizado['registros'] = np.where(mes_offset == 0, registros[posiciones], 0)
+    
+    # Fecha de cada mes del contrato (mismo día, acotado al último día del mes, como DateOffset)
+    fecha_inicio = pd.to_datetime(df_mensualizado['fecha'], errors='coerce')
+    valida = fecha_inicio.notna().to_numpy()
+    meses_abs = (fecha_inicio.dt.year.fillna(1970).to_numpy(dtype='int64') * 12 +
+                 fecha_inicio.dt.month.fillna(1).to_numpy(dtype='int64') - 1 + mes_offset)
+    primer_dia = pd.to_datetime(pd.DataFrame({'year': meses_abs // 12, 'month': meses_abs % 12 + 1, 'day': 1}))
+    dia = np.minimum(fecha_inicio.dt.day.fillna(1).to_numpy(dtype='int64'), primer_dia.dt.days_in_month.to_numpy())
+    hora = (fecha_inicio - fecha_inicio.dt.normalize()).fillna(pd.Timedelta(0))
+    fecha_mes = primer_dia + pd.to_timedelta(dia - 1, unit='D') + hora
+    df_mensualizado['fecha'] = fecha_mes.where(valida)
+    
+    df_mensualizado['mes_contrato'] = mes_offset + 1
+    df_mensualizado['duracion_aplicada'] = np.where(largo, 18, duracion)[posiciones]
+    df_mensualizado['ciclo_anual'] = np.where(largo[posiciones], mes_offset // 12 + 1, np.nan)
+    
+    # Reagrupar por fecha y otras dimensiones para consolidar registros del mismo período
+    columnas_agrupacion = ['fecha']
+    columnas_opcionales = ['principio_activo', 'organismo', 'concentracion', 'grupo_proveedor', 'proveedor']
+    
+    # Agregar solo las columnas que existan en el DataFrame
+    for col in columnas_opcionales:
+        if col in df_mensualizado.columns:
+            columnas_agrupacion.append(col)
+    
+    # Medidas aditivas: el precio ponderado se deriva después de sumar
+    df_mensualizado = preparar_medidas_aditivas(df_mensualizado)
+    agg_dict = dict(MEDIDAS_ADITIVAS)
+    
+    # Columnas categóricas a mantener
+    columnas_categoricas = ['es_cenabast', 'tipo_compra', 'estado_contrato']
+    for col in columnas_categoricas:
+        if col in df_mensualizado.columns:
+            agg_dict[col] = 'first'
+    
+    # dropna=False: una clave opcional vacía (p. ej. proveedor) no debe descartar la fila
+    df_final = df_mensualizado.groupby(columnas_agrupacion, observed=True, dropna=False).agg(agg_dict).reset_index()
+    df_final['precio'] = precio_ponderado(df_final)
+    
+    # Período de cada registro según el mes del contrato al que corresponde
+    df_final['año'] = df_final['fecha'].dt.year
+    df_final['mes'] = df_final['fecha'].dt.month
+    df_final['año_mes'] = df_final['fecha'].dt.to_period('M')
+    # Nombre del mes desde el número (strftime sobre millones de fechas es lo más lento)
+    df_final['mes_nombre'] = df_final['mes'].map(dict(enumerate(MESES_ESPANOL, start=1)))
     
     return df_final
 
@@ -310,6 +368,49 @@ def crear_tooltip_personalizado(row, vista, filtros_aplicados=""):
     return tooltip
 
 
+def crear_tooltips(df, vista):
+    """Versión vectorizada de crear_tooltip_personalizado (sin filtros) para todo el DataFrame"""
+    if vista == 'anual':
+        prefijo = "Año: "
+    elif vista == 'mensual':
+        prefijo = "Período: "
+    else:  # mensualizado
+        prefijo = "Mes: "
+    
+    periodo = df['periodo'].astype(str) if 'periodo' in df.columns else pd.Series('N/A', index=df.index)
+    tooltip = (prefijo + periodo +
+               "<br>Unidades: " + df['unidades'].map('{:,.0f}'.format) +
+               "<br>Ventas: $" + df['ventas'].map('{:,.0f}'.format))
+    
+    # Información de participación de mercado
+    for columna, etiqueta in (('participacion_unidades', 'Participación Unidades'),
+                              ('participacion_ventas', 'Participación Ventas')):
+        if columna in df.columns:
+            texto = "<br>" + etiqueta + ": " + df[columna].map('{:.1f}'.format) + "%"
+            tooltip = tooltip + texto.where(df[columna].notna(), "")
+    
+    return tooltip
+
+
+def preparar_datos_grafico(df, vista, columnas):
+    """Deja solo las columnas que usa el gráfico, redondeadas a la precisión mostrada, con tooltips"""
+    df_grafico = df[[c for c in dict.fromkeys(columnas) if c in df.columns]].copy()
+    df_grafico['tooltip_personalizado'] = crear_tooltips(df, vista)
+    decimales = {c: d for c, d in DECIMALES_MEDIDAS.items() if c in df_grafico.columns}
+    return df_grafico.round(decimales)
+
+
+def agregar_filtros_hover(fig, filtros_aplicados):
+    """Agrega el texto de filtros (igual para todos los puntos) una sola vez por traza"""
+    if not filtros_aplicados or filtros_aplicados == "Sin filtros":
+        return fig
+    texto = f"<br><br>Filtros: {filtros_aplicados}"
+    for traza in fig.data:
+        if traza.hovertemplate:
+            traza.hovertemplate = traza.hovertemplate.replace('%{customdata[0]}', '%{customdata[0]}' + texto, 1)
+    return fig
+
+
 def agregar_totales_barras(fig, df, y_column):
     """Agrega valores totales arriba de las barras apiladas"""
     if df.empty:
@@ -335,10 +436,18 @@ def agregar_totales_barras(fig, df, y_column):
     return fig
 
 
-def asignar_colores_proveedores(df, color_column):
-    """Asigna colores específicos basándose en PROVIDER_COLOR_MAP"""
+def asignar_colores_proveedores(df, color_column, colores_base=None):
+    """Asigna colores específicos basándose en PROVIDER_COLOR_MAP
+    
+    Con colores_base (el mapeo calculado sobre el dataset completo) cada proveedor
+    conserva su color y su posición aunque cambien los filtros.
+    """
     # Obtener lista única de proveedores/grupos
     proveedores_unicos = df[color_column].unique()
+    if colores_base:
+        presentes = set(proveedores_unicos)
+        proveedores_unicos = [p for p in colores_base if p in presentes] + \
+                             [p for p in proveedores_unicos if p not in colores_base]
     
     # Crear mapeo de colores
     color_map = {}
@@ -346,7 +455,10 @@ def asignar_colores_proveedores(df, color_column):
     
     for i, proveedor in enumerate(proveedores_unicos):
         # Verificar si el proveedor tiene un color específico definido
-        if proveedor in PROVIDER_COLOR_MAP:
+        if colores_base and proveedor in colores_base:
+            color_map[proveedor] = colores_base[proveedor]
+            color_sequence.append(colores_base[proveedor])
+        elif proveedor in PROVIDER_COLOR_MAP:
             color_map[proveedor] = PROVIDER_COLOR_MAP[proveedor]
             color_sequence.append(PROVIDER_COLOR_MAP[proveedor])
         else:
@@ -358,127 +470,129 @@ def asignar_colores_proveedores(df, color_column):
     return color_map, color_sequence
 
 
-def filtrar_datos(df, principios, organismos, concentraciones, grupos, cenabast, opciones):
-    """Aplica todos los filtros a los datos"""
+def mascara_filtros(df, principios, organismos, concentraciones, grupos, cenabast, opciones):
+    """Máscara booleana de las filas que cumplen los filtros (sin copiar los datos)"""
     
-    df_filtrado = df.copy()
+    mascara = pd.Series(True, index=df.index)
     
     # Filtros multi-select
     if principios:
-        df_filtrado = df_filtrado[df_filtrado['principio_activo'].isin(principios)]
+        mascara &= df['principio_activo'].isin(principios)
     
     if organismos:
-        df_filtrado = df_filtrado[df_filtrado['organismo'].isin(organismos)]
+        mascara &= df['organismo'].isin(organismos)
     
     if concentraciones:
-        df_filtrado = df_filtrado[df_filtrado['concentracion'].isin(concentraciones)]
+        mascara &= df['concentracion'].isin(concentraciones)
     
     if grupos:
-        df_filtrado = df_filtrado[df_filtrado['grupo_proveedor'].isin(grupos)]
+        mascara &= df['grupo_proveedor'].isin(grupos)
     
     # Filtro CENABAST
     if cenabast == 'con':
         # "Con CENABAST" muestra todos los datos (tanto CENABAST como no CENABAST)
         pass  # No filtra nada
     elif cenabast == 'sin':
-        df_filtrado = df_filtrado[df_filtrado['es_cenabast'] == False]
+        mascara &= df['es_cenabast'] == False
     elif cenabast == 'solo':
-        df_filtrado = df_filtrado[df_filtrado['es_cenabast'] == True]
+        mascara &= df['es_cenabast'] == True
     # 'ambos' no filtra nada pero se maneja diferente en la visualización
     
     # Truncar al mes actual
     if opciones and 'truncar_mes' in opciones:
         mes_actual = datetime.now().month
         año_actual = datetime.now().year
-        df_filtrado = df_filtrado[
-            (df_filtrado['año'] <= año_actual) & 
-            ((df_filtrado['año'] < año_actual) | (df_filtrado['mes'] <= mes_actual))
-        ]
+        mascara &= (
+            (df['año'] <= año_actual) & 
+            ((df['año'] < año_actual) | (df['mes'] <= mes_actual))
+        )
+    
+    return mascara
+
+
+def filtrar_datos(df, principios, organismos, concentraciones, grupos, cenabast, opciones):
+    """Aplica todos los filtros a los datos"""
     
-    return df_filtrado
+    mascara = mascara_filtros(df, principios, organismos, concentraciones, grupos, cenabast, opciones)
+    return df[mascara].copy()
 
 
-def agregar_datos_por_vista(df, vista, cenabast_option=None):
-    """Agrega los datos según la vista temporal seleccionada con mejoras implementadas"""
+def agregar_datos_por_vista(df, vista, cenabast_option=None, top_proveedores=TOP_PROVEEDORES):
+    """Agrega los datos según la vista temporal seleccionada con mejoras implementadas
+    
+    Fuera de los top_proveedores por ventas (y de PROVEEDORES_SIEMPRE_VISIBLES) los
+    proveedores se suman en la serie "Otros"; top_proveedores=0 los deja a todos.
+    """
     
     if len(df) == 0:
-        return pd.DataFrame(columns=['periodo', 'grupo_proveedor', 'unidades', 'ventas', 'precio'])
+        return pd.DataFrame(columns=['periodo', 'grupo_proveedor', 'unidades', 'ventas', 'precio',
+                                     'precio_x_unidades', 'registros'])
     
     # Aplicar lógica mensualizada mejorada para vista mensualizada
     if vista == 'mensualizado':
         df = aplicar_logica_mensualizada_mejorada(df)
     
+    # Precio como medidas aditivas (solo las columnas que se agrupan, sin copiar el resto):
+    # el promedio ponderado se deriva después de agregar
+    df = preparar_medidas_aditivas(df[[c for c in COLUMNAS_AGREGACION if c in df.columns]])
+    
     # Para "Con y Sin" CENABAST, agregamos por estado CENABAST
+    claves = CLAVES_PERIODO[vista] + ['grupo_proveedor']
     if cenabast_option == 'ambos':
-        if vista == 'anual':
-            df_agregado = df.groupby(['año', 'grupo_proveedor', 'es_cenabast']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum', 
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['año'].astype(str)
-            
-        elif vista == 'mensual':
-            df_agregado = df.groupby(['año', 'mes', 'grupo_proveedor', 'es_cenabast']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum',
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['año'].astype(str) + '-' + df_agregado['mes'].astype(str).str.zfill(2)
-            
-        else:  # mensualizado
-            df_agregado = df.groupby(['mes_nombre', 'grupo_proveedor', 'es_cenabast']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum',
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['mes_nombre']
-            
-            # Convertir meses al español y ordenar
-            df_agregado = convertir_meses_espanol(df_agregado)
+        claves.append('es_cenabast')
+    
+    df_agregado = df.groupby(claves).agg(MEDIDAS_ADITIVAS).reset_index()
+    return completar_agregado(df_agregado, vista, cenabast_option, top_proveedores)
+
+
+def reagrupar_sin_separar_cenabast(df_agregado, vista):
+    """Tabla de la vista sin separar por CENABAST a partir de la de 'ambos'
+    
+    Las medidas son aditivas: sumar CENABAST y No CENABAST da lo mismo que agregar
+    los registros sin separar, sin volver a recorrerlos. Los proveedores ya vienen
+    agrupados en "Otros" con el mismo criterio (ventas totales por proveedor).
+    """
+    if len(df_agregado) == 0:
+        return df_agregado.copy()
+    claves = CLAVES_PERIODO[vista] + ['grupo_proveedor']
+    df_reagrupado = df_agregado.groupby(claves).agg(MEDIDAS_ADITIVAS).reset_index()
+    return completar_agregado(df_reagrupado, vista, 'con', top_proveedores=0)
+
+
+def completar_agregado(df_agregado, vista, cenabast_option=None, top_proveedores=TOP_PROVEEDORES):
+    """Período, series, precio ponderado y participación de una tabla ya agrupada"""
+    claves = CLAVES_PERIODO[vista] + ['grupo_proveedor']
+    if cenabast_option == 'ambos':
+        claves.append('es_cenabast')
+    df_agregado = agrupar_proveedores_menores(df_agregado, claves, top_proveedores)
+    
+    if vista == 'anual':
+        df_agregado['periodo'] = df_agregado['año'].astype(str)
+    elif vista == 'mensual':
+        df_agregado['periodo'] = df_agregado['año'].astype(str) + '-' + df_agregado['mes'].astype(str).str.zfill(2)
+    else:  # mensualizado
+        df_agregado['periodo'] = df_agregado['mes_nombre']
         
+        # Convertir meses al español y ordenar
+        df_agregado = convertir_meses_espanol(df_agregado)
+    
+    if cenabast_option == 'ambos':
         # Crear grupo_proveedor_cenabast para separar las series
         df_agregado['grupo_proveedor_cenabast'] = df_agregado['grupo_proveedor'] + ' - ' + df_agregado['es_cenabast'].map({True: 'CENABAST', False: 'No CENABAST'})
-        
     else:
-        # Agregación normal sin separar por CENABAST
-        if vista == 'anual':
-            df_agregado = df.groupby(['año', 'grupo_proveedor']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum', 
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['año'].astype(str)
-            
-        elif vista == 'mensual':
-            df_agregado = df.groupby(['año', 'mes', 'grupo_proveedor']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum',
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['año'].astype(str) + '-' + df_agregado['mes'].astype(str).str.zfill(2)
-            
-        else:  # mensualizado
-            df_agregado = df.groupby(['mes_nombre', 'grupo_proveedor']).agg({
-                'unidades': 'sum',
-                'ventas': 'sum',
-                'precio': 'mean'
-            }).reset_index()
-            df_agregado['periodo'] = df_agregado['mes_nombre']
-            
-            # Convertir meses al español y ordenar
-            df_agregado = convertir_meses_espanol(df_agregado)
-        
         # Para coherencia, crear la columna grupo_proveedor_cenabast igual a grupo_proveedor
         df_agregado['grupo_proveedor_cenabast'] = df_agregado['grupo_proveedor']
     
+    # Precio promedio ponderado por unidades (exacto en cualquier nivel de agregación)
+    df_agregado['precio'] = precio_ponderado(df_agregado)
+    
     # Calcular participación de mercado
     df_agregado = calcular_participacion_mercado(df_agregado, 'grupo_proveedor')
     
     return df_agregado
 
 
-def crear_grafico_unidades(df, vista, cenabast=None):
+def crear_grafico_unidades(df, vista, cenabast=None, colores=None):
     """Crea el gráfico de unidades por grupo proveedor con mejoras"""
     
     if len(df) == 0:
@@ -491,14 +605,11 @@ def crear_grafico_unidades(df, vista, cenabast=None):
     color_column = 'grupo_proveedor_cenabast' if cenabast == 'ambos' else 'grupo_proveedor'
     
     # Asignar colores específicos para proveedores
-    color_map, color_sequence = asignar_colores_proveedores(df, color_column)
+    color_map, color_sequence = asignar_colores_proveedores(df, color_column, colores)
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: {cenabast or 'N/A'}"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', color_column, 'unidades'])
     
     fig = px.bar(
         df_con_tooltips,
@@ -508,8 +619,10 @@ def crear_grafico_unidades(df, vista, cenabast=None):
         title=f"Unidades por Grupo Proveedor - Vista {vista.title()}",
         labels={'unidades': 'Unidades', 'periodo': 'Período'},
         color_discrete_map=color_map,
+        category_orders={color_column: list(color_map)},
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     # Agregar totales sobre las barras
     fig = agregar_totales_barras(fig, df, 'unidades')
@@ -524,7 +637,7 @@ def crear_grafico_unidades(df, vista, cenabast=None):
     return fig
 
 
-def crear_grafico_ventas(df, vista, cenabast=None):
+def crear_grafico_ventas(df, vista, cenabast=None, colores=None):
     """Crea el gráfico de ventas por grupo proveedor con mejoras"""
     
     if len(df) == 0:
@@ -537,14 +650,11 @@ def crear_grafico_ventas(df, vista, cenabast=None):
     color_column = 'grupo_proveedor_cenabast' if cenabast == 'ambos' else 'grupo_proveedor'
     
     # Asignar colores específicos para proveedores
-    color_map, color_sequence = asignar_colores_proveedores(df, color_column)
+    color_map, color_sequence = asignar_colores_proveedores(df, color_column, colores)
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: {cenabast or 'N/A'}"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', color_column, 'ventas'])
     
     fig = px.bar(
         df_con_tooltips,
@@ -554,8 +664,10 @@ def crear_grafico_ventas(df, vista, cenabast=None):
         title=f"Ventas por Grupo Proveedor - Vista {vista.title()}",
         labels={'ventas': 'Ventas ($)', 'periodo': 'Período'},
         color_discrete_map=color_map,
+        category_orders={color_column: list(color_map)},
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     # Agregar totales sobre las barras
     fig = agregar_totales_barras(fig, df, 'ventas')
@@ -571,7 +683,7 @@ def crear_grafico_ventas(df, vista, cenabast=None):
     return fig
 
 
-def crear_grafico_precio(df, vista, cenabast=None):
+def crear_grafico_precio(df, vista, cenabast=None, colores=None):
     """Crea el gráfico de tendencia de precio promedio con mejoras"""
     
     if len(df) == 0:
@@ -584,14 +696,11 @@ def crear_grafico_precio(df, vista, cenabast=None):
     color_column = 'grupo_proveedor_cenabast' if cenabast == 'ambos' else 'grupo_proveedor'
     
     # Asignar colores específicos para proveedores
-    color_map, color_sequence = asignar_colores_proveedores(df, color_column)
+    color_map, color_sequence = asignar_colores_proveedores(df, color_column, colores)
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: {cenabast or 'N/A'}"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', color_column, 'precio'])
     
     fig = px.line(
         df_con_tooltips,
@@ -601,9 +710,11 @@ def crear_grafico_precio(df, vista, cenabast=None):
         title=f"Tendencia Precio Promedio - Vista {vista.title()}",
         labels={'precio': 'Precio Promedio ($)', 'periodo': 'Período'},
         color_discrete_map=color_map,
+        category_orders={color_column: list(color_map)},
         markers=True,
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     fig.update_layout(
         height=400,
@@ -616,7 +727,15 @@ def crear_grafico_precio(df, vista, cenabast=None):
     return fig
 
 
-def crear_grafico_unidades_cenabast(df, vista):
+def _colores_cenabast(df, colores):
+    """Argumentos de color para los gráficos CENABAST (estables si hay mapeo global)"""
+    if not colores:
+        return {'color_discrete_sequence': COLORS}
+    color_map, _ = asignar_colores_proveedores(df, 'grupo_proveedor', colores)
+    return {'color_discrete_map': color_map, 'category_orders': {'grupo_proveedor': list(color_map)}}
+
+
+def crear_grafico_unidades_cenabast(df, vista, colores=None):
     """Crea el gráfico de unidades por grupo proveedor (solo CENABAST) con mejoras"""
     
     if len(df) == 0:
@@ -626,11 +745,8 @@ def crear_grafico_unidades_cenabast(df, vista):
         return fig
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: Solo CENABAST"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', 'grupo_proveedor', 'unidades'])
     
     fig = px.bar(
         df_con_tooltips,
@@ -639,9 +755,10 @@ def crear_grafico_unidades_cenabast(df, vista):
         color='grupo_proveedor',
         title=f"Unidades por CENABAST - Vista {vista.title()}",
         labels={'unidades': 'Unidades', 'periodo': 'Período'},
-        color_discrete_sequence=COLORS,
+        **_colores_cenabast(df, colores),
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     # Agregar totales sobre las barras
     fig = agregar_totales_barras(fig, df, 'unidades')
@@ -657,7 +774,7 @@ def crear_grafico_unidades_cenabast(df, vista):
     return fig
 
 
-def crear_grafico_ventas_cenabast(df, vista):
+def crear_grafico_ventas_cenabast(df, vista, colores=None):
     """Crea el gráfico de ventas por grupo proveedor (solo CENABAST) con mejoras"""
     
     if len(df) == 0:
@@ -667,11 +784,8 @@ def crear_grafico_ventas_cenabast(df, vista):
         return fig
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: Solo CENABAST"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', 'grupo_proveedor', 'ventas'])
     
     fig = px.bar(
         df_con_tooltips,
@@ -680,9 +794,10 @@ def crear_grafico_ventas_cenabast(df, vista):
         color='grupo_proveedor',
         title=f"Ventas por CENABAST - Vista {vista.title()}",
         labels={'ventas': 'Ventas ($)', 'periodo': 'Período'},
-        color_discrete_sequence=COLORS,
+        **_colores_cenabast(df, colores),
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     # Agregar totales sobre las barras
     fig = agregar_totales_barras(fig, df, 'ventas')
@@ -698,7 +813,7 @@ def crear_grafico_ventas_cenabast(df, vista):
     return fig
 
 
-def crear_grafico_precio_cenabast(df, vista):
+def crear_grafico_precio_cenabast(df, vista, colores=None):
     """Crea el gráfico de tendencia de precio promedio (solo CENABAST) con mejoras"""
     
     if len(df) == 0:
@@ -708,11 +823,8 @@ def crear_grafico_precio_cenabast(df, vista):
         return fig
     
     # Crear tooltips personalizados
-    df_con_tooltips = df.copy()
     filtros_aplicados = f"Vista: {vista}, CENABAST: Solo CENABAST"
-    df_con_tooltips['tooltip_personalizado'] = df_con_tooltips.apply(
-        lambda row: crear_tooltip_personalizado(row, vista, filtros_aplicados), axis=1
-    )
+    df_con_tooltips = preparar_datos_grafico(df, vista, ['periodo', 'grupo_proveedor', 'precio'])
     
     fig = px.line(
         df_con_tooltips,
@@ -721,10 +833,11 @@ def crear_grafico_precio_cenabast(df, vista):
         color='grupo_proveedor',
         title=f"Tendencia Precio Promedio por CENABAST - Vista {vista.title()}",
         labels={'precio': 'Precio Promedio ($)', 'periodo': 'Período'},
-        color_discrete_sequence=COLORS,
+        **_colores_cenabast(df, colores),
         markers=True,
         hover_data={'tooltip_personalizado': True}
     )
+    agregar_filtros_hover(fig, filtros_aplicados)
     
     fig.update_layout(
         height=400,